@@ -9,6 +9,11 @@ from pathlib import Path
 from loguru import logger
 from dotenv import load_dotenv
 
+try:
+    import uvloop
+except ImportError:  # uvloop is not available on Windows
+    uvloop = None
+
 # Add src to path
 sys.path.insert(0, str(Path(__file__).parent / "src"))
 
@@ -16,6 +21,10 @@ from src.bot import MedusaXDBot
 from src.config import settings, BOT_NAME, BOT_VERSION
 
 
+# Environment variables that must be set (directly or through .env)
+_REQUIRED_ENV_VARS = ("TELEGRAM_BOT_TOKEN", "BFL_API_KEY", "MONGODB_URL")
+
+
 def setup_logging():
     """Setup logging configuration"""
     
@@ -27,7 +36,8 @@ def setup_logging():
         sys.stdout,
         level=settings.log_level,
         format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
-        colorize=True
+        colorize=True,
+        enqueue=not sys.stdout.isatty()  # Piped/containerized stdout can block the event loop
     )
     
     # Add file logger
@@ -36,11 +46,12 @@ def setup_logging():
     
     logger.add(
         log_dir / "medusaxd_bot.log",
-        level="INFO",
+        level=settings.file_log_level,
         format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}",
         rotation="10 MB",
         retention="7 days",
-        compression="zip"
+        compression="zip",
+        enqueue=True  # Write from a background thread so file I/O never blocks the event loop
     )
     
     # Add error file logger
@@ -50,23 +61,15 @@ def setup_logging():
         format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}",
         rotation="5 MB",
         retention="30 days",
-        compression="zip"
+        compression="zip",
+        enqueue=True
     )
 
 
 def validate_environment():
     """Validate required environment variables"""
     
-    required_vars = [
-        "TELEGRAM_BOT_TOKEN",
-        "BFL_API_KEY", 
-        "MONGODB_URL"
-    ]
-    
-    missing_vars = []
-    for var in required_vars:
-        if not getattr(settings, var.lower(), None):
-            missing_vars.append(var)
+    missing_vars = [var for var in _REQUIRED_ENV_VARS if not os.environ.get(var)]
     
     if missing_vars:
         logger.error(f"Missing required environment variables: {', '.join(missing_vars)}")
@@ -108,9 +111,16 @@ async def main():
     finally:
         await bot.stop()
         logger.info("Bot shutdown complete")
+        
+        # Flush queued log messages
+        await logger.complete()
 
 
 if __name__ == "__main__":
+    # Use the libuv-based event loop when available
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
@@ -2,12 +2,22 @@
 Telegram bot components for MedusaXD AI Image Editor Bot
 """
 
-from .handlers import setup_handlers
-from .middleware import setup_middleware
-from .bot import MedusaXDBot
-
 __all__ = [
     "setup_handlers",
     "setup_middleware", 
     "MedusaXDBot"
 ]
+
+
+def __getattr__(name):
+    """Import bot components lazily on first access (PEP 562)"""
+    if name == "MedusaXDBot":
+        from .bot import MedusaXDBot
+        return MedusaXDBot
+    if name == "setup_handlers":
+        from .handlers import setup_handlers
+        return setup_handlers
+    if name == "setup_middleware":
+        from .middleware import setup_middleware
+        return setup_middleware
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
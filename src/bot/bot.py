@@ -3,21 +3,28 @@ Main bot class for MedusaXD AI Image Editor Bot
 """
 
 import asyncio
+import signal
+from typing import Optional
 from telegram.ext import Application
 from loguru import logger
 
 from ..config import settings, BOT_NAME
 from ..database import db
+from ..services import get_shared_session, close_shared_session
 from .handlers import setup_handlers
 from .middleware import setup_middleware
 
 
+STOP_SIGNALS = (signal.SIGINT, signal.SIGTERM, signal.SIGABRT)
+
+
 class MedusaXDBot:
     """Main bot class"""
     
     def __init__(self):
         self.application: Application = None
         self.is_running = False
+        self._stop_event: Optional[asyncio.Event] = None
     
     async def initialize(self):
         """Initialize the bot"""
@@ -28,9 +35,17 @@ class MedusaXDBot:
             await db.connect()
             logger.info("Database connected successfully")
             
+            # Open the shared BFL.ai session up front so the first edit
+            # doesn't pay for its setup
+            await get_shared_session()
+            
             # Create application
             self.application = Application.builder().token(settings.telegram_bot_token).build()
             
+            # Run update handlers eagerly until their first real suspension (Python 3.12+)
+            if hasattr(asyncio, "eager_task_factory"):
+                asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
+            
             # Setup middleware
             middleware = await setup_middleware(self.application)
             logger.info("Middleware setup completed")
@@ -59,6 +74,7 @@ class MedusaXDBot:
             # Start polling
             await self.application.start()
             
+            self._stop_event = asyncio.Event()
             self.is_running = True
             logger.info(f"{BOT_NAME} started successfully and is polling for updates")
             
@@ -68,9 +84,9 @@ class MedusaXDBot:
                 drop_pending_updates=True
             )
             
-            # Keep the bot running
-            while self.is_running:
-                await asyncio.sleep(1)
+            # Keep the bot running until stop() is called or a stop signal arrives
+            self._add_stop_signal_handlers()
+            await self._stop_event.wait()
                 
         except Exception as e:
             logger.error(f"Error starting bot: {e}")
@@ -78,12 +94,24 @@ class MedusaXDBot:
         finally:
             await self.stop()
     
+    def _add_stop_signal_handlers(self):
+        """Set the stop event on SIGINT/SIGTERM/SIGABRT"""
+        loop = asyncio.get_running_loop()
+        for sig in STOP_SIGNALS:
+            try:
+                loop.add_signal_handler(sig, self._stop_event.set)
+            except (NotImplementedError, RuntimeError):
+                # Signal handlers are unavailable on Windows and outside the main thread
+                pass
+    
     async def stop(self):
         """Stop the bot"""
         try:
             logger.info(f"Stopping {BOT_NAME}...")
             
             self.is_running = False
+            if self._stop_event:
+                self._stop_event.set()
             
             if self.application:
                 # Stop polling
@@ -96,6 +124,9 @@ class MedusaXDBot:
                 # Shutdown application
                 await self.application.shutdown()
             
+            # Close the shared BFL.ai session
+            await close_shared_session()
+            
             # Disconnect from database
             await db.disconnect()
             
@@ -107,8 +138,9 @@ class MedusaXDBot:
     async def restart(self):
         """Restart the bot"""
         logger.info(f"Restarting {BOT_NAME}...")
+        # stop() awaits the updater, application and database shutdown,
+        # so everything is quiesced by the time it returns
         await self.stop()
-        await asyncio.sleep(2)
         await self.start()
     
     def get_bot_info(self):
@@ -2,37 +2,105 @@
 Admin handlers for the Telegram bot
 """
 
+import time
+from functools import wraps
+from typing import Optional, Tuple, Dict, Any
 from telegram import Update
 from telegram.ext import ContextTypes, CommandHandler
 from loguru import logger
 
 from ...services import UserService
+from ...models import User
 from ...database import db
 from ..middleware import UserMiddleware, LoggingMiddleware
 
 
-async def admin_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /admin_stats command (admin only)"""
-    try:
-        if not await UserMiddleware.process_user(update, context):
-            return
-        
-        user = context.user_data.get("db_user")
-        
-        # Check if user is admin
-        if not await UserService.is_user_admin(user.telegram_user_id):
-            await update.message.reply_text("❌ Access denied. Admin only command.")
+# Bot analytics shown on /admin_stats are cached briefly to absorb repeated refreshes
+_ANALYTICS_TTL = 30.0
+_analytics_cache: Optional[Tuple[float, Dict[str, Any]]] = None
+
+_ADMIN_HELP_MESSAGE = """
+🔧 **Admin Commands Help**
+
+**Analytics & Monitoring:**
+• `/admin_stats` - View bot analytics and statistics
+
+**User Management:**
+• `/ban <user_id>` - Ban a user from using the bot
+• `/unban <user_id>` - Unban a previously banned user
+
+**Communication:**
+• `/broadcast <message>` - Send message to all users (placeholder)
+
+**General:**
+• `/admin_help` - Show this help message
+
+**Notes:**
+• All admin commands are logged
+• User IDs can be found in bot logs
+• Use admin commands responsibly
+"""
+
+
+def admin_only(handler):
+    """Run the user middleware and admin check before an admin handler"""
+    
+    @wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        try:
+            user = await UserMiddleware.process_user(update, context)
+            if not user:
+                return
+            
+            # Check if user is admin
+            if not UserService.is_user_admin(user.telegram_user_id):
+                await update.message.reply_text("❌ Access denied. Admin only command.")
+                return
+            
+            await LoggingMiddleware.log_interaction(update, context)
+            
+        except Exception as e:
+            logger.error(f"Error checking admin access for {handler.__name__}: {e}")
+            await update.message.reply_text("⚠️ Error processing admin command.")
             return
         
-        await LoggingMiddleware.log_interaction(update, context)
-        
+        return await handler(update, context, user)
+    
+    return wrapper
+
+
+async def _get_cached_bot_analytics() -> Dict[str, Any]:
+    """Get bot analytics, reusing the last result for up to _ANALYTICS_TTL seconds"""
+    global _analytics_cache
+    
+    now = time.monotonic()
+    if _analytics_cache and now - _analytics_cache[0] < _ANALYTICS_TTL:
+        return _analytics_cache[1]
+    
+    analytics = await UserService.get_bot_analytics()
+    if "error" not in analytics:
+        _analytics_cache = (now, analytics)
+    
+    return analytics
+
+
+@admin_only
+async def admin_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE, user: User):
+    """Handle /admin_stats command (admin only)"""
+    try:
         # Get bot analytics
-        analytics = await UserService.get_bot_analytics()
+        analytics = await _get_cached_bot_analytics()
         
         if "error" in analytics:
             await update.message.reply_text("⚠️ Error retrieving analytics.")
             return
         
+        # Format top edit types
+        top_edit_types_text = "\n".join(
+            f"• {edit_type.replace('_', ' ').title()}: {count:,}"
+            for edit_type, count in analytics['top_edit_types']
+        )
+        
         # Format analytics message
         stats_message = f"""
 🔧 **Admin Dashboard - Bot Analytics**
@@ -44,12 +112,9 @@ async def admin_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE
 • Avg Processing Time: {analytics['average_processing_time']}s
 
 **Top Edit Types:**
-"""
-        
-        for edit_type, count in analytics['top_edit_types']:
-            stats_message += f"• {edit_type.replace('_', ' ').title()}: {count:,}\n"
-        
-        stats_message += f"\n**Last Updated:** {analytics['last_updated'].strftime('%Y-%m-%d %H:%M UTC')}"
+{top_edit_types_text}
+
+**Last Updated:** {analytics['last_updated'].strftime('%Y-%m-%d %H:%M UTC')}"""
         
         await update.message.reply_text(
             stats_message,
@@ -61,21 +126,10 @@ async def admin_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         await update.message.reply_text("⚠️ Error retrieving admin statistics.")
 
 
-async def ban_user_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@admin_only
+async def ban_user_command(update: Update, context: ContextTypes.DEFAULT_TYPE, user: User):
     """Handle /ban command (admin only)"""
     try:
-        if not await UserMiddleware.process_user(update, context):
-            return
-        
-        user = context.user_data.get("db_user")
-        
-        # Check if user is admin
-        if not await UserService.is_user_admin(user.telegram_user_id):
-            await update.message.reply_text("❌ Access denied. Admin only command.")
-            return
-        
-        await LoggingMiddleware.log_interaction(update, context)
-        
         # Get user ID to ban from command arguments
         if not context.args or len(context.args) != 1:
             await update.message.reply_text(
@@ -93,6 +147,7 @@ async def ban_user_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         # Ban user
         success = await UserService.ban_user(target_user_id, user.telegram_user_id)
+        UserMiddleware.invalidate_user(target_user_id)
         
         if success:
             await update.message.reply_text(
@@ -112,21 +167,10 @@ async def ban_user_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⚠️ Error processing ban command.")
 
 
-async def unban_user_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@admin_only
+async def unban_user_command(update: Update, context: ContextTypes.DEFAULT_TYPE, user: User):
     """Handle /unban command (admin only)"""
     try:
-        if not await UserMiddleware.process_user(update, context):
-            return
-        
-        user = context.user_data.get("db_user")
-        
-        # Check if user is admin
-        if not await UserService.is_user_admin(user.telegram_user_id):
-            await update.message.reply_text("❌ Access denied. Admin only command.")
-            return
-        
-        await LoggingMiddleware.log_interaction(update, context)
-        
         # Get user ID to unban from command arguments
         if not context.args or len(context.args) != 1:
             await update.message.reply_text(
@@ -144,6 +188,7 @@ async def unban_user_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         
         # Unban user
         success = await UserService.unban_user(target_user_id, user.telegram_user_id)
+        UserMiddleware.invalidate_user(target_user_id)
         
         if success:
             await update.message.reply_text(
@@ -163,21 +208,10 @@ async def unban_user_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.message.reply_text("⚠️ Error processing unban command.")
 
 
-async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@admin_only
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE, user: User):
     """Handle /broadcast command (admin only)"""
     try:
-        if not await UserMiddleware.process_user(update, context):
-            return
-        
-        user = context.user_data.get("db_user")
-        
-        # Check if user is admin
-        if not await UserService.is_user_admin(user.telegram_user_id):
-            await update.message.reply_text("❌ Access denied. Admin only command.")
-            return
-        
-        await LoggingMiddleware.log_interaction(update, context)
-        
         # Get broadcast message from command arguments
         if not context.args:
             await update.message.reply_text(
@@ -202,45 +236,12 @@ async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⚠️ Error processing broadcast command.")
 
 
-async def admin_help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@admin_only
+async def admin_help_command(update: Update, context: ContextTypes.DEFAULT_TYPE, user: User):
     """Handle /admin_help command (admin only)"""
     try:
-        if not await UserMiddleware.process_user(update, context):
-            return
-        
-        user = context.user_data.get("db_user")
-        
-        # Check if user is admin
-        if not await UserService.is_user_admin(user.telegram_user_id):
-            await update.message.reply_text("❌ Access denied. Admin only command.")
-            return
-        
-        await LoggingMiddleware.log_interaction(update, context)
-        
-        help_message = """
-🔧 **Admin Commands Help**
-
-**Analytics & Monitoring:**
-• `/admin_stats` - View bot analytics and statistics
-
-**User Management:**
-• `/ban <user_id>` - Ban a user from using the bot
-• `/unban <user_id>` - Unban a previously banned user
-
-**Communication:**
-• `/broadcast <message>` - Send message to all users (placeholder)
-
-**General:**
-• `/admin_help` - Show this help message
-
-**Notes:**
-• All admin commands are logged
-• User IDs can be found in bot logs
-• Use admin commands responsibly
-        """
-        
         await update.message.reply_text(
-            help_message,
+            _ADMIN_HELP_MESSAGE,
             parse_mode="Markdown"
         )
         
@@ -253,11 +254,13 @@ async def setup_admin_handlers(application, middleware):
     """Setup admin command handlers"""
     
     # Add admin command handlers
-    application.add_handler(CommandHandler("admin_stats", admin_stats_command))
-    application.add_handler(CommandHandler("ban", ban_user_command))
-    application.add_handler(CommandHandler("unban", unban_user_command))
-    application.add_handler(CommandHandler("broadcast", broadcast_command))
-    application.add_handler(CommandHandler("admin_help", admin_help_command))
+    application.add_handlers([
+        CommandHandler("admin_stats", admin_stats_command),
+        CommandHandler("ban", ban_user_command),
+        CommandHandler("unban", unban_user_command),
+        CommandHandler("broadcast", broadcast_command),
+        CommandHandler("admin_help", admin_help_command)
+    ])
     
     logger.info("Admin handlers setup completed")
     return True
@@ -3,34 +3,54 @@ Command handlers for the Telegram bot
 """
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ContextTypes, CommandHandler
+from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler
 from loguru import logger
 
 from ...config import MESSAGES, BOT_NAME, BOT_VERSION
 from ...services import UserService
 from ..middleware import UserMiddleware, LoggingMiddleware
+from .messages import PENDING_IMAGES
+
+
+# Inline keyboards are immutable, so build them once and share them across updates
+_START_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📖 Help", callback_data="help")],
+    [InlineKeyboardButton("📊 My Stats", callback_data="stats")],
+    [InlineKeyboardButton("ℹ️ About", callback_data="about")]
+])
+
+_HELP_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🎨 Try Example", callback_data="example")],
+    [InlineKeyboardButton("📊 My Stats", callback_data="stats")],
+    [InlineKeyboardButton("🔙 Back to Start", callback_data="start")]
+])
+
+_STATS_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔄 Refresh", callback_data="stats")],
+    [InlineKeyboardButton("🔙 Back", callback_data="start")]
+])
+
+_ABOUT_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🌐 Visit Website", url="https://bfl.ai")],
+    [InlineKeyboardButton("📖 Help", callback_data="help")],
+    [InlineKeyboardButton("🔙 Back", callback_data="start")]
+])
+
+_STATUS_EMOJIS = {"completed": "✅", "failed": "❌"}
 
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command"""
     try:
         # Process user through middleware
-        if not await UserMiddleware.process_user(update, context):
+        user = await UserMiddleware.process_user(update, context)
+        if not user:
             return
         
         await LoggingMiddleware.log_interaction(update, context)
         
-        user = context.user_data.get("db_user")
         is_new_user = context.user_data.get("is_new_user", False)
         
-        # Create welcome keyboard
-        keyboard = [
-            [InlineKeyboardButton("📖 Help", callback_data="help")],
-            [InlineKeyboardButton("📊 My Stats", callback_data="stats")],
-            [InlineKeyboardButton("ℹ️ About", callback_data="about")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
         welcome_message = MESSAGES["welcome"]
         if is_new_user:
             welcome_message += "\n\n🎉 **Welcome to the community!** You're now ready to start editing images with AI."
@@ -38,10 +58,10 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(
             welcome_message,
             parse_mode="Markdown",
-            reply_markup=reply_markup
+            reply_markup=_START_KEYBOARD
         )
         
-        logger.info(f"Start command processed for user {user.telegram_user_id}")
+        logger.debug("Start command processed for user {}", user.telegram_user_id)
         
     except Exception as e:
         logger.error(f"Error in start command: {e}")
@@ -58,18 +78,10 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         await LoggingMiddleware.log_interaction(update, context)
         
-        # Create help keyboard
-        keyboard = [
-            [InlineKeyboardButton("🎨 Try Example", callback_data="example")],
-            [InlineKeyboardButton("📊 My Stats", callback_data="stats")],
-            [InlineKeyboardButton("🔙 Back to Start", callback_data="start")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
         await update.message.reply_text(
             MESSAGES["help"],
             parse_mode="Markdown",
-            reply_markup=reply_markup
+            reply_markup=_HELP_KEYBOARD
         )
         
     except Exception as e:
@@ -80,18 +92,30 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /stats command"""
     try:
-        if not await UserMiddleware.process_user(update, context):
+        user = await UserMiddleware.process_user(update, context)
+        if not user:
             return
         
         await LoggingMiddleware.log_interaction(update, context)
         
-        user = context.user_data.get("db_user")
         user_stats = await UserService.get_user_statistics(user.telegram_user_id)
         
         if "error" in user_stats:
             await update.message.reply_text("⚠️ Unable to retrieve your statistics.")
             return
         
+        # Format favorite edit types
+        favorite_types = user_stats.get('favorite_edit_types', {})
+        if favorite_types:
+            sorted_types = sorted(favorite_types.items(), key=lambda x: x[1], reverse=True)
+            favorite_lines = [
+                f"• {edit_type.replace('_', ' ').title()}: {count}"
+                for edit_type, count in sorted_types[:3]
+            ]
+        else:
+            favorite_lines = ["• No edits yet"]
+        favorite_types_text = "\n".join(favorite_lines)
+        
         # Format statistics message
         stats_message = f"""
 📊 **Your {BOT_NAME} Statistics**
@@ -106,18 +130,8 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • Recent Edits: {user_stats['recent_edits_this_month']}
 
 **Favorite Edit Types:**
-"""
-        
-        # Add favorite edit types
-        favorite_types = user_stats.get('favorite_edit_types', {})
-        if favorite_types:
-            sorted_types = sorted(favorite_types.items(), key=lambda x: x[1], reverse=True)
-            for edit_type, count in sorted_types[:3]:
-                stats_message += f"• {edit_type.replace('_', ' ').title()}: {count}\n"
-        else:
-            stats_message += "• No edits yet\n"
-        
-        stats_message += f"""
+{favorite_types_text}
+
 **Account Info:**
 • Member Since: {user_stats['member_since'].strftime('%B %Y') if user_stats['member_since'] else 'Unknown'}
 • Last Active: {user_stats['last_seen'].strftime('%Y-%m-%d') if user_stats['last_seen'] else 'Unknown'}
@@ -126,21 +140,16 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Add recent edits if available
         recent_edits = user_stats.get('recent_edits', [])
         if recent_edits:
-            stats_message += "\n**Recent Edits:**\n"
-            for edit in recent_edits[:3]:
-                status_emoji = "✅" if edit['status'] == 'completed' else "❌" if edit['status'] == 'failed' else "⏳"
-                stats_message += f"• {status_emoji} {edit['prompt']}\n"
-        
-        keyboard = [
-            [InlineKeyboardButton("🔄 Refresh", callback_data="stats")],
-            [InlineKeyboardButton("🔙 Back", callback_data="start")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+            recent_lines = [
+                f"• {_STATUS_EMOJIS.get(edit['status'], '⏳')} {edit['prompt']}"
+                for edit in recent_edits[:3]
+            ]
+            stats_message = "".join([stats_message, "\n**Recent Edits:**\n", "\n".join(recent_lines), "\n"])
         
         await update.message.reply_text(
             stats_message,
             parse_mode="Markdown",
-            reply_markup=reply_markup
+            reply_markup=_STATS_KEYBOARD
         )
         
     except Exception as e:
@@ -156,17 +165,10 @@ async def about_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         await LoggingMiddleware.log_interaction(update, context)
         
-        keyboard = [
-            [InlineKeyboardButton("🌐 Visit Website", url="https://bfl.ai")],
-            [InlineKeyboardButton("📖 Help", callback_data="help")],
-            [InlineKeyboardButton("🔙 Back", callback_data="start")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
         await update.message.reply_text(
             MESSAGES["about"],
             parse_mode="Markdown",
-            reply_markup=reply_markup
+            reply_markup=_ABOUT_KEYBOARD
         )
         
     except Exception as e:
@@ -177,12 +179,14 @@ async def about_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /cancel command"""
     try:
-        if not await UserMiddleware.process_user(update, context):
+        user = await UserMiddleware.process_user(update, context)
+        if not user:
             return
         
         await LoggingMiddleware.log_interaction(update, context)
         
-        # Clear user context
+        # Clear user context and any pending upload
+        PENDING_IMAGES.discard(user.telegram_user_id)
         context.user_data.clear()
         
         await update.message.reply_text(
@@ -242,16 +246,15 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def setup_command_handlers(application, middleware):
     """Setup command handlers"""
     
-    # Add command handlers
-    application.add_handler(CommandHandler("start", start_command))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("stats", stats_command))
-    application.add_handler(CommandHandler("about", about_command))
-    application.add_handler(CommandHandler("cancel", cancel_command))
-    
-    # Add callback query handler for inline keyboards
-    from telegram.ext import CallbackQueryHandler
-    application.add_handler(CallbackQueryHandler(button_callback))
+    # Add command handlers and the callback query handler for inline keyboards
+    application.add_handlers([
+        CommandHandler("start", start_command),
+        CommandHandler("help", help_command),
+        CommandHandler("stats", stats_command),
+        CommandHandler("about", about_command),
+        CommandHandler("cancel", cancel_command),
+        CallbackQueryHandler(button_callback)
+    ])
     
     logger.info("Command handlers setup completed")
     return True
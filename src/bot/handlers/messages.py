@@ -3,76 +3,262 @@ Message handlers for the Telegram bot
 """
 
 import asyncio
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from typing import List, Optional, Set, Union
+from cachetools import TTLCache
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, File
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes, MessageHandler, filters
 from loguru import logger
 
-from ...services import BFLAPIService, ImageProcessor, UserService
+from ...config import settings, MAX_IMAGE_PIXELS
+from ...services import BFLAPIService, ImageProcessor, UserService, get_shared_service
 from ...models import ImageEdit, EditStatus
 from ...database import db
 from ..middleware import UserMiddleware, LoggingMiddleware
 
 
+# Update filters, built once and shared by the handlers below
+PHOTO_FILTER = filters.PHOTO & ~filters.COMMAND
+TEXT_FILTER = filters.TEXT & ~filters.COMMAND
+DOC_IMG_FILTER = filters.Document.IMAGE & ~filters.COMMAND
+
+_PROMPT_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🎨 Color Change", callback_data="prompt_color")],
+    [InlineKeyboardButton("📝 Text Edit", callback_data="prompt_text")],
+    [InlineKeyboardButton("🖼️ Background", callback_data="prompt_background")],
+    [InlineKeyboardButton("✏️ Custom Prompt", callback_data="prompt_custom")]
+])
+
+_RESULT_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔄 Edit Again", callback_data="edit_again")],
+    [InlineKeyboardButton("📊 My Stats", callback_data="stats")],
+    [InlineKeyboardButton("ℹ️ About", callback_data="about")]
+])
+
+_PHOTO_RECEIVED_TEMPLATE = (
+    "📸 **Image Received!**\n\n"
+    "**Image Info:**\n"
+    "• Format: {format}\n"
+    "• Size: {width}×{height}\n"
+    "• File Size: {file_size_mb:.1f}MB\n\n"
+    "Now tell me what you'd like to edit! You can:\n"
+    "• Use the quick options below\n"
+    "• Type your own custom prompt\n\n"
+    "**Example prompts:**\n"
+    "• 'Change the car color to red'\n"
+    "• 'Replace \"Hello\" with \"Welcome\"'\n"
+    "• 'Add a sunset background'"
+)
+
+_FILE_TOO_LARGE_TEMPLATE = (
+    "❌ **File Too Large**\n\n"
+    "Please send an image smaller than {max_size_mb}MB."
+)
+
+_IMAGE_TOO_LARGE_TEMPLATE = (
+    "❌ **Image Too Large**\n\n"
+    "Your image is {width}×{height} ({megapixels:.1f} MP), "
+    "but I can only edit images up to {max_megapixels:.0f} MP.\n\n"
+    "Please resize it and send it again."
+)
+
+_INVALID_IMAGE_TEMPLATE = "❌ **Invalid Image**\n\n{error}"
+
+_PROCESSING_TEMPLATE = (
+    "🎨 **Processing your edit...**\n\n"
+    "**Prompt:** {prompt}\n"
+    "**Edit Type:** {edit_type}\n\n"
+    "⏳ This usually takes 30-60 seconds. Please wait..."
+)
+
+_EDIT_COMPLETE_TEMPLATE = (
+    "✅ **Edit Complete!**\n\n"
+    "**Prompt:** {prompt}\n"
+    "**Processing Time:** {processing_time:.1f}s\n"
+    "**Edit Type:** {edit_type}\n\n"
+    "Send another image to continue editing!"
+)
+
+_EDIT_FAILED_TEMPLATE = (
+    "❌ **Edit Failed**\n\n"
+    "**Error:** {error}\n\n"
+    "Please try again with a different prompt or image."
+)
+
+
+def _format_edit_type(edit_type: str) -> str:
+    """Human-readable edit type, e.g. color_change -> Color Change"""
+    return edit_type.replace('_', ' ').title()
+
+
+class PendingImageCache:
+    """
+    Bounded store for uploaded images waiting for an edit prompt
+    
+    Keeps the image bytes out of context.user_data so memory is capped at
+    max_bytes of images no matter how many users leave an upload unanswered;
+    the oldest uploads are evicted first, and entries expire after ttl seconds.
+    """
+    
+    def __init__(self, max_bytes: int, ttl: float = 600):
+        self._images: TTLCache = TTLCache(maxsize=max_bytes, ttl=ttl, getsizeof=len)
+    
+    def put(self, telegram_user_id: int, image_bytes: bytes) -> None:
+        self._images[telegram_user_id] = image_bytes
+    
+    def get(self, telegram_user_id: int) -> Optional[bytes]:
+        return self._images.get(telegram_user_id)
+    
+    def discard(self, telegram_user_id: int) -> None:
+        self._images.pop(telegram_user_id, None)
+
+
+PENDING_IMAGES = PendingImageCache(max_bytes=settings.pending_images_max_mb * 1024 * 1024)
+
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def _run_in_background(coro) -> None:
+    """Schedule a fire-and-forget coroutine, keeping a reference until it finishes"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _delete_message_quietly(message) -> None:
+    """Delete a message, ignoring failures (e.g. it was already deleted)"""
+    try:
+        await message.delete()
+    except Exception:
+        pass
+
+
+async def _reject_oversized_file(update: Update, file_size: Optional[int]) -> bool:
+    """
+    Reply with an error if Telegram reports a file over the size limit
+    
+    Returns:
+        True if the file was rejected
+    """
+    if file_size is None or BFLAPIService.validate_image_size_header(file_size):
+        return False
+    
+    await update.message.reply_text(
+        _FILE_TOO_LARGE_TEMPLATE.format(max_size_mb=settings.max_image_size_mb),
+        parse_mode="Markdown"
+    )
+    return True
+
+
+async def _reject_oversized_image(update: Update, image_bytes: bytes) -> bool:
+    """
+    Reply with an error if the image header reports more than MAX_IMAGE_PIXELS
+    
+    Only the header bytes are read, so oversized uploads are turned away
+    without decoding the image or sending it to BFL.ai.
+    
+    Returns:
+        True if the image was rejected
+    """
+    dims = ImageProcessor.quick_dims(image_bytes)
+    if dims is None:
+        return False
+    
+    _, width, height = dims
+    if width * height <= MAX_IMAGE_PIXELS:
+        return False
+    
+    await update.message.reply_text(
+        _IMAGE_TOO_LARGE_TEMPLATE.format(
+            width=width,
+            height=height,
+            megapixels=width * height / 1_000_000,
+            max_megapixels=MAX_IMAGE_PIXELS / 1_000_000
+        ),
+        parse_mode="Markdown"
+    )
+    return True
+
+
+class _DownloadBuffer:
+    """Write target for File.download_to_memory that keeps the written buffers as-is"""
+    
+    def __init__(self):
+        self._chunks: List[bytes] = []
+    
+    def write(self, data: bytes) -> int:
+        self._chunks.append(data)
+        return len(data)
+    
+    def getvalue(self) -> bytes:
+        if len(self._chunks) == 1:
+            return self._chunks[0]
+        return b"".join(self._chunks)
+
+
+async def download_file_bytes(telegram_file: File) -> bytes:
+    """
+    Download a Telegram file into memory
+    
+    PTB's request layer already returns the whole body as a single bytes object;
+    keeping it avoids the extra copy made by download_as_bytearray().
+    """
+    buffer = _DownloadBuffer()
+    await telegram_file.download_to_memory(out=buffer)
+    return buffer.getvalue()
+
+
 async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle photo messages"""
     try:
-        if not await UserMiddleware.process_user(update, context):
+        user = await UserMiddleware.process_user(update, context)
+        if not user:
             return
         
         await LoggingMiddleware.log_interaction(update, context)
         
-        user = context.user_data.get("db_user")
-        
         # Get the largest photo
         photo = update.message.photo[-1]
         
-        # Download photo - FIXED METHOD
+        # Check file size before downloading anything
+        if await _reject_oversized_file(update, photo.file_size):
+            return
+        
+        # Download photo
         photo_file = await photo.get_file()
-        photo_bytes = await photo_file.download_as_bytearray()  # Fixed: use download_as_bytearray()
+        photo_bytes = await download_file_bytes(photo_file)
+        
+        if await _reject_oversized_image(update, photo_bytes):
+            return
         
-        # Validate image
+        # Validate image (off the event loop, it may fall back to a full decode)
         try:
-            image_info = ImageProcessor.validate_image(photo_bytes)
+            image_info = await asyncio.to_thread(ImageProcessor.validate_image_fast, photo_bytes)
             logger.info(f"Image validated: {image_info}")
         except Exception as e:
             await update.message.reply_text(
-                f"❌ **Invalid Image**\n\n{str(e)}\n\n"
+                _INVALID_IMAGE_TEMPLATE.format(error=e) + "\n\n"
                 "Please send a valid image (JPEG, PNG, or WEBP) under 20MB.",
                 parse_mode="Markdown"
             )
             return
         
-        # Store image in context
+        # Store image in the pending cache, only its metadata in context
+        PENDING_IMAGES.put(user.telegram_user_id, photo_bytes)
         context.user_data["pending_image"] = {
-            "bytes": photo_bytes,
             "info": image_info,
             "message_id": update.message.message_id
         }
         
-        # Create prompt keyboard
-        keyboard = [
-            [InlineKeyboardButton("🎨 Color Change", callback_data="prompt_color")],
-            [InlineKeyboardButton("📝 Text Edit", callback_data="prompt_text")],
-            [InlineKeyboardButton("🖼️ Background", callback_data="prompt_background")],
-            [InlineKeyboardButton("✏️ Custom Prompt", callback_data="prompt_custom")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
         await update.message.reply_text(
-            f"📸 **Image Received!**\n\n"
-            f"**Image Info:**\n"
-            f"• Format: {image_info['format']}\n"
-            f"• Size: {image_info['size'][0]}×{image_info['size'][1]}\n"
-            f"• File Size: {image_info['file_size_mb']:.1f}MB\n\n"
-            f"Now tell me what you'd like to edit! You can:\n"
-            f"• Use the quick options below\n"
-            f"• Type your own custom prompt\n\n"
-            f"**Example prompts:**\n"
-            f"• 'Change the car color to red'\n"
-            f"• 'Replace \"Hello\" with \"Welcome\"'\n"
-            f"• 'Add a sunset background'",
+            _PHOTO_RECEIVED_TEMPLATE.format(
+                format=image_info['format'],
+                width=image_info['size'][0],
+                height=image_info['size'][1],
+                file_size_mb=image_info['file_size_mb']
+            ),
             parse_mode="Markdown",
-            reply_markup=reply_markup
+            reply_markup=_PROMPT_KEYBOARD
         )
         
     except Exception as e:
@@ -85,16 +271,13 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle text messages (edit prompts)"""
     try:
-        if not await UserMiddleware.process_user(update, context):
-            return
-        
-        await LoggingMiddleware.log_interaction(update, context)
-        
-        user = context.user_data.get("db_user")
-        
-        # Check if user has a pending image
-        pending_image = context.user_data.get("pending_image")
-        if not pending_image:
+        # Check for a pending image (it may have expired from the cache) and the
+        # prompt length first, so stray text never costs a user lookup
+        pending_image_bytes = None
+        if context.user_data.get("pending_image") and update.effective_user:
+            pending_image_bytes = PENDING_IMAGES.get(update.effective_user.id)
+        if pending_image_bytes is None:
+            context.user_data.pop("pending_image", None)
             await update.message.reply_text(
                 "📸 **Please send an image first!**\n\n"
                 "I need an image to edit. Send me a photo and then tell me what you'd like to change.",
@@ -120,13 +303,19 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
         
+        user = await UserMiddleware.process_user(update, context)
+        if not user:
+            return
+        
+        await LoggingMiddleware.log_interaction(update, context)
+        
         # Create image edit record
         image_edit = ImageEdit(
             user_id=user.id,
             telegram_user_id=user.telegram_user_id,
             telegram_message_id=update.message.message_id,
             prompt=prompt,
-            original_image_size=len(pending_image["bytes"]),
+            original_image_size=len(pending_image_bytes),
             aspect_ratio=user.preferred_aspect_ratio,
             output_format=user.preferred_output_format
         )
@@ -139,10 +328,10 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         # Send processing message
         processing_message = await update.message.reply_text(
-            f"🎨 **Processing your edit...**\n\n"
-            f"**Prompt:** {prompt}\n"
-            f"**Edit Type:** {image_edit.edit_type.replace('_', ' ').title()}\n\n"
-            f"⏳ This usually takes 30-60 seconds. Please wait...",
+            _PROCESSING_TEMPLATE.format(
+                prompt=prompt,
+                edit_type=_format_edit_type(image_edit.edit_type)
+            ),
             parse_mode="Markdown"
         )
         
@@ -150,7 +339,7 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         try:
             await process_image_edit(
                 image_edit, 
-                pending_image["bytes"], 
+                pending_image_bytes, 
                 update, 
                 context, 
                 processing_message
@@ -160,7 +349,7 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
             # Update edit status
             image_edit.fail_with_error(str(e))
-            await db.update_image_edit(image_edit)
+            await db.update_image_edit_status(image_edit)
             
             # Update user stats
             await UserService.update_user_stats(
@@ -170,13 +359,12 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             
             await processing_message.edit_text(
-                f"❌ **Edit Failed**\n\n"
-                f"**Error:** {str(e)}\n\n"
-                f"Please try again with a different prompt or image.",
+                _EDIT_FAILED_TEMPLATE.format(error=e),
                 parse_mode="Markdown"
             )
         
         # Clear pending image
+        PENDING_IMAGES.discard(user.telegram_user_id)
         context.user_data.pop("pending_image", None)
         
     except Exception as e:
@@ -187,87 +375,94 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def process_image_edit(image_edit: ImageEdit, 
-                           image_bytes: bytes, 
+                           image_bytes: Union[bytes, bytearray], 
                            update: Update, 
                            context: ContextTypes.DEFAULT_TYPE,
                            processing_message):
     """Process the image edit request"""
     
     try:
-        # Convert bytearray to bytes if needed
-        if isinstance(image_bytes, bytearray):
-            image_bytes = bytes(image_bytes)
-        
-        # Encode image to base64
-        input_image_base64 = BFLAPIService.encode_image_to_base64(image_bytes)
-        
-        # Process with BFL.ai API
-        async with BFLAPIService() as bfl_service:
-            # Create edit request
-            request_id, polling_url = await bfl_service.create_edit_request(
-                prompt=image_edit.prompt,
-                input_image_base64=input_image_base64,
-                aspect_ratio=image_edit.aspect_ratio,
-                output_format=image_edit.output_format,
-                seed=image_edit.seed,
-                safety_tolerance=image_edit.safety_tolerance
-            )
-            
-            # Update edit status
-            image_edit.start_processing(request_id, polling_url)
-            await db.update_image_edit(image_edit)
-            
-            # Wait for completion
-            result = await bfl_service.wait_for_completion(polling_url)
-            
-            # Get edited image URL
-            edited_image_url = result.get("result", {}).get("sample")
-            if not edited_image_url:
-                raise Exception("No edited image URL in response")
-            
-            # Download edited image
-            edited_image_bytes = await bfl_service.download_image(edited_image_url)
-            
-            # Update edit status
-            image_edit.complete_successfully(edited_image_url)
-            await db.update_image_edit(image_edit)
-            
-            # Update user stats
-            await UserService.update_user_stats(
-                image_edit.telegram_user_id,
-                edit_success=True,
-                edit_type=image_edit.edit_type,
-                processing_time=image_edit.processing_time_seconds
-            )
-            
-            # Create result keyboard
-            keyboard = [
-                [InlineKeyboardButton("🔄 Edit Again", callback_data="edit_again")],
-                [InlineKeyboardButton("📊 My Stats", callback_data="stats")],
-                [InlineKeyboardButton("ℹ️ About", callback_data="about")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            # Send edited image
-            await update.message.reply_photo(
-                photo=edited_image_bytes,
-                caption=f"✅ **Edit Complete!**\n\n"
-                       f"**Prompt:** {image_edit.prompt}\n"
-                       f"**Processing Time:** {image_edit.processing_time_seconds:.1f}s\n"
-                       f"**Edit Type:** {image_edit.edit_type.replace('_', ' ').title()}\n\n"
-                       f"Send another image to continue editing!",
-                parse_mode="Markdown",
-                reply_markup=reply_markup
-            )
-            
-            # Delete processing message
+        # Encode image to base64 (CPU-bound for large images)
+        input_image_base64 = await asyncio.to_thread(BFLAPIService.encode_image_to_base64, image_bytes)
+        
+        # Process with BFL.ai API, reusing the process-wide session and its warm connections
+        bfl_service = await get_shared_service()
+        
+        # Create edit request
+        request_id, polling_url = await bfl_service.create_edit_request(
+            prompt=image_edit.prompt,
+            input_image_base64=input_image_base64,
+            aspect_ratio=image_edit.aspect_ratio,
+            output_format=image_edit.output_format,
+            seed=image_edit.seed,
+            safety_tolerance=image_edit.safety_tolerance
+        )
+        
+        # Update edit status in memory; the status fields are persisted
+        # together with the final result (or failure) in a single write
+        image_edit.start_processing(request_id, polling_url)
+        
+        # Wait for completion
+        result = await bfl_service.wait_for_completion(polling_url)
+        
+        # Get edited image URL
+        edited_image_url = result.get("result", {}).get("sample")
+        if not edited_image_url:
+            raise Exception("No edited image URL in response")
+        
+        # Update edit status
+        image_edit.complete_successfully(edited_image_url)
+        
+        caption = _EDIT_COMPLETE_TEMPLATE.format(
+            prompt=image_edit.prompt,
+            processing_time=image_edit.processing_time_seconds,
+            edit_type=_format_edit_type(image_edit.edit_type)
+        )
+        
+        async def send_result():
+            # Send edited image by URL so Telegram fetches it directly,
+            # falling back to relaying the bytes if Telegram can't reach it
             try:
-                await processing_message.delete()
-            except:
-                pass
-            
-            logger.info(f"Successfully processed edit for user {image_edit.telegram_user_id}")
-            
+                await update.message.reply_photo(
+                    photo=edited_image_url,
+                    caption=caption,
+                    parse_mode="Markdown",
+                    reply_markup=_RESULT_KEYBOARD
+                )
+            except BadRequest as e:
+                logger.warning(f"Telegram could not fetch edited image URL, uploading instead: {e}")
+                edited_image_bytes = await bfl_service.download_image(edited_image_url)
+                await update.message.reply_photo(
+                    photo=edited_image_bytes,
+                    caption=caption,
+                    parse_mode="Markdown",
+                    reply_markup=_RESULT_KEYBOARD
+                )
+        
+        # Save the result and reply concurrently
+        results = await asyncio.gather(
+            db.update_image_edit_status(image_edit),
+            send_result(),
+            return_exceptions=True
+        )
+        for outcome in results:
+            if isinstance(outcome, BaseException):
+                raise outcome
+        
+        # Count the success only once the result has been delivered; a failure
+        # above is recorded by the caller instead
+        await UserService.update_user_stats(
+            image_edit.telegram_user_id,
+            edit_success=True,
+            edit_type=image_edit.edit_type,
+            processing_time=image_edit.processing_time_seconds
+        )
+        
+        # Delete processing message in the background
+        _run_in_background(_delete_message_quietly(processing_message))
+        
+        logger.info(f"Successfully processed edit for user {image_edit.telegram_user_id}")
+        
     except Exception as e:
         logger.error(f"Error in process_image_edit: {e}")
         raise
@@ -276,7 +471,8 @@ async def process_image_edit(image_edit: ImageEdit,
 async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle document messages (in case user sends image as document)"""
     try:
-        if not await UserMiddleware.process_user(update, context):
+        user = await UserMiddleware.process_user(update, context)
+        if not user:
             return
         
         document = update.message.document
@@ -290,39 +486,39 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
         
-        # Check file size
-        if document.file_size > 20 * 1024 * 1024:  # 20MB
-            await update.message.reply_text(
-                "❌ **File Too Large**\n\n"
-                "Please send an image smaller than 20MB.",
-                parse_mode="Markdown"
-            )
+        # Check file size before downloading anything
+        if await _reject_oversized_file(update, document.file_size):
             return
         
-        # Download and process as photo - FIXED METHOD
+        # Download and process as photo
         document_file = await document.get_file()
-        image_bytes = await document_file.download_as_bytearray()  # Fixed: use download_as_bytearray()
+        image_bytes = await download_file_bytes(document_file)
         
-        # Validate image
+        if await _reject_oversized_image(update, image_bytes):
+            return
+        
+        # Validate image (off the event loop, it may fall back to a full decode)
         try:
-            image_info = ImageProcessor.validate_image(image_bytes)
+            image_info = await asyncio.to_thread(
+                ImageProcessor.validate_image_fast, image_bytes, document.mime_type
+            )
         except Exception as e:
             await update.message.reply_text(
-                f"❌ **Invalid Image**\n\n{str(e)}",
+                _INVALID_IMAGE_TEMPLATE.format(error=e),
                 parse_mode="Markdown"
             )
             return
         
-        # Store in context (same as photo handler)
+        # Store in the pending cache (same as photo handler)
+        PENDING_IMAGES.put(user.telegram_user_id, image_bytes)
         context.user_data["pending_image"] = {
-            "bytes": image_bytes,
             "info": image_info,
             "message_id": update.message.message_id
         }
         
         await update.message.reply_text(
-            f"📸 **Image Document Received!**\n\n"
-            f"Now tell me what you'd like to edit!",
+            "📸 **Image Document Received!**\n\n"
+            "Now tell me what you'd like to edit!",
             parse_mode="Markdown"
         )
         
@@ -337,9 +533,11 @@ async def setup_message_handlers(application, middleware):
     """Setup message handlers"""
     
     # Add message handlers
-    application.add_handler(MessageHandler(filters.PHOTO & ~filters.COMMAND, handle_photo))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
-    application.add_handler(MessageHandler(filters.Document.IMAGE & ~filters.COMMAND, handle_document))
+    application.add_handlers([
+        MessageHandler(PHOTO_FILTER, handle_photo),
+        MessageHandler(TEXT_FILTER, handle_text),
+        MessageHandler(DOC_IMG_FILTER, handle_document)
+    ])
     
     logger.info("Message handlers setup completed")
     return True
@@ -3,35 +3,52 @@ Middleware for Telegram bot
 """
 
 import time
-from typing import Dict, Any, Callable, Awaitable
+from collections import OrderedDict
+from typing import Any, Callable, Awaitable, Optional, Tuple
+from cachetools import TTLCache
 from telegram import Update
 from telegram.ext import ContextTypes, BaseHandler
 from loguru import logger
 
 from ..services import UserService
+from ..models import User
 from ..config import settings
 
 
+# Recently seen users, so chatty users don't cost a database round-trip per update
+USER_CACHE: "TTLCache[int, Tuple[User, bool]]" = TTLCache(maxsize=10_000, ttl=30)
+
+
 class UserMiddleware:
     """Middleware to handle user registration and updates"""
     
     @staticmethod
-    async def process_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Process user information and ensure user exists in database"""
+    async def process_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Optional[User]:
+        """
+        Process user information and ensure user exists in database
+        
+        Returns:
+            The database user, or None if the update should not be processed
+        """
         if not update.effective_user:
-            return
+            return None
         
         telegram_user = update.effective_user
         
         try:
-            # Get or create user
-            user, is_new = await UserService.get_or_create_user(
-                telegram_user_id=telegram_user.id,
-                username=telegram_user.username,
-                first_name=telegram_user.first_name,
-                last_name=telegram_user.last_name,
-                language_code=telegram_user.language_code
-            )
+            # Get or create user, from the cache when seen recently
+            cached = USER_CACHE.get(telegram_user.id)
+            if cached:
+                user, is_new = cached
+            else:
+                user, is_new = await UserService.get_or_create_user(
+                    telegram_user_id=telegram_user.id,
+                    username=telegram_user.username,
+                    first_name=telegram_user.first_name,
+                    last_name=telegram_user.last_name,
+                    language_code=telegram_user.language_code
+                )
+                USER_CACHE[telegram_user.id] = (user, False)
             
             # Store user in context for handlers
             context.user_data["db_user"] = user
@@ -42,7 +59,7 @@ class UserMiddleware:
                 await update.message.reply_text(
                     "❌ Your account has been suspended. Contact support for assistance."
                 )
-                return False  # Stop processing
+                return None  # Stop processing
             
             if is_new:
                 logger.info(f"New user registered: {user.full_name} ({telegram_user.id})")
@@ -52,17 +69,24 @@ class UserMiddleware:
             await update.message.reply_text(
                 "⚠️ There was an error processing your request. Please try again later."
             )
-            return False
+            return None
         
-        return True
+        return user
+    
+    @staticmethod
+    def invalidate_user(telegram_user_id: int):
+        """Drop a cached user, e.g. after it was banned or unbanned"""
+        USER_CACHE.pop(telegram_user_id, None)
 
 
 class RateLimitMiddleware:
     """Middleware for rate limiting (if needed in future)"""
     
     def __init__(self):
-        self.user_requests: Dict[int, list] = {}
+        # Per-user token buckets as (tokens, last_refill), least recently seen user first
+        self.buckets: "OrderedDict[int, Tuple[float, float]]" = OrderedDict()
         self.max_requests_per_minute = 10
+        self.max_tracked_users = 10_000
     
     async def check_rate_limit(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
         """Check if user is within rate limits"""
@@ -70,26 +94,27 @@ class RateLimitMiddleware:
             return True
         
         user_id = update.effective_user.id
-        current_time = time.time()
+        current_time = time.monotonic()
+        capacity = self.max_requests_per_minute
         
-        # Clean old requests (older than 1 minute)
-        if user_id in self.user_requests:
-            self.user_requests[user_id] = [
-                req_time for req_time in self.user_requests[user_id]
-                if current_time - req_time < 60
-            ]
-        else:
-            self.user_requests[user_id] = []
+        # Refill the bucket for the time elapsed since the last request
+        tokens, last_refill = self.buckets.pop(user_id, (capacity, current_time))
+        tokens = min(capacity, tokens + (current_time - last_refill) * capacity / 60)
         
         # Check if user exceeded rate limit
-        if len(self.user_requests[user_id]) >= self.max_requests_per_minute:
+        if tokens < 1:
+            self.buckets[user_id] = (tokens, current_time)
             await update.message.reply_text(
                 "⏰ You're sending requests too quickly. Please wait a moment and try again."
             )
             return False
         
-        # Add current request
-        self.user_requests[user_id].append(current_time)
+        # Spend a token for the current request
+        self.buckets[user_id] = (tokens - 1, current_time)
+        
+        # Forget the least recently seen user once the cap is reached
+        if len(self.buckets) > self.max_tracked_users:
+            self.buckets.popitem(last=False)
         return True
 
 
@@ -102,21 +127,28 @@ class LoggingMiddleware:
         if not update.effective_user or not update.message:
             return
         
-        user_id = update.effective_user.id
-        username = update.effective_user.username or "N/A"
-        message_type = "text"
+        message = update.message
+        user = update.effective_user
         
-        if update.message.photo:
-            message_type = "photo"
-        elif update.message.document:
-            message_type = "document"
-        elif update.message.voice:
-            message_type = "voice"
-        
-        logger.info(
-            f"User interaction - ID: {user_id}, Username: @{username}, "
-            f"Type: {message_type}, Text: {update.message.text[:50] if update.message.text else 'N/A'}"
+        # Lazy arguments are only evaluated when a sink accepts DEBUG records
+        logger.opt(lazy=True).debug(
+            "User interaction - ID: {}, Username: @{}, Type: {}, Text: {}",
+            lambda: user.id,
+            lambda: user.username or "N/A",
+            lambda: LoggingMiddleware.get_message_type(message),
+            lambda: message.text[:50] if message.text else "N/A"
         )
+    
+    @staticmethod
+    def get_message_type(message) -> str:
+        """Get a short label for the kind of message"""
+        if message.photo:
+            return "photo"
+        elif message.document:
+            return "document"
+        elif message.voice:
+            return "voice"
+        return "text"
 
 
 class ErrorHandlingMiddleware:
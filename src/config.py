@@ -3,9 +3,10 @@ Configuration management for MedusaXD AI Image Editor Bot
 """
 
 import os
-from typing import List, Optional
+from functools import lru_cache
+from typing import FrozenSet, Optional, Union
 from pydantic_settings import BaseSettings
-from pydantic import Field
+from pydantic import Field, field_validator
 
 
 
@@ -23,13 +24,22 @@ class Settings(BaseSettings):
     # Database Configuration
     mongodb_url: str = Field(..., env="MONGODB_URL")
     database_name: str = Field("medusaxd_bot", env="DATABASE_NAME")
+    mongo_pool_size: int = Field(50, env="MONGO_POOL_SIZE")
+    mongo_compressors: Optional[str] = Field(None, env="MONGO_COMPRESSORS")
     
     # Application Configuration
     environment: str = Field("development", env="ENVIRONMENT")
     log_level: str = Field("INFO", env="LOG_LEVEL")
+    file_log_level: str = Field("WARNING", env="FILE_LOG_LEVEL")
     max_image_size_mb: int = Field(20, env="MAX_IMAGE_SIZE_MB")
+    # Memory budget for uploads waiting for an edit prompt; must hold at least one image
+    pending_images_max_mb: int = Field(200, env="PENDING_IMAGES_MAX_MB")
+    # Resampling filter for the size search when shrinking images; the
+    # chosen size is always rendered with LANCZOS
+    resample_filter: str = Field("bicubic", env="RESAMPLE_FILTER")
     polling_interval_seconds: int = Field(2, env="POLLING_INTERVAL_SECONDS")
     max_polling_attempts: int = Field(150, env="MAX_POLLING_ATTEMPTS")
+    skip_index_creation: bool = Field(False, env="SKIP_INDEX_CREATION")
     
     # Optional: Webhook Configuration
     webhook_url: Optional[str] = Field(None, env="WEBHOOK_URL")
@@ -39,24 +49,36 @@ class Settings(BaseSettings):
     redis_url: Optional[str] = Field(None, env="REDIS_URL")
     
     # Security
-    admin_user_ids: List[int] = Field(default_factory=list, env="ADMIN_USER_IDS")
+    # Union with str lets a comma-separated ADMIN_USER_IDS through the JSON decoding of
+    # collection fields; parsed once into a frozenset for O(1) admin checks
+    admin_user_ids: Union[FrozenSet[int], str] = Field(default_factory=frozenset, env="ADMIN_USER_IDS")
     
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
         
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        # Parse admin user IDs from comma-separated string
-        if isinstance(self.admin_user_ids, str):
-            self.admin_user_ids = [
-                int(uid.strip()) for uid in self.admin_user_ids.split(",") 
+    @field_validator("admin_user_ids", mode="before")
+    @classmethod
+    def parse_admin_user_ids(cls, value):
+        """Parse admin user IDs from a comma-separated string"""
+        if isinstance(value, int):
+            return frozenset((value,))
+        if isinstance(value, str):
+            return frozenset(
+                int(uid.strip()) for uid in value.split(",")
                 if uid.strip().isdigit()
-            ]
+            )
+        return frozenset(value)
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Get the application settings, parsed once per process"""
+    return Settings()
 
 
 # Global settings instance
-settings = Settings()
+settings = get_settings()
 
 
 # Bot branding constants
@@ -71,7 +93,8 @@ BFL_ENDPOINTS = {
 }
 
 # Image processing constants
-SUPPORTED_IMAGE_FORMATS = ["JPEG", "PNG", "WEBP"]
+SUPPORTED_IMAGE_FORMATS = frozenset(("JPEG", "PNG", "WEBP"))
+SUPPORTED_IMAGE_FORMATS_STR = "JPEG, PNG, WEBP"
 MAX_IMAGE_PIXELS = 20_000_000  # 20 megapixels
 DEFAULT_ASPECT_RATIO = "1:1"
 
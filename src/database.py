@@ -3,39 +3,352 @@ MongoDB database connection and operations
 """
 
 import asyncio
-from typing import Optional, List, Dict, Any
-from datetime import datetime, date
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase, AsyncIOMotorCollection
-from pymongo.errors import DuplicateKeyError
+from typing import AbstractSet, Optional, List, Dict, Any, Tuple
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import AsyncMongoClient, IndexModel, InsertOne, ReturnDocument, UpdateOne
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
 from loguru import logger
 
 from .config import settings
-from .models import User, ImageEdit, BotAnalytics, EditStatus
+from .models import ANALYTICS_ID, User, ImageEdit, BotAnalytics, DailyStats, EditStatus
+
+
+# Plain string statuses for queries, matching how they are stored
+_PENDING = EditStatus.PENDING.value
+_PROCESSING = EditStatus.PROCESSING.value
+
+# Documents fetched per getMore when reading whole edit queues
+EDIT_BATCH_SIZE = 500
+
+# Result sets at least this large are turned into models in a worker thread
+THREADED_DECODE_THRESHOLD = 1000
+
+USER_INDEXES = [
+    IndexModel("telegram_user_id", unique=True),
+    IndexModel("username"),
+    IndexModel("created_at"),
+    IndexModel("last_seen")
+]
+
+# The compound index also serves lookups by telegram_user_id alone, and the
+# partial one only holds in-flight edits so the queue scans read a small hot index.
+# The analytics collection holds a single document and daily_analytics is keyed
+# by ISO date, so neither needs secondary indexes
+IMAGE_EDIT_INDEXES = [
+    IndexModel("user_id"),
+    IndexModel("created_at"),
+    IndexModel("bfl_request_id"),
+    IndexModel([("telegram_user_id", 1), ("created_at", -1)]),
+    IndexModel(
+        [("status", 1), ("created_at", 1)],
+        partialFilterExpression={"status": {"$in": [_PENDING, _PROCESSING]}}
+    )
+]
+
+# Indexes created by earlier versions that are now redundant, as (collection, name)
+REDUNDANT_INDEXES = [
+    ("image_edits", "telegram_user_id_1"),
+    ("image_edits", "status_1"),
+    ("analytics", "created_at_1"),
+    ("analytics", "updated_at_1")
+]
+
+# Connections kept warm, idle connection lifetime and how long to wait for a
+# reachable server before failing a request
+MONGO_MIN_POOL_SIZE = 5
+MONGO_MAX_IDLE_TIME_MS = 60_000
+MONGO_SERVER_SELECTION_TIMEOUT_MS = 3_000
+
+# Coalescing window and size cap for bulk writes
+BULK_MAX_BATCH = 100
+BULK_MAX_DELAY = 0.02
+
+
+def _add(path: str, amount) -> Dict[str, Any]:
+    """Aggregation expression adding amount to a possibly missing numeric field"""
+    return {"$add": [{"$ifNull": [path, 0]}, amount]}
+
+
+def _running_average(average_path: str, count_path: str, value: float) -> Dict[str, Any]:
+    """Aggregation expression folding value into the average over count + 1 items"""
+    count = {"$ifNull": [count_path, 0]}
+    return {
+        "$cond": [
+            {"$gt": [{"$ifNull": [average_path, 0]}, 0]},
+            {"$divide": [
+                {"$add": [{"$multiply": [average_path, count]}, value]},
+                {"$add": [count, 1]}
+            ]},
+            value
+        ]
+    }
+
+
+def _analytics_increment_pipeline(new_user: bool = False,
+                                  edit_success: Optional[bool] = None,
+                                  processing_time: Optional[float] = None,
+                                  edit_type: Optional[str] = None,
+                                  aspect_ratio: Optional[str] = None,
+                                  output_format: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Build an update pipeline applying one event to the analytics document
+    
+    Mirrors BotAnalytics.update_stats, but runs server-side so only the
+    changed counters are computed and nothing is sent back over the wire.
+    
+    Args:
+        new_user: Whether a new user registered
+        edit_success: Outcome of an edit, or None if no edit happened
+        processing_time: Time taken to process the edit
+        edit_type: Type of edit performed
+        aspect_ratio: Aspect ratio used
+        output_format: Output format used
+        
+    Returns:
+        Update pipeline for update_one
+    """
+    is_edit = edit_success is not None
+    
+    totals: Dict[str, Any] = {
+        "total_users": _add("$total_users", int(new_user)),
+        "created_at": {"$ifNull": ["$created_at", "$$NOW"]},
+        "updated_at": "$$NOW"
+    }
+    
+    if is_edit:
+        counter = "successful_edits" if edit_success else "failed_edits"
+        totals["total_edits"] = _add("$total_edits", 1)
+        totals[counter] = _add(f"${counter}", 1)
+        
+        if processing_time:
+            totals["average_processing_time"] = _running_average(
+                "$average_processing_time", "$total_edits", processing_time
+            )
+    
+    if edit_type:
+        totals[f"popular_edit_types.{edit_type}"] = _add(f"$popular_edit_types.{edit_type}", 1)
+    
+    if aspect_ratio:
+        totals[f"popular_aspect_ratios.{aspect_ratio}"] = _add(f"$popular_aspect_ratios.{aspect_ratio}", 1)
+    
+    if output_format:
+        totals[f"popular_output_formats.{output_format}"] = _add(f"$popular_output_formats.{output_format}", 1)
+    
+    pipeline = [{"$set": totals}]
+    if is_edit:
+        pipeline.append({"$set": {
+            "success_rate": {"$multiply": [{"$divide": ["$successful_edits", "$total_edits"]}, 100]}
+        }})
+    return pipeline
+
+
+def _daily_increment_pipeline(day_key: str,
+                              new_user: bool = False,
+                              edit_success: Optional[bool] = None,
+                              processing_time: Optional[float] = None,
+                              edit_type: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Build an update pipeline applying one event to a daily_analytics document
+    
+    Args:
+        day_key: ISO date of the day being updated
+        new_user: Whether a new user registered
+        edit_success: Outcome of an edit, or None if no edit happened
+        processing_time: Time taken to process the edit
+        edit_type: Type of edit performed
+        
+    Returns:
+        Update pipeline for an upserting update_one keyed by the ISO date
+    """
+    day: Dict[str, Any] = {
+        "date": day_key,
+        "new_users": _add("$new_users", int(new_user)),
+        "updated_at": "$$NOW"
+    }
+    
+    if edit_success is not None:
+        counter = "successful_edits" if edit_success else "failed_edits"
+        day["total_edits"] = _add("$total_edits", 1)
+        day[counter] = _add(f"${counter}", 1)
+        
+        if processing_time:
+            day["average_processing_time"] = _running_average(
+                "$average_processing_time", "$total_edits", processing_time
+            )
+    
+    if edit_type:
+        day[f"popular_edit_types.{edit_type}"] = _add(f"$popular_edit_types.{edit_type}", 1)
+    
+    return [{"$set": day}]
+
+
+def _client_options() -> Dict[str, Any]:
+    """Connection pool and timeout options for the MongoDB client"""
+    options: Dict[str, Any] = {
+        "maxPoolSize": settings.mongo_pool_size,
+        "minPoolSize": min(MONGO_MIN_POOL_SIZE, settings.mongo_pool_size),
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS
+    }
+    if settings.mongo_compressors:
+        options["compressors"] = settings.mongo_compressors
+    return options
+
+
+# Prompts in edit previews are cut to this many characters, with an ellipsis
+PROMPT_PREVIEW_LENGTH = 50
+
+# Shapes an image edit into a preview for the stats command, server-side
+_EDIT_PREVIEW_PROJECTION = {
+    "_id": 0,
+    "prompt": {"$cond": [
+        {"$gt": [{"$strLenCP": "$prompt"}, PROMPT_PREVIEW_LENGTH]},
+        {"$concat": [{"$substrCP": ["$prompt", 0, PROMPT_PREVIEW_LENGTH]}, "..."]},
+        "$prompt"
+    ]},
+    "status": 1,
+    "created_at": 1,
+    "processing_time": "$processing_time_seconds"
+}
+
+# Default user document, dumped once; per-user values are filled in by _new_user_defaults
+_USER_TEMPLATE = User(telegram_user_id=1).model_dump(by_alias=True)
+
+
+def _new_user_defaults(telegram_user_id: int, now: datetime, exclude: AbstractSet[str]) -> Dict[str, Any]:
+    """Build the $setOnInsert document for a new user without validating a model"""
+    defaults = {field: value for field, value in _USER_TEMPLATE.items() if field not in exclude}
+    defaults.update(
+        _id=ObjectId(),
+        telegram_user_id=telegram_user_id,
+        created_at=now,
+        stats={**_USER_TEMPLATE["stats"], "favorite_edit_types": {}}
+    )
+    return defaults
+
+
+async def _edits_from_docs(docs: List[Dict[str, Any]]) -> List[ImageEdit]:
+    """Build ImageEdit models, off the event loop when there are many documents"""
+    if len(docs) < THREADED_DECODE_THRESHOLD:
+        return [ImageEdit.from_mongo(edit_data) for edit_data in docs]
+    return await asyncio.to_thread(lambda: [ImageEdit.from_mongo(edit_data) for edit_data in docs])
+
+
+class _BulkWriter:
+    """
+    Coalesces concurrent writes to one collection into unordered bulk_write calls
+    
+    Callers still await their own write: submit() resolves once the batch
+    holding the operation has been flushed, so a document inserted through
+    the writer exists as soon as the call returns.
+    """
+    
+    def __init__(self, collection: AsyncCollection,
+                 max_batch: int = BULK_MAX_BATCH,
+                 max_delay: float = BULK_MAX_DELAY):
+        self.collection = collection
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+    
+    async def submit(self, operation) -> bool:
+        """
+        Queue a write operation and wait for its batch to be flushed
+        
+        Args:
+            operation: InsertOne/UpdateOne request for the collection
+            
+        Returns:
+            True if the operation succeeded
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((operation, future))
+        return await future
+    
+    async def stop(self):
+        """Flush queued operations and stop the background task"""
+        if self._task is None or self._task.done():
+            return
+        await self._queue.put(None)
+        await self._task
+    
+    async def _run(self):
+        """Collect operations for up to max_delay or max_batch and flush them"""
+        stopping = False
+        while not stopping:
+            batch = [await self._queue.get()]
+            if self._queue.qsize() < self.max_batch - 1:
+                await asyncio.sleep(self.max_delay)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            
+            if None in batch:
+                stopping = True
+                batch = [item for item in batch if item is not None]
+            if batch:
+                await self._flush(batch)
+    
+    async def _flush(self, batch: List[Tuple[Any, asyncio.Future]]):
+        """Write one batch and resolve each caller's future"""
+        failed = set()
+        try:
+            await self.collection.bulk_write([operation for operation, _ in batch], ordered=False)
+        except BulkWriteError as e:
+            # Unordered writes carry on past failures; only the listed ones failed
+            failed = {error["index"] for error in e.details.get("writeErrors", [])}
+            logger.error(f"Bulk write to {self.collection.name} failed for {len(failed)} of {len(batch)} operations")
+        except Exception as e:
+            failed = set(range(len(batch)))
+            logger.error(f"Bulk write to {self.collection.name} failed: {e}")
+        
+        for index, (_, future) in enumerate(batch):
+            if not future.done():
+                future.set_result(index not in failed)
 
 
 class Database:
     """MongoDB database manager"""
     
     def __init__(self):
-        self.client: Optional[AsyncIOMotorClient] = None
-        self.db: Optional[AsyncIOMotorDatabase] = None
-        self.users: Optional[AsyncIOMotorCollection] = None
-        self.image_edits: Optional[AsyncIOMotorCollection] = None
-        self.analytics: Optional[AsyncIOMotorCollection] = None
+        self.client: Optional[AsyncMongoClient] = None
+        self.db: Optional[AsyncDatabase] = None
+        self.users: Optional[AsyncCollection] = None
+        self.image_edits: Optional[AsyncCollection] = None
+        self.analytics: Optional[AsyncCollection] = None
+        self.daily_analytics: Optional[AsyncCollection] = None
+        
+        # Batched writers for the hot insert/increment paths, set up on connect
+        self._edit_writer: Optional[_BulkWriter] = None
+        self._analytics_writer: Optional[_BulkWriter] = None
+        self._daily_writer: Optional[_BulkWriter] = None
     
     async def connect(self):
         """Connect to MongoDB"""
         try:
-            self.client = AsyncIOMotorClient(settings.mongodb_url)
-            self.db = self.client[settings.database_name]
+            # Native asyncio client, no thread pool between the event loop and the socket
+            self.client = AsyncMongoClient(settings.mongodb_url, **_client_options())
+            self.db = self.client.get_database(settings.database_name)
             
             # Initialize collections
             self.users = self.db.users
             self.image_edits = self.db.image_edits
             self.analytics = self.db.analytics
+            self.daily_analytics = self.db.daily_analytics
+            
+            self._edit_writer = _BulkWriter(self.image_edits)
+            self._analytics_writer = _BulkWriter(self.analytics)
+            self._daily_writer = _BulkWriter(self.daily_analytics)
             
             # Create indexes
             await self._create_indexes()
+            await self._migrate_legacy_analytics()
             
             # Test connection
             await self.client.admin.command('ping')
@@ -48,51 +361,104 @@ class Database:
     async def disconnect(self):
         """Disconnect from MongoDB"""
         if self.client:
-            self.client.close()
+            for writer in (self._edit_writer, self._analytics_writer, self._daily_writer):
+                if writer:
+                    await writer.stop()
+            await self.client.close()
             logger.info("Disconnected from MongoDB")
     
     async def _create_indexes(self):
         """Create database indexes for better performance"""
+        if settings.skip_index_creation:
+            logger.info("Skipping index creation (SKIP_INDEX_CREATION is set)")
+            return
+        
         try:
-            # User indexes
-            await self.users.create_index("telegram_user_id", unique=True)
-            await self.users.create_index("username")
-            await self.users.create_index("created_at")
-            await self.users.create_index("last_seen")
-            
-            # Image edit indexes
-            await self.image_edits.create_index("telegram_user_id")
-            await self.image_edits.create_index("user_id")
-            await self.image_edits.create_index("status")
-            await self.image_edits.create_index("created_at")
-            await self.image_edits.create_index("bfl_request_id")
-            await self.image_edits.create_index([("telegram_user_id", 1), ("created_at", -1)])
-            
-            # Analytics indexes
-            await self.analytics.create_index("created_at")
-            await self.analytics.create_index("updated_at")
+            # One createIndexes command per collection, all collections at once
+            await asyncio.gather(
+                self.users.create_indexes(USER_INDEXES),
+                self.image_edits.create_indexes(IMAGE_EDIT_INDEXES),
+                self._drop_redundant_indexes()
+            )
             
             logger.info("Database indexes created successfully")
             
         except Exception as e:
             logger.error(f"Failed to create indexes: {e}")
     
+    async def _drop_redundant_indexes(self):
+        """Drop indexes superseded by the current index set"""
+        for collection, name in REDUNDANT_INDEXES:
+            try:
+                await self.db[collection].drop_index(name)
+            except OperationFailure:
+                pass
+    
     # User operations
     async def get_user(self, telegram_user_id: int) -> Optional[User]:
         """Get user by Telegram user ID"""
         try:
             user_data = await self.users.find_one({"telegram_user_id": telegram_user_id})
             if user_data:
-                return User(**user_data)
+                return User.from_mongo(user_data)
             return None
         except Exception as e:
             logger.error(f"Failed to get user {telegram_user_id}: {e}")
             return None
     
+    async def touch_user(self, 
+                         telegram_user_id: int,
+                         username: Optional[str] = None,
+                         first_name: Optional[str] = None,
+                         last_name: Optional[str] = None,
+                         language_code: Optional[str] = None) -> Tuple[User, bool]:
+        """
+        Get or create a user, refreshing profile fields and last_seen in one round trip
+        
+        Returns:
+            Tuple of (User object, is_new_user boolean)
+        """
+        now = datetime.utcnow()
+        profile = {
+            field: value for field, value in (
+                ("username", username),
+                ("first_name", first_name),
+                ("last_name", last_name),
+                ("language_code", language_code)
+            ) if value
+        }
+        changes = {**profile, "last_seen": now, "updated_at": now}
+        defaults = _new_user_defaults(telegram_user_id, now, exclude=changes.keys())
+        
+        for attempt in range(2):
+            try:
+                # BEFORE tells inserts (None) apart from updates; the result
+                # after the update is then known without another read
+                before = await self.users.find_one_and_update(
+                    {"telegram_user_id": telegram_user_id},
+                    {"$setOnInsert": defaults, "$set": changes},
+                    upsert=True,
+                    return_document=ReturnDocument.BEFORE
+                )
+                break
+            except DuplicateKeyError:
+                # Lost an upsert race with a concurrent insert; the retry matches it
+                if attempt:
+                    raise
+        
+        if before is None:
+            user, is_new = User(**defaults, **changes), True
+        else:
+            user, is_new = User.from_mongo({**before, **changes}), False
+        
+        return user, is_new
+    
     async def create_user(self, user: User) -> bool:
         """Create a new user"""
         try:
-            await self.users.insert_one(user.dict(by_alias=True, exclude_unset=True))
+            if user.id is None:
+                user.id = ObjectId()
+            await self.users.insert_one(user.to_dict())
             logger.info(f"Created new user: {user.telegram_user_id}")
             return True
         except DuplicateKeyError:
@@ -103,39 +469,127 @@ class Database:
             return False
     
     async def update_user(self, user: User) -> bool:
-        """Update an existing user"""
+        """Update an existing user, writing only the fields changed since it was loaded"""
         try:
+            fields = user.model_dump_for_mongo()
+            if not fields:
+                fields = user.to_dict()
+                del fields["_id"]
+            
             result = await self.users.update_one(
                 {"telegram_user_id": user.telegram_user_id},
-                {"$set": user.dict(by_alias=True, exclude_unset=True)}
+                {"$set": fields}
             )
+            user.mark_clean()
             return result.modified_count > 0
         except Exception as e:
             logger.error(f"Failed to update user {user.telegram_user_id}: {e}")
             return False
     
-    async def get_user_stats(self, telegram_user_id: int) -> Dict[str, Any]:
-        """Get user statistics"""
+    async def update_user_fields(self, telegram_user_id: int, fields: Dict[str, Any]) -> bool:
+        """Set only the given user fields"""
         try:
-            user = await self.get_user(telegram_user_id)
-            if not user:
+            result = await self.users.update_one(
+                {"telegram_user_id": telegram_user_id},
+                {"$set": fields, "$currentDate": {"updated_at": True}}
+            )
+            return result.matched_count > 0
+        except Exception as e:
+            logger.error(f"Failed to update user {telegram_user_id}: {e}")
+            return False
+    
+    async def increment_user_stats(self, 
+                                   telegram_user_id: int, 
+                                   edit_success: bool = True,
+                                   edit_type: Optional[str] = None) -> bool:
+        """Count an edit in the user's statistics with server-side increments"""
+        increments = {
+            "stats.total_edits": 1,
+            "stats.successful_edits" if edit_success else "stats.failed_edits": 1
+        }
+        if edit_type:
+            increments[f"stats.favorite_edit_types.{edit_type}"] = 1
+        
+        try:
+            result = await self.users.update_one(
+                {"telegram_user_id": telegram_user_id},
+                {
+                    "$inc": increments,
+                    "$currentDate": {"stats.last_edit_date": True, "updated_at": True}
+                }
+            )
+            return result.matched_count > 0
+        except Exception as e:
+            logger.error(f"Failed to update stats for user {telegram_user_id}: {e}")
+            return False
+    
+    async def get_user_stats(self, telegram_user_id: int, latest_edits: int = 0) -> Dict[str, Any]:
+        """
+        Get user statistics
+        
+        Args:
+            telegram_user_id: Telegram user ID
+            latest_edits: Number of most recent edits to include as previews
+                under "latest_edits", fetched in the same aggregation
+            
+        Returns:
+            Dictionary with user statistics, empty if the user is unknown
+        """
+        try:
+            start_of_month = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            
+            # Project just the stats fields and count this month's edits in one round trip
+            # (the lookup is served by the telegram_user_id/created_at index)
+            pipeline = [
+                {"$match": {"telegram_user_id": telegram_user_id}},
+                {"$limit": 1},
+                {"$project": {"_id": 0, "telegram_user_id": 1, "stats": 1, "created_at": 1, "last_seen": 1}},
+                {"$lookup": {
+                    "from": "image_edits",
+                    "let": {"tid": "$telegram_user_id"},
+                    "pipeline": [
+                        {"$match": {"$expr": {"$and": [
+                            {"$eq": ["$telegram_user_id", "$$tid"]},
+                            {"$gte": ["$created_at", start_of_month]}
+                        ]}}},
+                        {"$count": "n"}
+                    ],
+                    "as": "recent"
+                }}
+            ]
+            if latest_edits:
+                pipeline.append({"$lookup": {
+                    "from": "image_edits",
+                    "let": {"tid": "$telegram_user_id"},
+                    "pipeline": [
+                        {"$match": {"$expr": {"$eq": ["$telegram_user_id", "$$tid"]}}},
+                        {"$sort": {"created_at": -1}},
+                        {"$limit": latest_edits},
+                        {"$project": _EDIT_PREVIEW_PROJECTION}
+                    ],
+                    "as": "latest_edits"
+                }})
+            cursor = await self.users.aggregate(pipeline)
+            docs = await cursor.to_list(length=1)
+            if not docs:
                 return {}
             
-            # Get recent edits
-            recent_edits = await self.image_edits.count_documents({
-                "telegram_user_id": telegram_user_id,
-                "created_at": {"$gte": datetime.utcnow().replace(day=1)}  # This month
-            })
+            user_data = docs[0]
+            stats = user_data.get("stats") or {}
+            total_edits = stats.get("total_edits", 0)
+            successful_edits = stats.get("successful_edits", 0)
+            recent = user_data.get("recent")
             
             return {
-                "total_edits": user.stats.total_edits,
-                "successful_edits": user.stats.successful_edits,
-                "failed_edits": user.stats.failed_edits,
-                "success_rate": user.success_rate,
-                "recent_edits": recent_edits,
-                "favorite_edit_types": user.stats.favorite_edit_types,
-                "member_since": user.created_at,
-                "last_seen": user.last_seen
+                "total_edits": total_edits,
+                "successful_edits": successful_edits,
+                "failed_edits": stats.get("failed_edits", 0),
+                "success_rate": (successful_edits / total_edits) * 100 if total_edits else 0.0,
+                "recent_edits": recent[0]["n"] if recent else 0,
+                "favorite_edit_types": stats.get("favorite_edit_types", {}),
+                "member_since": user_data.get("created_at"),
+                "last_seen": user_data.get("last_seen"),
+                "latest_edits": user_data.get("latest_edits", [])
             }
         except Exception as e:
             logger.error(f"Failed to get user stats for {telegram_user_id}: {e}")
@@ -143,9 +597,21 @@ class Database:
     
     # Image edit operations
     async def create_image_edit(self, image_edit: ImageEdit) -> bool:
-        """Create a new image edit request"""
+        """Create a new image edit request, batched with concurrent inserts"""
+        if not self._edit_writer:
+            return await self.create_image_edit_sync(image_edit)
+        
+        created = await self._edit_writer.submit(
+            InsertOne(image_edit.model_dump(by_alias=True))
+        )
+        if created:
+            logger.info(f"Created image edit request: {image_edit.id}")
+        return created
+    
+    async def create_image_edit_sync(self, image_edit: ImageEdit) -> bool:
+        """Create a new image edit request with its own insert_one round trip"""
         try:
-            await self.image_edits.insert_one(image_edit.dict(by_alias=True, exclude_unset=True))
+            await self.image_edits.insert_one(image_edit.model_dump(by_alias=True))
             logger.info(f"Created image edit request: {image_edit.id}")
             return True
         except Exception as e:
@@ -157,19 +623,31 @@ class Database:
         try:
             result = await self.image_edits.update_one(
                 {"_id": image_edit.id},
-                {"$set": image_edit.dict(by_alias=True, exclude_unset=True)}
+                {"$set": image_edit.model_dump(by_alias=True, exclude_unset=True)}
             )
             return result.modified_count > 0
         except Exception as e:
             logger.error(f"Failed to update image edit {image_edit.id}: {e}")
             return False
     
+    async def update_image_edit_status(self, image_edit: ImageEdit) -> bool:
+        """Persist only the fields changed by status transitions"""
+        try:
+            result = await self.image_edits.update_one(
+                {"_id": image_edit.id},
+                {"$set": image_edit.status_fields()}
+            )
+            return result.matched_count > 0
+        except Exception as e:
+            logger.error(f"Failed to update image edit status {image_edit.id}: {e}")
+            return False
+    
     async def get_image_edit(self, edit_id: str) -> Optional[ImageEdit]:
         """Get image edit by ID"""
         try:
             edit_data = await self.image_edits.find_one({"_id": edit_id})
             if edit_data:
-                return ImageEdit(**edit_data)
+                return ImageEdit.from_mongo(edit_data)
             return None
         except Exception as e:
             logger.error(f"Failed to get image edit {edit_id}: {e}")
@@ -178,11 +656,9 @@ class Database:
     async def get_pending_edits(self) -> List[ImageEdit]:
         """Get all pending image edits"""
         try:
-            cursor = self.image_edits.find({"status": EditStatus.PENDING})
-            edits = []
-            async for edit_data in cursor:
-                edits.append(ImageEdit(**edit_data))
-            return edits
+            cursor = self.image_edits.find({"status": _PENDING}).sort("created_at", 1).batch_size(EDIT_BATCH_SIZE)
+            docs = await cursor.to_list(length=None)
+            return await _edits_from_docs(docs)
         except Exception as e:
             logger.error(f"Failed to get pending edits: {e}")
             return []
@@ -190,11 +666,9 @@ class Database:
     async def get_processing_edits(self) -> List[ImageEdit]:
         """Get all processing image edits"""
         try:
-            cursor = self.image_edits.find({"status": EditStatus.PROCESSING})
-            edits = []
-            async for edit_data in cursor:
-                edits.append(ImageEdit(**edit_data))
-            return edits
+            cursor = self.image_edits.find({"status": _PROCESSING}).sort("created_at", 1).batch_size(EDIT_BATCH_SIZE)
+            docs = await cursor.to_list(length=None)
+            return await _edits_from_docs(docs)
         except Exception as e:
             logger.error(f"Failed to get processing edits: {e}")
             return []
@@ -206,36 +680,153 @@ class Database:
                 {"telegram_user_id": telegram_user_id}
             ).sort("created_at", -1).limit(limit)
             
-            edits = []
-            async for edit_data in cursor:
-                edits.append(ImageEdit(**edit_data))
-            return edits
+            docs = await cursor.to_list(length=limit)
+            return [ImageEdit.from_mongo(edit_data) for edit_data in docs]
         except Exception as e:
             logger.error(f"Failed to get user edits for {telegram_user_id}: {e}")
             return []
     
     # Analytics operations
     async def get_or_create_analytics(self) -> BotAnalytics:
-        """Get or create bot analytics"""
+        """Get or create bot analytics with a single atomic upsert"""
         try:
-            analytics_data = await self.analytics.find_one()
-            if analytics_data:
-                return BotAnalytics(**analytics_data)
-            else:
-                # Create new analytics document
-                analytics = BotAnalytics()
-                await self.analytics.insert_one(analytics.dict(by_alias=True, exclude_unset=True))
-                return analytics
+            defaults = BotAnalytics().model_dump(exclude={"id", "daily_stats"})
+            analytics_data = await self.analytics.find_one_and_update(
+                {"_id": ANALYTICS_ID},
+                {"$setOnInsert": defaults},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            return BotAnalytics.model_construct(**analytics_data)
         except Exception as e:
             logger.error(f"Failed to get/create analytics: {e}")
             return BotAnalytics()
     
+    async def get_performance_summary(self) -> Dict[str, Any]:
+        """
+        Get the analytics dashboard summary, computed server-side
+        
+        Only the summary fields and the top five edit types leave the server,
+        never the full popular_* counters.
+        
+        Returns:
+            Dictionary in the shape of BotAnalytics.get_performance_summary
+        """
+        try:
+            pipeline = [
+                {"$match": {"_id": ANALYTICS_ID}},
+                {"$project": {
+                    "_id": 0,
+                    "total_users": {"$ifNull": ["$total_users", 0]},
+                    "total_edits": {"$ifNull": ["$total_edits", 0]},
+                    "success_rate": {"$round": [{"$ifNull": ["$success_rate", 0]}, 2]},
+                    "average_processing_time": {"$round": [{"$ifNull": ["$average_processing_time", 0]}, 2]},
+                    "top_edit_types": {"$slice": [
+                        {"$sortArray": {
+                            "input": {"$objectToArray": {"$ifNull": ["$popular_edit_types", {}]}},
+                            "sortBy": {"v": -1}
+                        }},
+                        5
+                    ]},
+                    "last_updated": "$updated_at"
+                }}
+            ]
+            cursor = await self.analytics.aggregate(pipeline)
+            docs = await cursor.to_list(1)
+            if not docs:
+                return BotAnalytics().get_performance_summary()
+            
+            summary = docs[0]
+            summary["top_edit_types"] = [(item["k"], item["v"]) for item in summary["top_edit_types"]]
+            return summary
+        except Exception as e:
+            logger.error(f"Failed to get performance summary: {e}")
+            raise
+    
+    async def _migrate_legacy_analytics(self):
+        """Move an analytics document with a generated ObjectId to the fixed ANALYTICS_ID"""
+        try:
+            legacy = await self.analytics.find_one({"_id": {"$ne": ANALYTICS_ID}})
+            if not legacy:
+                return
+            
+            legacy_id = legacy.pop("_id")
+            legacy.pop("daily_stats", None)
+            try:
+                await self.analytics.insert_one({**legacy, "_id": ANALYTICS_ID})
+            except DuplicateKeyError:
+                logger.warning(f"Analytics document {ANALYTICS_ID} already exists; dropping legacy {legacy_id}")
+            await self.analytics.delete_one({"_id": legacy_id})
+            logger.info(f"Migrated analytics document {legacy_id} to {ANALYTICS_ID}")
+        except Exception as e:
+            logger.error(f"Failed to migrate legacy analytics: {e}")
+    
+    async def increment_analytics(self,
+                                  new_user: bool = False,
+                                  edit_success: Optional[bool] = None,
+                                  processing_time: Optional[float] = None,
+                                  edit_type: Optional[str] = None,
+                                  aspect_ratio: Optional[str] = None,
+                                  output_format: Optional[str] = None) -> bool:
+        """Record a new user and/or an edit in the totals and today's daily_analytics document"""
+        try:
+            day_key = datetime.utcnow().date().isoformat()
+            pipeline = _analytics_increment_pipeline(
+                new_user=new_user,
+                edit_success=edit_success,
+                processing_time=processing_time,
+                edit_type=edit_type,
+                aspect_ratio=aspect_ratio,
+                output_format=output_format
+            )
+            daily_pipeline = _daily_increment_pipeline(
+                day_key,
+                new_user=new_user,
+                edit_success=edit_success,
+                processing_time=processing_time,
+                edit_type=edit_type
+            )
+            if self._analytics_writer and self._daily_writer:
+                updated, _ = await asyncio.gather(
+                    self._analytics_writer.submit(UpdateOne({"_id": ANALYTICS_ID}, pipeline, upsert=True)),
+                    self._daily_writer.submit(UpdateOne({"_id": day_key}, daily_pipeline, upsert=True))
+                )
+                return updated
+            
+            result, _ = await asyncio.gather(
+                self.analytics.update_one({"_id": ANALYTICS_ID}, pipeline, upsert=True),
+                self.daily_analytics.update_one({"_id": day_key}, daily_pipeline, upsert=True)
+            )
+            return result.matched_count > 0 or result.upserted_id is not None
+        except Exception as e:
+            logger.error(f"Failed to increment analytics: {e}")
+            return False
+    
+    async def get_recent_daily_stats(self, days: int = 7) -> List[DailyStats]:
+        """
+        Get daily statistics for the last N days, newest first
+        
+        Args:
+            days: Number of days to look back
+            
+        Returns:
+            List of daily statistics
+        """
+        try:
+            cutoff = (datetime.utcnow().date() - timedelta(days=days - 1)).isoformat()
+            cursor = self.daily_analytics.find({"_id": {"$gte": cutoff}}).sort("_id", -1).limit(days)
+            docs = await cursor.to_list(length=days)
+            return [DailyStats(**day_data) for day_data in docs]
+        except Exception as e:
+            logger.error(f"Failed to get daily stats: {e}")
+            return []
+    
     async def update_analytics(self, analytics: BotAnalytics) -> bool:
         """Update bot analytics"""
         try:
             result = await self.analytics.update_one(
                 {"_id": analytics.id},
-                {"$set": analytics.dict(by_alias=True, exclude_unset=True)},
+                {"$set": analytics.model_dump(by_alias=True, exclude_unset=True, exclude={"daily_stats"})},
                 upsert=True
             )
             return result.modified_count > 0 or result.upserted_id is not None
@@ -4,12 +4,14 @@ Database models for MedusaXD AI Image Editor Bot
 
 from .user import User, UserStats
 from .image_edit import ImageEdit, EditStatus
-from .analytics import BotAnalytics
+from .analytics import ANALYTICS_ID, BotAnalytics, DailyStats
 
 __all__ = [
     "User",
     "UserStats", 
     "ImageEdit",
     "EditStatus",
-    "BotAnalytics"
+    "ANALYTICS_ID",
+    "BotAnalytics",
+    "DailyStats"
 ]
@@ -2,11 +2,13 @@
 Analytics model for MongoDB storage
 """
 
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from typing import Dict, List, Optional
-from pydantic import BaseModel, Field
-from bson import ObjectId
-from .user import PyObjectId
+from pydantic import BaseModel, ConfigDict, Field
+
+
+# Fixed _id of the single bot analytics document
+ANALYTICS_ID = "global"
 
 
 class DailyStats(BaseModel):
@@ -24,7 +26,13 @@ class DailyStats(BaseModel):
 
 class BotAnalytics(BaseModel):
     """Bot analytics model for MongoDB"""
-    id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
+    
+    model_config = ConfigDict(
+        populate_by_name=True,
+        arbitrary_types_allowed=True
+    )
+    
+    id: str = Field(default=ANALYTICS_ID, alias="_id")
     
     # Overall statistics
     total_users: int = 0
@@ -41,18 +49,13 @@ class BotAnalytics(BaseModel):
     popular_aspect_ratios: Dict[str, int] = Field(default_factory=dict)
     popular_output_formats: Dict[str, int] = Field(default_factory=dict)
     
-    # Daily statistics
+    # Daily statistics (in-memory only; persisted per day in the daily_analytics collection)
     daily_stats: List[DailyStats] = Field(default_factory=list)
     
     # Timestamps
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     
-    class Config:
-        allow_population_by_field_name = True
-        arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str, date: str}
-    
     def update_stats(self, 
                     new_user: bool = False,
                     edit_success: bool = True,
@@ -124,8 +127,8 @@ class BotAnalytics(BaseModel):
         self.updated_at = datetime.utcnow()
     
     def get_daily_stats(self, days: int = 7) -> List[DailyStats]:
-        """Get daily stats for the last N days"""
-        cutoff_date = date.today() - datetime.timedelta(days=days)
+        """Get in-memory daily stats for the last N days (see Database.get_recent_daily_stats for stored days)"""
+        cutoff_date = date.today() - timedelta(days=days)
         return [stat for stat in self.daily_stats if stat.date >= cutoff_date]
     
     def get_top_edit_types(self, limit: int = 5) -> List[tuple]:
@@ -2,14 +2,53 @@
 Image edit model for MongoDB storage
 """
 
+import re
 from datetime import datetime
 from typing import Optional, Dict, Any
 from enum import Enum
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, field_serializer
 from bson import ObjectId
 from .user import PyObjectId
 
 
+# Edit type keywords in priority order: when a prompt matches several
+# types, the one listed first wins
+EDIT_TYPE_KEYWORDS = {
+    "text_edit": ["replace", "text", "word", "letter", "font"],
+    "color_change": ["color", "colour", "red", "blue", "green", "yellow", "purple", "orange", "pink", "black", "white"],
+    "object_modification": ["remove", "delete", "add", "insert", "place"],
+    "background_change": ["background", "sky", "scene", "setting"],
+    "style_change": ["style", "artistic", "painting", "sketch", "cartoon"]
+}
+
+_EDIT_TYPE_PRIORITY = {edit_type: rank for rank, edit_type in enumerate(EDIT_TYPE_KEYWORDS)}
+
+# One alternation with a named group per edit type, so a single scan finds every type.
+# The lookahead matches zero-width at every offset, so keywords are found anywhere in
+# the prompt ("recolor", "scared") and overlapping keywords are never skipped
+_EDIT_TYPE_PATTERN = re.compile(
+    "(?=" + "|".join(
+        rf"(?P<{edit_type}>{'|'.join(keywords)})"
+        for edit_type, keywords in EDIT_TYPE_KEYWORDS.items()
+    ) + ")"
+)
+
+
+# Fields changed by status transitions (start_processing, complete_successfully,
+# fail_with_error, increment_retry and cancel)
+STATUS_FIELDS = {
+    "status",
+    "started_at",
+    "completed_at",
+    "processing_time_seconds",
+    "bfl_request_id",
+    "bfl_polling_url",
+    "edited_image_url",
+    "error_message",
+    "retry_count"
+}
+
+
 class EditStatus(str, Enum):
     """Status of image edit request"""
     PENDING = "pending"
@@ -19,9 +58,30 @@ class EditStatus(str, Enum):
     CANCELLED = "cancelled"
 
 
+_FINISHED_STATUSES = frozenset((EditStatus.COMPLETED, EditStatus.FAILED, EditStatus.CANCELLED))
+
+
 class ImageEdit(BaseModel):
     """Image edit request model for MongoDB"""
-    id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
+    
+    model_config = ConfigDict(
+        populate_by_name=True,
+        arbitrary_types_allowed=True,
+        json_schema_extra={
+            "example": {
+                "telegram_user_id": 123456789,
+                "telegram_message_id": 12345,
+                "prompt": "Change the car color to red",
+                "aspect_ratio": "1:1",
+                "output_format": "jpeg",
+                "status": "pending",
+                "edit_type": "color_change",
+                "tags": ["car", "color", "red"]
+            }
+        }
+    )
+    
+    id: PyObjectId = Field(default_factory=ObjectId, alias="_id")
     
     # User information
     user_id: PyObjectId
@@ -64,22 +124,15 @@ class ImageEdit(BaseModel):
     edit_type: Optional[str] = None  # e.g., "color_change", "text_edit", "object_removal"
     tags: list[str] = Field(default_factory=list)
     
-    class Config:
-        allow_population_by_field_name = True
-        arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str}
-        schema_extra = {
-            "example": {
-                "telegram_user_id": 123456789,
-                "telegram_message_id": 12345,
-                "prompt": "Change the car color to red",
-                "aspect_ratio": "1:1",
-                "output_format": "jpeg",
-                "status": "pending",
-                "edit_type": "color_change",
-                "tags": ["car", "color", "red"]
-            }
-        }
+    @field_serializer('id', 'user_id', when_used='json')
+    def serialize_object_id(self, value: ObjectId) -> str:
+        """Serialize ObjectIds as strings in JSON output"""
+        return str(value)
+    
+    @classmethod
+    def from_mongo(cls, data: Dict[str, Any]) -> 'ImageEdit':
+        """Create ImageEdit from a stored document without re-validating it"""
+        return cls.model_construct(**{**data, "status": EditStatus(data.get("status", EditStatus.PENDING))})
     
     def start_processing(self, bfl_request_id: str, bfl_polling_url: str):
         """Mark edit as started processing"""
@@ -127,10 +180,14 @@ class ImageEdit(BaseModel):
                 self.completed_at - self.started_at
             ).total_seconds()
     
+    def status_fields(self) -> Dict[str, Any]:
+        """Get the fields changed by status transitions, for a scoped update"""
+        return self.model_dump(include=STATUS_FIELDS)
+    
     @property
     def is_completed(self) -> bool:
         """Check if edit is completed (success or failure)"""
-        return self.status in [EditStatus.COMPLETED, EditStatus.FAILED, EditStatus.CANCELLED]
+        return self.status in _FINISHED_STATUSES
     
     @property
     def is_successful(self) -> bool:
@@ -139,26 +196,12 @@ class ImageEdit(BaseModel):
     
     def classify_edit_type(self) -> str:
         """Classify the edit type based on prompt"""
-        prompt_lower = self.prompt.lower()
-        
-        # Text editing
-        if any(word in prompt_lower for word in ["replace", "text", "word", "letter", "font"]):
-            return "text_edit"
-        
-        # Color changes
-        if any(word in prompt_lower for word in ["color", "colour", "red", "blue", "green", "yellow", "purple", "orange", "pink", "black", "white"]):
-            return "color_change"
-        
-        # Object removal/addition
-        if any(word in prompt_lower for word in ["remove", "delete", "add", "insert", "place"]):
-            return "object_modification"
-        
-        # Background changes
-        if any(word in prompt_lower for word in ["background", "sky", "scene", "setting"]):
-            return "background_change"
-        
-        # Style changes
-        if any(word in prompt_lower for word in ["style", "artistic", "painting", "sketch", "cartoon"]):
-            return "style_change"
+        best = None
+        for match in _EDIT_TYPE_PATTERN.finditer(self.prompt.lower()):
+            edit_type = match.lastgroup
+            if best is None or _EDIT_TYPE_PRIORITY[edit_type] < _EDIT_TYPE_PRIORITY[best]:
+                best = edit_type
+                if _EDIT_TYPE_PRIORITY[best] == 0:
+                    break
         
-        return "general_edit"
+        return best or "general_edit"
@@ -2,21 +2,33 @@
 User model for MongoDB storage
 """
 
+import re
 from datetime import datetime
-from typing import Optional, Dict, Any, Annotated
-from pydantic import BaseModel, Field, ConfigDict, field_validator, BeforeValidator
+from functools import cached_property, lru_cache
+from typing import Optional, Dict, Any, Annotated, Counter, Literal, Set
+from pydantic import BaseModel, Field, ConfigDict, PrivateAttr, field_serializer, field_validator, BeforeValidator
 from bson import ObjectId
 
 
+# 24 hex digits, the only string form of an ObjectId
+_OBJECT_ID_HEX = re.compile(r"[0-9a-fA-F]{24}").fullmatch
+
+
+@lru_cache(maxsize=4096)
+def _oid(hex_str: str) -> ObjectId:
+    """Parse an ObjectId hex string, reusing the result for repeat ids"""
+    return ObjectId(hex_str)
+
+
 def validate_object_id(v):
     """Validator function for ObjectId - Pydantic v2 compatible"""
-    if v is None:
-        return ObjectId()
     if isinstance(v, ObjectId):
         return v
+    if v is None:
+        return ObjectId()
     if isinstance(v, str):
-        if ObjectId.is_valid(v):
-            return ObjectId(v)
+        if _OBJECT_ID_HEX(v):
+            return _oid(v)
         raise ValueError("Invalid ObjectId string")
     raise ValueError(f"Invalid ObjectId type: {type(v)}")
 
@@ -24,20 +36,33 @@ def validate_object_id(v):
 # Use Annotated with BeforeValidator for Pydantic v2
 PyObjectId = Annotated[ObjectId, BeforeValidator(validate_object_id)]
 
+AspectRatio = Literal["1:1", "16:9", "9:16", "4:3", "3:4", "3:2", "2:3"]
+OutputFormat = Literal["jpeg", "png", "webp"]
+
+# Fields full_name is built from; assigning any of them drops the cached value
+_FULL_NAME_FIELDS = frozenset(("first_name", "last_name", "username", "telegram_user_id"))
+
 
 class UserStats(BaseModel):
     """User statistics model"""
     
-    model_config = ConfigDict(
-        json_encoders={ObjectId: str}
-    )
-    
     total_edits: int = 0
     successful_edits: int = 0
     failed_edits: int = 0
     total_images_processed: int = 0
-    favorite_edit_types: Dict[str, int] = Field(default_factory=dict)
+    favorite_edit_types: Counter[str] = Field(default_factory=Counter)
     last_edit_date: Optional[datetime] = None
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert to dictionary for MongoDB"""
+        return {
+            "total_edits": self.total_edits,
+            "successful_edits": self.successful_edits,
+            "failed_edits": self.failed_edits,
+            "total_images_processed": self.total_images_processed,
+            "favorite_edit_types": dict(self.favorite_edit_types),
+            "last_edit_date": self.last_edit_date
+        }
 
 
 class User(BaseModel):
@@ -46,7 +71,6 @@ class User(BaseModel):
     model_config = ConfigDict(
         populate_by_name=True,
         arbitrary_types_allowed=True,
-        json_encoders={ObjectId: str},
         json_schema_extra={
             "example": {
                 "telegram_user_id": 123456789,
@@ -71,8 +95,8 @@ class User(BaseModel):
     language_code: Optional[str] = "en"
     
     # User preferences
-    preferred_aspect_ratio: str = "1:1"
-    preferred_output_format: str = "jpeg"
+    preferred_aspect_ratio: AspectRatio = "1:1"
+    preferred_output_format: OutputFormat = "jpeg"
     
     # Timestamps
     created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -87,6 +111,21 @@ class User(BaseModel):
     is_premium: bool = False
     is_banned: bool = False
     
+    # Fields assigned since the user was loaded, for scoped $set updates
+    _dirty_fields: Set[str] = PrivateAttr(default_factory=set)
+    
+    def __setattr__(self, name: str, value: Any):
+        if name in self.model_fields:
+            self._dirty_fields.add(name)
+            if name in _FULL_NAME_FIELDS:
+                self.__dict__.pop("full_name", None)
+        super().__setattr__(name, value)
+    
+    @field_serializer('id', when_used='json')
+    def serialize_id(self, value: Optional[ObjectId]) -> Optional[str]:
+        """Serialize the ObjectId as a string in JSON output"""
+        return str(value) if value is not None else None
+    
     @field_validator('telegram_user_id')
     @classmethod
     def validate_telegram_user_id(cls, v):
@@ -94,46 +133,38 @@ class User(BaseModel):
             raise ValueError('telegram_user_id must be positive')
         return v
     
-    @field_validator('preferred_aspect_ratio')
-    @classmethod
-    def validate_aspect_ratio(cls, v):
-        valid_ratios = ["1:1", "16:9", "9:16", "4:3", "3:4", "3:2", "2:3"]
-        if v not in valid_ratios:
-            raise ValueError(f'aspect_ratio must be one of {valid_ratios}')
-        return v
-    
-    @field_validator('preferred_output_format')
+    @field_validator('preferred_output_format', mode='before')
     @classmethod
-    def validate_output_format(cls, v):
-        valid_formats = ["jpeg", "png", "webp"]
-        if v.lower() not in valid_formats:
-            raise ValueError(f'output_format must be one of {valid_formats}')
-        return v.lower()
+    def normalize_output_format(cls, v):
+        return v.lower() if isinstance(v, str) else v
     
     def update_last_seen(self):
         """Update the last seen timestamp"""
-        self.last_seen = datetime.utcnow()
-        self.updated_at = datetime.utcnow()
+        now = datetime.utcnow()
+        self.last_seen = now
+        self.updated_at = now
     
     def increment_edit_count(self, success: bool = True):
         """Increment edit statistics"""
         self.stats.total_edits += 1
         if success:
             self.stats.successful_edits += 1
+            counter = "stats.successful_edits"
         else:
             self.stats.failed_edits += 1
-        self.stats.last_edit_date = datetime.utcnow()
-        self.updated_at = datetime.utcnow()
+            counter = "stats.failed_edits"
+        now = datetime.utcnow()
+        self.stats.last_edit_date = now
+        self._dirty_fields.update(("stats.total_edits", counter, "stats.last_edit_date"))
+        self.updated_at = now
     
     def add_favorite_edit_type(self, edit_type: str):
         """Add or increment favorite edit type"""
-        if edit_type in self.stats.favorite_edit_types:
-            self.stats.favorite_edit_types[edit_type] += 1
-        else:
-            self.stats.favorite_edit_types[edit_type] = 1
+        self.stats.favorite_edit_types[edit_type] += 1
+        self._dirty_fields.add(f"stats.favorite_edit_types.{edit_type}")
         self.updated_at = datetime.utcnow()
     
-    @property
+    @cached_property
     def full_name(self) -> str:
         """Get user's full name"""
         if self.first_name and self.last_name:
@@ -154,28 +185,74 @@ class User(BaseModel):
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert to dictionary for MongoDB insertion"""
-        data = self.model_dump(by_alias=True)
-        # Ensure ObjectId is properly handled
-        if '_id' not in data or data['_id'] is None:
-            data['_id'] = ObjectId()
-        elif isinstance(data['_id'], str):
-            data['_id'] = ObjectId(data['_id'])
-        return data
+        _id = self.id or ObjectId()
+        return {
+            "_id": _oid(_id) if isinstance(_id, str) else _id,
+            "telegram_user_id": self.telegram_user_id,
+            "username": self.username,
+            "first_name": self.first_name,
+            "last_name": self.last_name,
+            "language_code": self.language_code,
+            "preferred_aspect_ratio": self.preferred_aspect_ratio,
+            "preferred_output_format": self.preferred_output_format,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "last_seen": self.last_seen,
+            "stats": self.stats.to_dict(),
+            "is_active": self.is_active,
+            "is_premium": self.is_premium,
+            "is_banned": self.is_banned
+        }
     
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'User':
-        """Create User instance from dictionary"""
+        """Create User instance from a trusted dictionary, such as a stored document"""
+        return cls.from_mongo(data)
+    
+    @classmethod
+    def from_dict_validated(cls, data: Dict[str, Any]) -> 'User':
+        """Create User instance from untrusted input, running full validation"""
         return cls(**data)
     
+    @classmethod
+    def from_mongo(cls, data: Dict[str, Any]) -> 'User':
+        """Create User instance from a stored document without re-validating it"""
+        stats = data.get("stats")
+        if stats:
+            stats = UserStats.model_construct(**{
+                **stats,
+                "favorite_edit_types": Counter(stats.get("favorite_edit_types") or {})
+            })
+        return cls.model_construct(**{**data, "stats": stats or UserStats()})
+    
     def model_dump_for_mongo(self) -> Dict[str, Any]:
-        """Dump model data specifically formatted for MongoDB"""
-        data = self.model_dump(by_alias=True, exclude_unset=True)
+        """
+        Dump only the fields changed since load, for a MongoDB $set
         
-        # Handle ObjectId conversion
-        if '_id' in data and data['_id'] is not None:
-            if isinstance(data['_id'], str):
-                data['_id'] = ObjectId(data['_id'])
-        elif '_id' not in data:
-            data['_id'] = ObjectId()
-            
-        return data
+        Stats counters bumped by the mutators are emitted as dotted paths
+        (``stats.total_edits``) so the rest of the stats document is not
+        re-encoded. A wholesale ``stats`` assignment takes precedence.
+        
+        Returns:
+            Mapping of field or dotted path to its current value
+        """
+        fields = {}
+        whole_stats = "stats" in self._dirty_fields
+        for path in self._dirty_fields:
+            if path == "id":
+                continue
+            if path == "stats":
+                fields[path] = self.stats.to_dict()
+            elif path.startswith("stats."):
+                if whole_stats:
+                    continue
+                _, name, *key = path.split(".", 2)
+                value = getattr(self.stats, name)
+                fields[path] = value[key[0]] if key else value
+            else:
+                fields[path] = getattr(self, path)
+        return fields
+    
+    def mark_clean(self):
+        """Forget changed fields once they have been written"""
+        self._dirty_fields.clear()
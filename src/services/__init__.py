@@ -1,13 +1,36 @@
 """
 Services for MedusaXD AI Image Editor Bot
+
+Exports are imported on first access, so importing one service (the web
+interface only needs UserService) does not load Pillow or aiohttp.
 """
 
-from .bfl_api import BFLAPIService
-from .image_processor import ImageProcessor
-from .user_service import UserService
+import importlib
+
+# Public name -> submodule that defines it
+_EXPORTS = {
+    "BFLAPIService": ".bfl_api",
+    "get_shared_service": ".bfl_api",
+    "get_shared_session": ".bfl_api",
+    "close_shared_session": ".bfl_api",
+    "ImageProcessor": ".image_processor",
+    "UserService": ".user_service"
+}
 
 __all__ = [
     "BFLAPIService",
+    "get_shared_service",
+    "get_shared_session",
+    "close_shared_session",
     "ImageProcessor", 
     "UserService"
 ]
+
+
+def __getattr__(name: str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
@@ -3,30 +3,139 @@ BFL.ai API service for image editing
 """
 
 import asyncio
-import base64
+import io
+import random
 import aiohttp
-from typing import Optional, Dict, Any, Tuple
+import orjson
+import pybase64
+from typing import Optional, Dict, Any, Tuple, Union
 from loguru import logger
 
 from ..config import settings, BFL_ENDPOINTS
 from ..models import ImageEdit, EditStatus
 
 
+# Polling backoff: start fast, grow by 1.5x per attempt up to the polling
+# interval, plus a little jitter so concurrent edits don't poll in lockstep
+POLL_INITIAL_DELAY = 0.5
+POLL_BACKOFF_FACTOR = 1.5
+POLL_JITTER = 0.2
+
+# Polling statuses reported by BFL.ai besides "Ready"
+FAILED_STATUSES = frozenset(("Error", "Failed"))
+IN_PROGRESS_STATUSES = frozenset(("Pending", "Processing"))
+
+# Connection pool shared by every edit: total sockets, sockets per host
+# (the API and the result delivery host), DNS cache and keep-alive seconds
+CONNECTION_LIMIT = 100
+CONNECTION_LIMIT_PER_HOST = 32
+DNS_CACHE_TTL = 300
+KEEPALIVE_TIMEOUT = 75
+
+# Read size when streaming result downloads
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
 class BFLAPIError(Exception):
     """Custom exception for BFL.ai API errors"""
     pass
 
 
+class BFLRateLimitError(BFLAPIError):
+    """Raised when BFL.ai asks us to back off, with its Retry-After delay if given"""
+    
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given in seconds"""
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
+
+
+def _orjson_dumps(obj: Any) -> str:
+    """JSON serializer for aiohttp's json= argument, backed by orjson"""
+    return orjson.dumps(obj).decode()
+
+
+_shared_session: Optional[aiohttp.ClientSession] = None
+_shared_service: Optional['BFLAPIService'] = None
+
+
+def _create_session() -> aiohttp.ClientSession:
+    """Create an aiohttp session configured for the BFL.ai API"""
+    timeout = aiohttp.ClientTimeout(total=300)  # 5 minutes timeout
+    # Keep connections alive between requests to skip repeated TLS handshakes
+    connector = aiohttp.TCPConnector(
+        limit=CONNECTION_LIMIT,
+        limit_per_host=CONNECTION_LIMIT_PER_HOST,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        keepalive_timeout=KEEPALIVE_TIMEOUT
+    )
+    return aiohttp.ClientSession(
+        timeout=timeout,
+        connector=connector,
+        json_serialize=_orjson_dumps,
+        headers={
+            "accept": "application/json",
+            "x-key": settings.bfl_api_key,
+            "Content-Type": "application/json"
+        }
+    )
+
+
+async def get_shared_session() -> aiohttp.ClientSession:
+    """
+    Get the process-wide BFL.ai session, creating it on first use
+    
+    There is no await between the check and the assignment, so concurrent
+    callers on the event loop can never create two sessions.
+    """
+    global _shared_session
+    if _shared_session is None or _shared_session.closed:
+        _shared_session = _create_session()
+    return _shared_session
+
+
+async def get_shared_service() -> 'BFLAPIService':
+    """Get the process-wide BFL.ai service, bound to the shared session"""
+    global _shared_service
+    session = await get_shared_session()
+    if _shared_service is None or _shared_service.session is not session:
+        _shared_service = BFLAPIService(session)
+    return _shared_service
+
+
+async def close_shared_session():
+    """Close the process-wide BFL.ai session"""
+    global _shared_session, _shared_service
+    _shared_service = None
+    if _shared_session is not None:
+        await _shared_session.close()
+        _shared_session = None
+
+
 class BFLAPIService:
     """Service for interacting with BFL.ai API"""
     
-    def __init__(self):
+    def __init__(self, session: Optional[aiohttp.ClientSession] = None):
         self.base_url = settings.bfl_api_base_url
         self.api_key = settings.bfl_api_key
-        self.session: Optional[aiohttp.ClientSession] = None
+        # A session passed in is shared and owned by the caller
+        self.session: Optional[aiohttp.ClientSession] = session
+        self._owns_session = session is None
     
     async def __aenter__(self):
-        """Async context manager entry"""
+        """
+        Async context manager entry
+        
+        Opens a private session for the block. Request handlers should use
+        get_shared_service() instead, which keeps connections warm.
+        """
         await self.start_session()
         return self
     
@@ -37,21 +146,14 @@ class BFLAPIService:
     async def start_session(self):
         """Start aiohttp session"""
         if not self.session:
-            timeout = aiohttp.ClientTimeout(total=300)  # 5 minutes timeout
-            self.session = aiohttp.ClientSession(
-                timeout=timeout,
-                headers={
-                    "accept": "application/json",
-                    "x-key": self.api_key,
-                    "Content-Type": "application/json"
-                }
-            )
+            self.session = _create_session()
+            self._owns_session = True
     
     async def close_session(self):
-        """Close aiohttp session"""
-        if self.session:
+        """Close aiohttp session (shared sessions are left open)"""
+        if self.session and self._owns_session:
             await self.session.close()
-            self.session = None
+        self.session = None
     
     async def create_edit_request(self, 
                                 prompt: str, 
@@ -83,31 +185,33 @@ class BFLAPIService:
             payload["seed"] = seed
         
         try:
-            logger.info(f"Creating edit request with prompt: {prompt[:50]}...")
+            logger.info("Creating edit request with prompt: {}...", prompt[:50])
             
-            async with self.session.post(url, json=payload) as response:
+            # Serialize with orjson straight to bytes; the session already sends
+            # a JSON Content-Type header
+            async with self.session.post(url, data=orjson.dumps(payload)) as response:
                 if response.status != 200:
                     error_text = await response.text()
-                    logger.error(f"BFL.ai API error {response.status}: {error_text}")
+                    logger.error("BFL.ai API error {}: {}", response.status, error_text)
                     raise BFLAPIError(f"API request failed with status {response.status}: {error_text}")
                 
-                data = await response.json()
+                data = orjson.loads(await response.read())
                 
                 request_id = data.get("id")
                 polling_url = data.get("polling_url")
                 
                 if not request_id or not polling_url:
-                    logger.error(f"Invalid API response: {data}")
+                    logger.error("Invalid API response: {}", data)
                     raise BFLAPIError("Invalid response from BFL.ai API")
                 
-                logger.info(f"Edit request created successfully: {request_id}")
+                logger.info("Edit request created successfully: {}", request_id)
                 return request_id, polling_url
                 
         except aiohttp.ClientError as e:
-            logger.error(f"Network error creating edit request: {e}")
+            logger.error("Network error creating edit request: {}", e)
             raise BFLAPIError(f"Network error: {e}")
         except Exception as e:
-            logger.error(f"Unexpected error creating edit request: {e}")
+            logger.error("Unexpected error creating edit request: {}", e)
             raise BFLAPIError(f"Unexpected error: {e}")
     
     async def poll_result(self, polling_url: str) -> Dict[str, Any]:
@@ -122,21 +226,43 @@ class BFLAPIService:
         
         try:
             async with self.session.get(polling_url) as response:
+                if response.status == 429:
+                    raise BFLRateLimitError(
+                        "Polling rate limited",
+                        retry_after=_parse_retry_after(response.headers.get("Retry-After"))
+                    )
                 if response.status != 200:
                     error_text = await response.text()
-                    logger.error(f"Polling error {response.status}: {error_text}")
+                    logger.error("Polling error {}: {}", response.status, error_text)
                     raise BFLAPIError(f"Polling failed with status {response.status}")
                 
-                data = await response.json()
+                data = orjson.loads(await response.read())
                 return data
                 
+        except BFLAPIError:
+            raise
         except aiohttp.ClientError as e:
-            logger.error(f"Network error polling result: {e}")
+            logger.error("Network error polling result: {}", e)
             raise BFLAPIError(f"Network error: {e}")
         except Exception as e:
-            logger.error(f"Unexpected error polling result: {e}")
+            logger.error("Unexpected error polling result: {}", e)
             raise BFLAPIError(f"Unexpected error: {e}")
     
+    @staticmethod
+    def get_poll_delay(attempt: int, max_delay: float) -> float:
+        """
+        Get the delay before the next poll
+        
+        Args:
+            attempt: Zero-based polling attempt
+            max_delay: Upper bound for the backoff (before jitter)
+            
+        Returns:
+            Delay in seconds
+        """
+        delay = min(max_delay, POLL_INITIAL_DELAY * POLL_BACKOFF_FACTOR ** attempt)
+        return delay + random.uniform(0, POLL_JITTER)
+    
     async def wait_for_completion(self, 
                                 polling_url: str, 
                                 max_attempts: int = None,
@@ -144,6 +270,10 @@ class BFLAPIService:
         """
         Wait for edit completion by polling
         
+        Polls with exponential backoff capped at the polling interval. The
+        backoff restarts whenever the job changes status, and a Retry-After
+        from a rate-limited poll replaces the computed delay.
+        
         Returns:
             Final result data
         """
@@ -151,36 +281,43 @@ class BFLAPIService:
         polling_interval = polling_interval or settings.polling_interval_seconds
         
         attempt = 0
+        backoff_step = 0
+        last_status = None
         
         while attempt < max_attempts:
             try:
                 result = await self.poll_result(polling_url)
                 status = result.get("status")
                 
-                logger.debug(f"Polling attempt {attempt + 1}: status = {status}")
+                logger.debug("Polling attempt {}: status = {}", attempt + 1, status)
                 
                 if status == "Ready":
                     logger.info("Edit completed successfully")
                     return result
-                elif status in ["Error", "Failed"]:
+                elif status in FAILED_STATUSES:
                     error_msg = result.get("message", "Unknown error")
-                    logger.error(f"Edit failed: {error_msg}")
+                    logger.error("Edit failed: {}", error_msg)
                     raise BFLAPIError(f"Edit failed: {error_msg}")
-                elif status in ["Pending", "Processing"]:
-                    # Continue polling
-                    await asyncio.sleep(polling_interval)
-                    attempt += 1
-                else:
-                    logger.warning(f"Unexpected status: {status}")
-                    await asyncio.sleep(polling_interval)
-                    attempt += 1
+                elif status not in IN_PROGRESS_STATUSES:
+                    logger.warning("Unexpected status: {}", status)
+                
+                if status != last_status:
+                    backoff_step = 0
+                    last_status = status
+                delay = self.get_poll_delay(backoff_step, polling_interval)
                     
+            except BFLRateLimitError as e:
+                logger.warning("Polling rate limited, retrying after {}s", e.retry_after)
+                delay = e.retry_after if e.retry_after is not None else self.get_poll_delay(backoff_step, polling_interval)
             except BFLAPIError:
                 raise
             except Exception as e:
-                logger.error(f"Error during polling: {e}")
-                attempt += 1
-                await asyncio.sleep(polling_interval)
+                logger.error("Error during polling: {}", e)
+                delay = self.get_poll_delay(backoff_step, polling_interval)
+            
+            await asyncio.sleep(delay)
+            backoff_step += 1
+            attempt += 1
         
         raise BFLAPIError(f"Edit timed out after {max_attempts} attempts")
     
@@ -195,23 +332,39 @@ class BFLAPIService:
             await self.start_session()
         
         try:
-            logger.info(f"Downloading image from: {image_url}")
+            logger.info("Downloading image from: {}", image_url)
             
             async with self.session.get(image_url) as response:
                 if response.status != 200:
                     error_text = await response.text()
-                    logger.error(f"Image download error {response.status}: {error_text}")
+                    logger.error("Image download error {}: {}", response.status, error_text)
                     raise BFLAPIError(f"Failed to download image: {response.status}")
                 
-                image_data = await response.read()
-                logger.info(f"Downloaded image: {len(image_data)} bytes")
+                # Refuse oversized images before allocating anything for them
+                if response.content_length is not None and not self.validate_image_size_header(response.content_length):
+                    raise BFLAPIError(f"Image too large: {response.content_length} bytes")
+                
+                # Copy each chunk into one growing buffer as it arrives, so the
+                # received chunks and the final image never coexist in memory
+                max_size = settings.max_image_size_mb * 1024 * 1024
+                buffer = io.BytesIO()
+                async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                    if buffer.tell() + len(chunk) > max_size:
+                        raise BFLAPIError(f"Image too large: more than {max_size} bytes")
+                    buffer.write(chunk)
+                
+                # getvalue() hands over the buffer's bytes without another copy
+                image_data = buffer.getvalue()
+                logger.info("Downloaded image: {} bytes", len(image_data))
                 return image_data
                 
+        except BFLAPIError:
+            raise
         except aiohttp.ClientError as e:
-            logger.error(f"Network error downloading image: {e}")
+            logger.error("Network error downloading image: {}", e)
             raise BFLAPIError(f"Network error: {e}")
         except Exception as e:
-            logger.error(f"Unexpected error downloading image: {e}")
+            logger.error("Unexpected error downloading image: {}", e)
             raise BFLAPIError(f"Unexpected error: {e}")
     
     async def process_edit_request(self, image_edit: ImageEdit, input_image_base64: str) -> str:
@@ -246,21 +399,21 @@ class BFLAPIService:
             return edited_image_url
             
         except Exception as e:
-            logger.error(f"Error processing edit request: {e}")
+            logger.error("Error processing edit request: {}", e)
             raise
     
     @staticmethod
-    def encode_image_to_base64(image_bytes: bytes) -> str:
+    def encode_image_to_base64(image_bytes: Union[bytes, bytearray, memoryview]) -> str:
         """
         Encode image bytes to base64 string
         
         Args:
-            image_bytes: Raw image bytes
+            image_bytes: Raw image bytes or any buffer-protocol object (no copy is made)
             
         Returns:
             Base64 encoded string
         """
-        return base64.b64encode(image_bytes).decode("utf-8")
+        return pybase64.b64encode_as_string(image_bytes)
     
     @staticmethod
     def validate_image_size(image_bytes: bytes) -> bool:
@@ -273,8 +426,20 @@ class BFLAPIService:
         Returns:
             True if valid, False otherwise
         """
-        size_mb = len(image_bytes) / (1024 * 1024)
-        return size_mb <= settings.max_image_size_mb
+        return BFLAPIService.validate_image_size_header(len(image_bytes))
+    
+    @staticmethod
+    def validate_image_size_header(size: int) -> bool:
+        """
+        Validate an image size in bytes, e.g. from Content-Length, against BFL.ai limits
+        
+        Args:
+            size: Image size in bytes
+            
+        Returns:
+            True if valid, False otherwise
+        """
+        return size <= settings.max_image_size_mb * 1024 * 1024
 
     async def health_check(self) -> bool:
         """
@@ -292,5 +457,5 @@ class BFLAPIService:
             async with self.session.get(url) as response:
                 return response.status == 200
         except Exception as e:
-            logger.warning(f"BFL.ai API health check failed: {e}")
+            logger.warning("BFL.ai API health check failed: {}", e)
             return False
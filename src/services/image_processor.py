@@ -4,17 +4,157 @@ Image processing service for handling image operations
 
 import io
 import os
+import struct
 import tempfile
 from typing import Optional, Tuple, Dict, Any, Union
 from PIL import Image, ImageFile
+# Register the supported formats' plugins up front: Image.open() only preloads
+# a few built-ins and otherwise imports every plugin on the first WEBP it sees
+from PIL import JpegImagePlugin, PngImagePlugin, WebPImagePlugin  # noqa: F401
 from loguru import logger
 
-from ..config import settings, SUPPORTED_IMAGE_FORMATS, MAX_IMAGE_PIXELS
+from ..config import settings, SUPPORTED_IMAGE_FORMATS, SUPPORTED_IMAGE_FORMATS_STR, MAX_IMAGE_PIXELS
 
 
 # Allow loading of truncated images
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 
+# MIME types for the supported PIL formats
+MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp"
+}
+
+# Memory-backed directory for temporary images, if this system has one
+MEMORY_TEMP_DIR = "/dev/shm" if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK) else None
+
+# Resampling filters selectable with RESAMPLE_FILTER
+RESAMPLE_FILTERS = {
+    "lanczos": Image.Resampling.LANCZOS,
+    "bicubic": Image.Resampling.BICUBIC,
+    "bilinear": Image.Resampling.BILINEAR
+}
+
+# JPEG qualities searched below the initial quality-95 attempt, the most
+# encodes spent searching, and how close to the limit counts as good enough
+JPEG_QUALITY_RANGE = (10, 85)
+JPEG_QUALITY_SEARCH_STEPS = 4
+JPEG_QUALITY_TOLERANCE = 0.05
+
+# Safety margin on the scale estimated from the last resize attempt, and
+# the smallest step between attempts
+RESIZE_SCALE_MARGIN = 0.95
+RESIZE_MIN_STEP = 0.05
+
+# JPEG start-of-frame markers carrying the image dimensions (excludes DHT/JPG/DAC)
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def _parse_jpeg_size(data) -> Optional[Tuple[int, int]]:
+    """Find the first SOF segment and read its dimensions"""
+    offset = 2
+    data_len = len(data)
+    while offset + 9 <= data_len:
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:  # Fill byte
+            offset += 1
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            height, width = struct.unpack(">HH", data[offset + 5:offset + 9])
+            return width, height
+        if marker == 0xDA:  # Start of scan without a frame header
+            return None
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:  # Standalone markers
+            offset += 2
+            continue
+        segment_length = struct.unpack(">H", data[offset + 2:offset + 4])[0]
+        offset += 2 + segment_length
+    return None
+
+
+def _parse_image_header(data) -> Optional[Tuple[str, int, int]]:
+    """
+    Read format and dimensions from the image header without decoding pixels
+    
+    Returns:
+        Tuple of (PIL format name, width, height), or None if the header is not
+        a recognised JPEG/PNG/WEBP header
+    """
+    if data[:3] == b"\xff\xd8\xff":
+        size = _parse_jpeg_size(data)
+        return ("JPEG", *size) if size else None
+    
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and data[12:16] == b"IHDR":
+        width, height = struct.unpack(">II", data[16:24])
+        return "PNG", width, height
+    
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP" and len(data) >= 30:
+        chunk = data[12:16]
+        if chunk == b"VP8 " and data[23:26] == b"\x9d\x01\x2a":
+            width, height = struct.unpack("<HH", data[26:30])
+            return "WEBP", width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L" and data[20] == 0x2F:
+            b1, b2, b3, b4 = data[21:25]
+            width = 1 + (b1 | ((b2 & 0x3F) << 8))
+            height = 1 + ((b2 >> 6) | (b3 << 2) | ((b4 & 0x0F) << 10))
+            return "WEBP", width, height
+        if chunk == b"VP8X":
+            width = 1 + int.from_bytes(data[24:27], "little")
+            height = 1 + int.from_bytes(data[27:30], "little")
+            return "WEBP", width, height
+    
+    return None
+
+
+ImageBuffer = Union[bytes, bytearray, memoryview]
+
+
+class _BufferReader(io.RawIOBase):
+    """Seekable read-only stream over a bytearray or memoryview, without copying it"""
+    
+    def __init__(self, data: ImageBuffer):
+        self._view = memoryview(data).cast("B")
+        self._pos = 0
+    
+    def readable(self) -> bool:
+        return True
+    
+    def seekable(self) -> bool:
+        return True
+    
+    def readinto(self, buffer) -> int:
+        chunk = self._view[self._pos:self._pos + len(buffer)]
+        size = len(chunk)
+        buffer[:size] = chunk
+        self._pos += size
+        return size
+    
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._pos = max(0, offset)
+        return self._pos
+    
+    def tell(self) -> int:
+        return self._pos
+
+
+def _open_stream(image_data: ImageBuffer) -> io.IOBase:
+    """
+    Wrap image data in a file object for PIL
+    
+    BytesIO shares an immutable bytes object, but would copy a bytearray or
+    memoryview, so those are read in place instead.
+    """
+    if isinstance(image_data, bytes):
+        return io.BytesIO(image_data)
+    return _BufferReader(image_data)
+
 
 class ImageProcessingError(Exception):
     """Custom exception for image processing errors"""
@@ -25,21 +165,17 @@ class ImageProcessor:
     """Service for image processing operations"""
     
     @staticmethod
-    def validate_image(image_data: Union[bytes, bytearray]) -> Dict[str, Any]:
+    def validate_image(image_data: ImageBuffer) -> Dict[str, Any]:
         """
         Validate image format, size, and properties
         
         Args:
-            image_data: Raw image bytes or bytearray
+            image_data: Raw image bytes, bytearray or memoryview
             
         Returns:
             Dictionary with validation results and image info
         """
         try:
-            # Convert bytearray to bytes if needed
-            if isinstance(image_data, bytearray):
-                image_data = bytes(image_data)
-            
             # Check file size
             size_mb = len(image_data) / (1024 * 1024)
             if size_mb > settings.max_image_size_mb:
@@ -47,23 +183,22 @@ class ImageProcessor:
                     f"Image too large: {size_mb:.1f}MB (max: {settings.max_image_size_mb}MB)"
                 )
             
-            # Open and validate image with PIL
+            # Open the image once: the header gives format/mode/size and verify()
+            # checks integrity without a second decode
             try:
-                image = Image.open(io.BytesIO(image_data))
+                image = Image.open(_open_stream(image_data))
+                image_format, image_mode = image.format, image.mode
+                width, height = image.size
                 image.verify()  # Verify image integrity
                 
-                # Re-open for getting info (verify() closes the image)
-                image = Image.open(io.BytesIO(image_data))
-                
                 # Check image format
-                if image.format not in SUPPORTED_IMAGE_FORMATS:
+                if image_format not in SUPPORTED_IMAGE_FORMATS:
                     raise ImageProcessingError(
-                        f"Unsupported format: {image.format} "
-                        f"(supported: {', '.join(SUPPORTED_IMAGE_FORMATS)})"
+                        f"Unsupported format: {image_format} "
+                        f"(supported: {SUPPORTED_IMAGE_FORMATS_STR})"
                     )
                 
                 # Check image dimensions and pixel count
-                width, height = image.size
                 pixel_count = width * height
                 
                 if pixel_count > MAX_IMAGE_PIXELS:
@@ -73,17 +208,12 @@ class ImageProcessor:
                     )
                 
                 # Determine MIME type from PIL format
-                mime_type_map = {
-                    "JPEG": "image/jpeg",
-                    "PNG": "image/png", 
-                    "WEBP": "image/webp"
-                }
-                mime_type = mime_type_map.get(image.format, "application/octet-stream")
+                mime_type = MIME_TYPES.get(image_format, "application/octet-stream")
                 
                 return {
                     "valid": True,
-                    "format": image.format,
-                    "mode": image.mode,
+                    "format": image_format,
+                    "mode": image_mode,
                     "size": (width, height),
                     "pixel_count": pixel_count,
                     "file_size_mb": size_mb,
@@ -96,18 +226,76 @@ class ImageProcessor:
         except ImageProcessingError:
             raise
         except Exception as e:
-            logger.error(f"Unexpected error validating image: {e}")
+            logger.error("Unexpected error validating image: {}", e)
             raise ImageProcessingError(f"Image validation failed: {e}")
     
     @staticmethod
-    def optimize_image(image_data: Union[bytes, bytearray], 
+    def quick_dims(image_data: ImageBuffer) -> Optional[Tuple[str, int, int]]:
+        """
+        Read format and dimensions from the header bytes only
+        
+        Returns:
+            Tuple of (format, width, height), or None for unrecognised or truncated headers
+        """
+        try:
+            return _parse_image_header(image_data)
+        except struct.error:
+            return None
+    
+    @staticmethod
+    def validate_image_fast(image_data: ImageBuffer,
+                            declared_mime: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Validate an image from its header bytes without decoding pixels
+        
+        Falls back to the full validate_image() when the header cannot be parsed
+        or does not match the declared MIME type.
+        
+        Args:
+            image_data: Raw image bytes, bytearray or memoryview
+            declared_mime: MIME type reported by the client, if any
+            
+        Returns:
+            Dictionary with validation results and image info
+        """
+        size_mb = len(image_data) / (1024 * 1024)
+        if size_mb > settings.max_image_size_mb:
+            raise ImageProcessingError(
+                f"Image too large: {size_mb:.1f}MB (max: {settings.max_image_size_mb}MB)"
+            )
+        
+        header = ImageProcessor.quick_dims(image_data)
+        if header is None or (declared_mime and MIME_TYPES[header[0]] != declared_mime):
+            return ImageProcessor.validate_image(image_data)
+        
+        image_format, width, height = header
+        pixel_count = width * height
+        
+        if pixel_count > MAX_IMAGE_PIXELS:
+            raise ImageProcessingError(
+                f"Image too large: {pixel_count:,} pixels "
+                f"(max: {MAX_IMAGE_PIXELS:,} pixels)"
+            )
+        
+        return {
+            "valid": True,
+            "format": image_format,
+            "size": (width, height),
+            "pixel_count": pixel_count,
+            "file_size_mb": size_mb,
+            "mime_type": MIME_TYPES[image_format]
+        }
+    
+    @staticmethod
+    def optimize_image(image_data: Union[ImageBuffer, Image.Image], 
                       max_size_mb: Optional[float] = None,
                       target_format: str = "JPEG") -> bytes:
         """
         Optimize image for processing
         
         Args:
-            image_data: Raw image bytes or bytearray
+            image_data: Raw image bytes, bytearray or memoryview, or an image the caller
+                already opened (its header is not parsed again)
             max_size_mb: Maximum file size in MB
             target_format: Target image format
             
@@ -115,11 +303,13 @@ class ImageProcessor:
             Optimized image bytes
         """
         try:
-            # Convert bytearray to bytes if needed
-            if isinstance(image_data, bytearray):
-                image_data = bytes(image_data)
-            
-            image = Image.open(io.BytesIO(image_data))
+            if isinstance(image_data, Image.Image):
+                image = image_data
+            else:
+                image = Image.open(_open_stream(image_data))
+            max_size_bytes = (max_size_mb or settings.max_image_size_mb) * 1024 * 1024
+            # Encoded JPEG bytes can be reopened for a reduced-scale decode if resizing is needed
+            reopen_as_draft = image.format == "JPEG" and not isinstance(image_data, Image.Image)
             
             # Convert to RGB if necessary (for JPEG)
             if target_format.upper() == "JPEG" and image.mode in ("RGBA", "P", "LA"):
@@ -130,37 +320,90 @@ class ImageProcessor:
                 background.paste(image, mask=image.split()[-1] if image.mode == "RGBA" else None)
                 image = background
             
-            # Start with high quality
-            quality = 95
-            max_size_bytes = (max_size_mb or settings.max_image_size_mb) * 1024 * 1024
+            is_jpeg = target_format.upper() == "JPEG"
+            output = io.BytesIO()
             
-            while quality > 10:
-                output = io.BytesIO()
-                
-                # Save with current quality
-                save_kwargs = {"format": target_format, "optimize": True}
-                if target_format.upper() == "JPEG":
-                    save_kwargs["quality"] = quality
-                
-                image.save(output, **save_kwargs)
-                output_bytes = output.getvalue()
+            def encode(quality: int, final: bool = False) -> bytes:
+                # Reuse one buffer across attempts
+                output.seek(0)
+                output.truncate()
+                return ImageProcessor._encode(image, output, target_format, quality, final)
+            
+            # Most images fit at high quality on the first try, so that
+            # attempt is encoded with the final settings straight away
+            output_bytes = encode(95, final=True)
+            if len(output_bytes) <= max_size_bytes:
+                logger.info("Image optimized: {} bytes at quality 95", len(output_bytes))
+                return output_bytes
+            
+            # Binary-search the highest JPEG quality that fits, stopping early
+            # once a result lands within tolerance of the limit
+            smallest_size = len(output_bytes)
+            if is_jpeg:
+                best = None
+                low, high = JPEG_QUALITY_RANGE
+                for _ in range(JPEG_QUALITY_SEARCH_STEPS):
+                    if low > high:
+                        break
+                    quality = (low + high) // 2
+                    candidate = encode(quality)
+                    if len(candidate) <= max_size_bytes:
+                        best = (quality, candidate)
+                        if (max_size_bytes - len(candidate)) / max_size_bytes < JPEG_QUALITY_TOLERANCE:
+                            break
+                        low = quality + 1
+                    else:
+                        smallest_size = min(smallest_size, len(candidate))
+                        high = quality - 1
                 
-                # Check if size is acceptable
-                if len(output_bytes) <= max_size_bytes:
-                    logger.info(f"Image optimized: {len(output_bytes)} bytes at quality {quality}")
+                if best:
+                    quality, output_bytes = best
+                    final_bytes = encode(quality, final=True)
+                    if len(final_bytes) <= max_size_bytes:
+                        output_bytes = final_bytes
+                    logger.info("Image optimized: {} bytes at quality {}", len(output_bytes), quality)
                     return output_bytes
-                
-                # Reduce quality and try again
-                quality -= 10
             
             # If still too large, resize the image
             logger.warning("Image still too large after quality reduction, resizing...")
+            
+            # Nothing fits at full resolution, so let libjpeg decode the source at
+            # 1/2, 1/4 or 1/8 scale near the size the smallest attempt suggests;
+            # draft() never goes below the requested size
+            if reopen_as_draft:
+                scale = (max_size_bytes / smallest_size) ** 0.5
+                width, height = image.size
+                image = Image.open(_open_stream(image_data))
+                image.draft("RGB", (int(width * scale), int(height * scale)))
+            
             return ImageProcessor._resize_and_optimize(image, max_size_bytes, target_format)
             
         except Exception as e:
-            logger.error(f"Error optimizing image: {e}")
+            logger.error("Error optimizing image: {}", e)
             raise ImageProcessingError(f"Image optimization failed: {e}")
     
+    @staticmethod
+    def _encode(image: Image.Image,
+                output: io.BytesIO,
+                target_format: str,
+                quality: int,
+                final: bool = False) -> bytes:
+        """
+        Encode an image into the given buffer
+        
+        Trial encodes skip the encoder's optimization pass; final encodes
+        enable it, and write progressive JPEGs.
+        
+        Returns:
+            Encoded image bytes
+        """
+        save_kwargs = {"format": target_format, "optimize": final}
+        if target_format.upper() == "JPEG":
+            save_kwargs["quality"] = quality
+            save_kwargs["progressive"] = final
+        image.save(output, **save_kwargs)
+        return output.getvalue()
+    
     @staticmethod
     def _resize_and_optimize(image: Image.Image, 
                            max_size_bytes: int, 
@@ -168,6 +411,11 @@ class ImageProcessor:
         """
         Resize image to fit size constraints
         
+        Candidate sizes are tried with the faster RESAMPLE_FILTER and without
+        Huffman optimization; the size that fits is then rendered once with
+        LANCZOS and the final encoder settings, keeping the search result if
+        that one no longer fits.
+        
         Args:
             image: PIL Image object
             max_size_bytes: Maximum file size in bytes
@@ -178,49 +426,52 @@ class ImageProcessor:
         """
         original_size = image.size
         scale_factor = 0.9
+        search_filter = RESAMPLE_FILTERS.get(settings.resample_filter.lower(), Image.Resampling.LANCZOS)
+        
+        def encode(size, resample, final: bool = False) -> bytes:
+            output = io.BytesIO()
+            return ImageProcessor._encode(image.resize(size, resample), output, target_format, 85, final)
         
         while scale_factor > 0.1:
             # Calculate new size
-            new_width = int(original_size[0] * scale_factor)
-            new_height = int(original_size[1] * scale_factor)
-            
-            # Resize image
-            resized_image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            
-            # Try to save with good quality
-            output = io.BytesIO()
-            save_kwargs = {"format": target_format, "optimize": True}
-            if target_format.upper() == "JPEG":
-                save_kwargs["quality"] = 85
-            
-            resized_image.save(output, **save_kwargs)
-            output_bytes = output.getvalue()
+            new_size = (int(original_size[0] * scale_factor), int(original_size[1] * scale_factor))
+            output_bytes = encode(new_size, search_filter)
             
             if len(output_bytes) <= max_size_bytes:
-                logger.info(f"Image resized to {new_width}x{new_height}: {len(output_bytes)} bytes")
+                final_bytes = encode(new_size, Image.Resampling.LANCZOS, final=True)
+                if len(final_bytes) <= max_size_bytes:
+                    output_bytes = final_bytes
+                logger.info("Image resized to {}x{}: {} bytes", new_size[0], new_size[1], len(output_bytes))
                 return output_bytes
             
-            scale_factor -= 0.1
+            # Encoded size grows roughly with the pixel count, so jump to the
+            # scale this attempt suggests instead of stepping down by 0.1
+            suggested = scale_factor * (max_size_bytes / len(output_bytes)) ** 0.5 * RESIZE_SCALE_MARGIN
+            scale_factor = min(scale_factor - RESIZE_MIN_STEP, suggested)
         
         raise ImageProcessingError("Unable to optimize image to required size")
     
     @staticmethod
-    def get_image_info(image_data: Union[bytes, bytearray]) -> Dict[str, Any]:
+    def get_image_info(image_data: Union[ImageBuffer, Image.Image],
+                       file_size: Optional[int] = None) -> Dict[str, Any]:
         """
         Get detailed image information
         
         Args:
-            image_data: Raw image bytes or bytearray
+            image_data: Raw image bytes, bytearray or memoryview, or an image
+                the caller already opened (its header is not parsed again)
+            file_size: Encoded size in bytes of an already-opened image
             
         Returns:
-            Dictionary with image information
+            Dictionary with image information; the file size fields are None
+            for an opened image given without file_size
         """
         try:
-            # Convert bytearray to bytes if needed
-            if isinstance(image_data, bytearray):
-                image_data = bytes(image_data)
-            
-            image = Image.open(io.BytesIO(image_data))
+            if isinstance(image_data, Image.Image):
+                image = image_data
+            else:
+                image = Image.open(_open_stream(image_data))
+                file_size = len(image_data)
             
             return {
                 "format": image.format,
@@ -229,45 +480,62 @@ class ImageProcessor:
                 "width": image.size[0],
                 "height": image.size[1],
                 "pixel_count": image.size[0] * image.size[1],
-                "file_size_bytes": len(image_data),
-                "file_size_mb": len(image_data) / (1024 * 1024),
+                "file_size_bytes": file_size,
+                "file_size_mb": file_size / (1024 * 1024) if file_size is not None else None,
                 "has_transparency": image.mode in ("RGBA", "LA") or "transparency" in image.info,
                 "color_mode": image.mode,
                 "aspect_ratio": image.size[0] / image.size[1]
             }
             
         except Exception as e:
-            logger.error(f"Error getting image info: {e}")
+            logger.error("Error getting image info: {}", e)
             raise ImageProcessingError(f"Failed to get image info: {e}")
     
     @staticmethod
-    def save_temp_image(image_data: Union[bytes, bytearray], suffix: str = ".jpg") -> str:
+    def save_temp_image(image_data: ImageBuffer, suffix: str = ".jpg") -> str:
         """
         Save image to temporary file
         
+        The file goes to the tmpfs at /dev/shm when there is one, so it never
+        touches the disk; if that is full it falls back to the regular
+        temporary directory.
+        
         Args:
-            image_data: Raw image bytes or bytearray
+            image_data: Raw image bytes, bytearray or memoryview
             suffix: File extension
             
         Returns:
             Path to temporary file
         """
         try:
-            # Convert bytearray to bytes if needed
-            if isinstance(image_data, bytearray):
-                image_data = bytes(image_data)
-            
-            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_file:
-                temp_file.write(image_data)
-                temp_path = temp_file.name
+            temp_path = None
+            if MEMORY_TEMP_DIR:
+                try:
+                    temp_path = ImageProcessor._write_temp_file(image_data, suffix, MEMORY_TEMP_DIR)
+                except OSError as e:
+                    logger.warning("Could not write temporary image to {}: {}", MEMORY_TEMP_DIR, e)
+            if temp_path is None:
+                temp_path = ImageProcessor._write_temp_file(image_data, suffix)
             
-            logger.debug(f"Saved temporary image: {temp_path}")
+            logger.debug("Saved temporary image: {}", temp_path)
             return temp_path
             
         except Exception as e:
-            logger.error(f"Error saving temporary image: {e}")
+            logger.error("Error saving temporary image: {}", e)
             raise ImageProcessingError(f"Failed to save temporary image: {e}")
     
+    @staticmethod
+    def _write_temp_file(image_data: ImageBuffer, suffix: str, directory: Optional[str] = None) -> str:
+        """Write data to a new temporary file, removing it again if the write fails"""
+        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=directory) as temp_file:
+            try:
+                temp_file.write(image_data)
+            except OSError:
+                temp_file.close()
+                os.unlink(temp_file.name)
+                raise
+            return temp_file.name
+    
     @staticmethod
     def cleanup_temp_file(file_path: str):
         """
@@ -279,28 +547,29 @@ class ImageProcessor:
         try:
             if os.path.exists(file_path):
                 os.unlink(file_path)
-                logger.debug(f"Cleaned up temporary file: {file_path}")
+                logger.debug("Cleaned up temporary file: {}", file_path)
         except Exception as e:
-            logger.warning(f"Failed to cleanup temporary file {file_path}: {e}")
+            logger.warning("Failed to cleanup temporary file {}: {}", file_path, e)
     
     @staticmethod
-    def convert_format(image_data: Union[bytes, bytearray], target_format: str) -> bytes:
+    def convert_format(image_data: ImageBuffer, target_format: str) -> bytes:
         """
         Convert image to different format
         
         Args:
-            image_data: Raw image bytes or bytearray
+            image_data: Raw image bytes, bytearray or memoryview
             target_format: Target format (JPEG, PNG, WEBP)
             
         Returns:
-            Converted image bytes
+            Converted image bytes, or the input unchanged if it already is
+            in the target format
         """
         try:
-            # Convert bytearray to bytes if needed
-            if isinstance(image_data, bytearray):
-                image_data = bytes(image_data)
-            
-            image = Image.open(io.BytesIO(image_data))
+            # Opening only reads the header; nothing is decoded unless the
+            # image actually needs converting
+            image = Image.open(_open_stream(image_data))
+            if image.format == target_format.upper():
+                return image_data if isinstance(image_data, bytes) else bytes(image_data)
             
             # Handle transparency for JPEG
             if target_format.upper() == "JPEG" and image.mode in ("RGBA", "P", "LA"):
@@ -322,5 +591,5 @@ class ImageProcessor:
             return output.getvalue()
             
         except Exception as e:
-            logger.error(f"Error converting image format: {e}")
+            logger.error("Error converting image format: {}", e)
             raise ImageProcessingError(f"Format conversion failed: {e}")
@@ -3,7 +3,6 @@ User service for managing user operations
 """
 
 from typing import Optional, Dict, Any, List, Tuple
-from datetime import datetime
 from loguru import logger
 
 from ..database import db
@@ -34,62 +33,25 @@ class UserService:
             Tuple of (User object, is_new_user boolean)
         """
         try:
-            # Try to get existing user
-            user = await db.get_user(telegram_user_id)
+            # Upsert the user and refresh profile fields and last seen in one round trip
+            user, is_new = await db.touch_user(
+                telegram_user_id,
+                username=username,
+                first_name=first_name,
+                last_name=last_name,
+                language_code=language_code
+            )
             
-            if user:
-                # Update user info if provided
-                updated = False
-                if username and user.username != username:
-                    user.username = username
-                    updated = True
-                if first_name and user.first_name != first_name:
-                    user.first_name = first_name
-                    updated = True
-                if last_name and user.last_name != last_name:
-                    user.last_name = last_name
-                    updated = True
-                if language_code and user.language_code != language_code:
-                    user.language_code = language_code
-                    updated = True
-                
-                # Update last seen
-                user.update_last_seen()
+            if is_new:
+                logger.info("Created new user: {}", telegram_user_id)
                 
-                if updated:
-                    await db.update_user(user)
-                    logger.info(f"Updated user info for {telegram_user_id}")
-                
-                return user, False
+                # Update analytics
+                await UserService.update_analytics(new_user=True)
+            
+            return user, is_new
             
-            else:
-                # Create new user
-                user = User(
-                    telegram_user_id=telegram_user_id,
-                    username=username,
-                    first_name=first_name,
-                    last_name=last_name,
-                    language_code=language_code or "en"
-                )
-                
-                success = await db.create_user(user)
-                if success:
-                    logger.info(f"Created new user: {telegram_user_id}")
-                    
-                    # Update analytics
-                    await UserService.update_analytics(new_user=True)
-                    
-                    return user, True
-                else:
-                    # User might have been created by another process
-                    existing_user = await db.get_user(telegram_user_id)
-                    if existing_user:
-                        return existing_user, False
-                    else:
-                        raise Exception("Failed to create user")
-                        
         except Exception as e:
-            logger.error(f"Error getting/creating user {telegram_user_id}: {e}")
+            logger.error("Error getting/creating user {}: {}", telegram_user_id, e)
             raise
     
     @staticmethod
@@ -110,33 +72,27 @@ class UserService:
             True if updated successfully
         """
         try:
-            user = await db.get_user(telegram_user_id)
-            if not user:
-                logger.warning(f"User {telegram_user_id} not found for stats update")
+            success = await db.increment_user_stats(
+                telegram_user_id,
+                edit_success=edit_success,
+                edit_type=edit_type
+            )
+            if not success:
+                logger.warning("User {} not found for stats update", telegram_user_id)
                 return False
             
-            # Update edit statistics
-            user.increment_edit_count(edit_success)
-            
-            # Add favorite edit type
-            if edit_type:
-                user.add_favorite_edit_type(edit_type)
-            
-            # Update user in database
-            success = await db.update_user(user)
+            # Only count the edit globally once it's been recorded for a known
+            # user; the analytics write is batched with other edits'
+            await UserService.update_analytics(
+                edit_success=edit_success,
+                processing_time=processing_time,
+                edit_type=edit_type
+            )
             
-            if success:
-                # Update global analytics
-                await UserService.update_analytics(
-                    edit_success=edit_success,
-                    processing_time=processing_time,
-                    edit_type=edit_type
-                )
-            
-            return success
+            return True
             
         except Exception as e:
-            logger.error(f"Error updating user stats for {telegram_user_id}: {e}")
+            logger.error("Error updating user stats for {}: {}", telegram_user_id, e)
             return False
     
     @staticmethod
@@ -151,7 +107,8 @@ class UserService:
             Dictionary with user statistics
         """
         try:
-            stats = await db.get_user_stats(telegram_user_id)
+            # Stats, this month's count and the latest edit previews in one aggregation
+            stats = await db.get_user_stats(telegram_user_id, latest_edits=5)
             
             if not stats:
                 return {
@@ -162,9 +119,6 @@ class UserService:
                     "success_rate": 0.0
                 }
             
-            # Get recent edits
-            recent_edits = await db.get_user_edits(telegram_user_id, limit=5)
-            
             # Format statistics
             formatted_stats = {
                 "total_edits": stats.get("total_edits", 0),
@@ -175,26 +129,18 @@ class UserService:
                 "favorite_edit_types": stats.get("favorite_edit_types", {}),
                 "member_since": stats.get("member_since"),
                 "last_seen": stats.get("last_seen"),
-                "recent_edits": [
-                    {
-                        "prompt": edit.prompt[:50] + "..." if len(edit.prompt) > 50 else edit.prompt,
-                        "status": edit.status.value,
-                        "created_at": edit.created_at,
-                        "processing_time": edit.processing_time_seconds
-                    }
-                    for edit in recent_edits
-                ]
+                "recent_edits": stats.get("latest_edits", [])
             }
             
             return formatted_stats
             
         except Exception as e:
-            logger.error(f"Error getting user statistics for {telegram_user_id}: {e}")
+            logger.error("Error getting user statistics for {}: {}", telegram_user_id, e)
             return {"error": "Failed to get statistics"}
     
     @staticmethod
     async def update_analytics(new_user: bool = False,
-                             edit_success: bool = True,
+                             edit_success: Optional[bool] = None,
                              processing_time: Optional[float] = None,
                              edit_type: Optional[str] = None,
                              aspect_ratio: Optional[str] = None,
@@ -204,7 +150,7 @@ class UserService:
         
         Args:
             new_user: Whether this is a new user
-            edit_success: Whether the edit was successful
+            edit_success: Whether the edit was successful, None if no edit happened
             processing_time: Time taken to process edit
             edit_type: Type of edit performed
             aspect_ratio: Aspect ratio used
@@ -214,9 +160,7 @@ class UserService:
             True if updated successfully
         """
         try:
-            analytics = await db.get_or_create_analytics()
-            
-            analytics.update_stats(
+            return await db.increment_analytics(
                 new_user=new_user,
                 edit_success=edit_success,
                 processing_time=processing_time,
@@ -225,10 +169,8 @@ class UserService:
                 output_format=output_format
             )
             
-            return await db.update_analytics(analytics)
-            
         except Exception as e:
-            logger.error(f"Error updating analytics: {e}")
+            logger.error("Error updating analytics: {}", e)
             return False
     
     @staticmethod
@@ -240,15 +182,14 @@ class UserService:
             Dictionary with bot analytics
         """
         try:
-            analytics = await db.get_or_create_analytics()
-            return analytics.get_performance_summary()
+            return await db.get_performance_summary()
             
         except Exception as e:
-            logger.error(f"Error getting bot analytics: {e}")
+            logger.error("Error getting bot analytics: {}", e)
             return {"error": "Failed to get analytics"}
     
     @staticmethod
-    async def is_user_admin(telegram_user_id: int) -> bool:
+    def is_user_admin(telegram_user_id: int) -> bool:
         """
         Check if user is an admin
         
@@ -274,26 +215,22 @@ class UserService:
         """
         try:
             # Check if admin
-            if not await UserService.is_user_admin(admin_id):
-                logger.warning(f"Non-admin {admin_id} tried to ban user {telegram_user_id}")
-                return False
-            
-            user = await db.get_user(telegram_user_id)
-            if not user:
+            if not UserService.is_user_admin(admin_id):
+                logger.warning("Non-admin {} tried to ban user {}", admin_id, telegram_user_id)
                 return False
             
-            user.is_banned = True
-            user.is_active = False
-            user.updated_at = datetime.utcnow()
-            
-            success = await db.update_user(user)
+            # Flip just the two flags; False means the user doesn't exist
+            success = await db.update_user_fields(
+                telegram_user_id,
+                {"is_banned": True, "is_active": False}
+            )
             if success:
-                logger.info(f"User {telegram_user_id} banned by admin {admin_id}")
+                logger.info("User {} banned by admin {}", telegram_user_id, admin_id)
             
             return success
             
         except Exception as e:
-            logger.error(f"Error banning user {telegram_user_id}: {e}")
+            logger.error("Error banning user {}: {}", telegram_user_id, e)
             return False
     
     @staticmethod
@@ -310,24 +247,20 @@ class UserService:
         """
         try:
             # Check if admin
-            if not await UserService.is_user_admin(admin_id):
-                logger.warning(f"Non-admin {admin_id} tried to unban user {telegram_user_id}")
-                return False
-            
-            user = await db.get_user(telegram_user_id)
-            if not user:
+            if not UserService.is_user_admin(admin_id):
+                logger.warning("Non-admin {} tried to unban user {}", admin_id, telegram_user_id)
                 return False
             
-            user.is_banned = False
-            user.is_active = True
-            user.updated_at = datetime.utcnow()
-            
-            success = await db.update_user(user)
+            # Flip just the two flags; False means the user doesn't exist
+            success = await db.update_user_fields(
+                telegram_user_id,
+                {"is_banned": False, "is_active": True}
+            )
             if success:
-                logger.info(f"User {telegram_user_id} unbanned by admin {admin_id}")
+                logger.info("User {} unbanned by admin {}", telegram_user_id, admin_id)
             
             return success
             
         except Exception as e:
-            logger.error(f"Error unbanning user {telegram_user_id}: {e}")
+            logger.error("Error unbanning user {}: {}", telegram_user_id, e)
             return False
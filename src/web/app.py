@@ -4,9 +4,13 @@ Optional web interface for health checks and webhooks
 
 import os
 import asyncio
+import hashlib
 from datetime import datetime
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+from typing import Any, Dict, Optional, Tuple
+import orjson
+from cachetools import TTLCache
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import ORJSONResponse
 from loguru import logger
 
 from ..config import settings, BOT_NAME, BOT_VERSION
@@ -14,11 +18,60 @@ from ..database import db
 from ..services import UserService
 
 
+# Seconds analytics are served from memory; health checks and /stats polls
+# within the window share one database read
+ANALYTICS_CACHE_TTL = 10
+
+_analytics_cache: TTLCache = TTLCache(maxsize=1, ttl=ANALYTICS_CACHE_TTL)
+_analytics_lock = asyncio.Lock()
+
+
+async def _get_cached_analytics() -> Tuple[Dict[str, Any], str]:
+    """
+    Get bot analytics and their ETag, refreshed at most every ANALYTICS_CACHE_TTL seconds
+    
+    Returns:
+        Tuple of (analytics dictionary, weak ETag)
+    """
+    cached = _analytics_cache.get("analytics")
+    if cached:
+        return cached
+    
+    async with _analytics_lock:
+        # Another request may have refreshed the cache while we waited
+        cached = _analytics_cache.get("analytics")
+        if cached:
+            return cached
+        
+        analytics = await UserService.get_bot_analytics()
+        body = orjson.dumps(analytics, option=orjson.OPT_SORT_KEYS, default=str)
+        # Weak: the analytics are unchanged, but each /stats response has a fresh timestamp
+        etag = f'W/"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+        # Errors are not cached so the next request retries
+        if "error" not in analytics:
+            _analytics_cache["analytics"] = (analytics, etag)
+        return analytics, etag
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weakly compare an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+    
+    opaque = etag.removeprefix("W/")
+    return any(
+        tag.strip() == "*" or tag.strip().removeprefix("W/") == opaque
+        for tag in if_none_match.split(",")
+    )
+
+
 # Create FastAPI app
 app = FastAPI(
     title=f"{BOT_NAME} Web Interface",
     description="Health checks and webhook endpoints for MedusaXD AI Image Editor Bot",
-    version=BOT_VERSION
+    version=BOT_VERSION,
+    # orjson encodes the responses, datetimes included, in C
+    default_response_class=ORJSONResponse
 )
 
 
@@ -49,7 +102,7 @@ async def root():
         "name": BOT_NAME,
         "version": BOT_VERSION,
         "status": "running",
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": datetime.utcnow()
     }
 
 
@@ -65,24 +118,21 @@ async def health_check():
         await db.client.admin.command('ping')
         
         # Get basic stats
-        analytics = await UserService.get_bot_analytics()
+        analytics, _ = await _get_cached_analytics()
         
-        return JSONResponse(
-            status_code=200,
-            content={
-                "status": "healthy",
-                "service": BOT_NAME,
-                "version": BOT_VERSION,
-                "environment": settings.environment,
-                "timestamp": datetime.utcnow().isoformat(),
-                "database": "connected",
-                "stats": {
-                    "total_users": analytics.get("total_users", 0),
-                    "total_edits": analytics.get("total_edits", 0),
-                    "success_rate": analytics.get("success_rate", 0)
-                }
+        return {
+            "status": "healthy",
+            "service": BOT_NAME,
+            "version": BOT_VERSION,
+            "environment": settings.environment,
+            "timestamp": datetime.utcnow(),
+            "database": "connected",
+            "stats": {
+                "total_users": analytics.get("total_users", 0),
+                "total_edits": analytics.get("total_edits", 0),
+                "success_rate": analytics.get("success_rate", 0)
             }
-        )
+        }
         
     except Exception as e:
         logger.error(f"Health check failed: {e}")
@@ -97,21 +147,25 @@ async def health_check():
 
 
 @app.get("/stats")
-async def get_stats():
+async def get_stats(request: Request):
     """Get bot statistics"""
     try:
-        analytics = await UserService.get_bot_analytics()
+        analytics, etag = await _get_cached_analytics()
         
         if "error" in analytics:
             raise HTTPException(status_code=500, detail="Failed to retrieve statistics")
         
-        return JSONResponse(
-            status_code=200,
+        # Unchanged statistics: let the client reuse its copy
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        
+        return ORJSONResponse(
+            headers={"ETag": etag},
             content={
                 "service": BOT_NAME,
                 "version": BOT_VERSION,
                 "statistics": analytics,
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": datetime.utcnow()
             }
         )
         
@@ -126,7 +180,7 @@ async def webhook_handler():
     return {
         "status": "webhook_received",
         "message": "Webhook functionality not implemented yet",
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": datetime.utcnow()
     }
 
 
@@ -149,7 +203,7 @@ async def bot_info():
         "powered_by": "BFL.ai FLUX.1 Kontext [pro]",
         "database": "MongoDB",
         "deployment": "Render.com",
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": datetime.utcnow()
     }
 
 
@@ -3,50 +3,121 @@ Pytest configuration and fixtures for MedusaXD AI Image Editor Bot tests
 """
 
 import pytest
-import asyncio
+import copy
+import io
 import os
+from types import SimpleNamespace
+from pytest_asyncio import is_async_test
 from unittest.mock import AsyncMock, MagicMock
-from datetime import datetime
+from bson import ObjectId
+from PIL import Image
 
-# Set test environment
+# Set test environment (conftest is imported by every pytest-xdist worker, so
+# each one gets these before src.config is loaded)
 os.environ["ENVIRONMENT"] = "test"
 os.environ["TELEGRAM_BOT_TOKEN"] = "test_token"
 os.environ["BFL_API_KEY"] = "test_api_key"
 os.environ["MONGODB_URL"] = "mongodb://localhost:27017/test_medusaxd_bot"
 
+# Imported after the environment above is set; src.config reads it at import
+from src.database import db
+from src.models import User, UserStats, ImageEdit, EditStatus
 
-@pytest.fixture(scope="session")
-def event_loop():
-    """Create an instance of the default event loop for the test session."""
-    loop = asyncio.get_event_loop_policy().new_event_loop()
-    yield loop
-    loop.close()
 
+def pytest_collection_modifyitems(items):
+    """Run every async test on the session event loop shared with the async fixtures"""
+    session_loop = pytest.mark.asyncio(loop_scope="session")
+    for item in items:
+        if is_async_test(item):
+            item.add_marker(session_loop, append=False)
 
-@pytest.fixture
-async def mock_db():
+
+# Configure functions of the session-scoped mocks below. Each one resets its
+# mocks and applies their default return values; it runs when the mock is
+# built and again after every test, so each stub is only built once
+_SESSION_MOCK_CONFIGURERS = []
+
+
+def _session_mock(configure):
+    """Register and run the configure function of a session-scoped mock"""
+    _SESSION_MOCK_CONFIGURERS.append(configure)
+    configure()
+    return configure
+
+
+def _stub(**methods):
+    """
+    Build a session-scoped stub object
+    
+    Args:
+        methods: Method name -> (AsyncMock or MagicMock, default return value
+            or None for the mock's own)
+        
+    Returns:
+        SimpleNamespace carrying one plain mock per method
+    """
+    stub = SimpleNamespace(**{name: mock_class() for name, (mock_class, _) in methods.items()})
+    
+    @_session_mock
+    def configure():
+        for name, (_, return_value) in methods.items():
+            mock = getattr(stub, name)
+            mock.reset_mock(return_value=True, side_effect=True)
+            if return_value is not None:
+                mock.return_value = copy.deepcopy(return_value)
+    
+    return stub
+
+
+@pytest.fixture(autouse=True)
+def _reset_session_mocks():
+    """Undo per-test configuration of the session-scoped mocks"""
+    yield
+    for configure in _SESSION_MOCK_CONFIGURERS:
+        configure()
+
+
+@pytest.fixture(scope="session")
+def mock_db():
     """Mock database for testing"""
-    from src.database import db
-    
-    # Mock the database methods
-    db.connect = AsyncMock()
-    db.disconnect = AsyncMock()
-    db.get_user = AsyncMock()
-    db.create_user = AsyncMock(return_value=True)
-    db.update_user = AsyncMock(return_value=True)
-    db.create_image_edit = AsyncMock(return_value=True)
-    db.update_image_edit = AsyncMock(return_value=True)
-    db.get_or_create_analytics = AsyncMock()
-    db.update_analytics = AsyncMock(return_value=True)
+    # Mock the database methods on the shared instance until the session ends
+    monkeypatch = pytest.MonkeyPatch()
+    methods = {
+        "connect": None,
+        "disconnect": None,
+        "get_user": None,
+        "touch_user": None,
+        "create_user": True,
+        "update_user": True,
+        "update_user_fields": True,
+        "increment_user_stats": True,
+        "get_user_stats": None,
+        "create_image_edit": True,
+        "update_image_edit": True,
+        "update_image_edit_status": True,
+        "get_or_create_analytics": None,
+        "update_analytics": True,
+        "increment_analytics": True,
+        "get_performance_summary": None
+    }
+    mocks = {name: AsyncMock() for name in methods}
+    for name, mock in mocks.items():
+        monkeypatch.setattr(db, name, mock)
+    
+    @_session_mock
+    def configure():
+        for name, mock in mocks.items():
+            mock.reset_mock(return_value=True, side_effect=True)
+            if methods[name] is not None:
+                mock.return_value = methods[name]
     
     yield db
+    
+    monkeypatch.undo()
 
 
-@pytest.fixture
-def mock_user():
-    """Mock user for testing"""
-    from src.models import User, UserStats
-    
+def _build_mock_user():
+    """Build the user behind the mock_user fixtures"""
     return User(
         telegram_user_id=123456789,
         username="test_user",
@@ -57,11 +128,27 @@ def mock_user():
     )
 
 
+@pytest.fixture
+def mock_user():
+    """Mock user for testing"""
+    return _build_mock_user()
+
+
+@pytest.fixture(scope="session")
+def mock_user_dict():
+    """Stored (by-alias) document of a mock user, dumped once per session"""
+    return _build_mock_user().model_dump(by_alias=True)
+
+
+@pytest.fixture(scope="session")
+def stable_object_id():
+    """One ObjectId shared by tests that don't care about its value"""
+    return ObjectId()
+
+
 @pytest.fixture
 def mock_image_edit():
     """Mock image edit for testing"""
-    from src.models import ImageEdit, EditStatus
-    
     return ImageEdit(
         user_id="507f1f77bcf86cd799439011",
         telegram_user_id=123456789,
@@ -71,49 +158,105 @@ def mock_image_edit():
     )
 
 
+class FakeResponse:
+    """Minimal aiohttp response: status, headers, a body and a streamed body"""
+    
+    def __init__(self, status=200, body=b"", chunks=None, content_length=-1, headers=None):
+        self.status = status
+        self.headers = headers or {}
+        self.body = body
+        self.chunks = [body] if chunks is None else chunks
+        # content_length defaults to the body size; None means no Content-Length
+        self.content_length = sum(map(len, self.chunks)) if content_length == -1 else content_length
+        self.chunked_reads = 0
+        self.content = SimpleNamespace(iter_chunked=self._iter_chunked)
+    
+    async def read(self):
+        return self.body
+    
+    async def text(self):
+        return self.body.decode()
+    
+    async def _iter_chunked(self, size):
+        self.chunked_reads += 1
+        for chunk in self.chunks:
+            yield chunk
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class FakeAiohttpSession:
+    """Minimal aiohttp.ClientSession answering every request with one response"""
+    
+    def __init__(self):
+        self.response = FakeResponse()
+        self.requests = []
+        self.closed = False
+    
+    def respond_with(self, **kwargs):
+        """Answer subsequent requests with a FakeResponse(**kwargs) and return it"""
+        self.response = FakeResponse(**kwargs)
+        return self.response
+    
+    def get(self, url, **kwargs):
+        self.requests.append(("GET", url, kwargs))
+        return self.response
+    
+    def post(self, url, **kwargs):
+        self.requests.append(("POST", url, kwargs))
+        return self.response
+    
+    async def close(self):
+        self.closed = True
+
+
 @pytest.fixture
+def bfl_session():
+    """Fake aiohttp session for BFL.ai service tests"""
+    return FakeAiohttpSession()
+
+
+@pytest.fixture(scope="session")
 def mock_bfl_service():
     """Mock BFL.ai API service for testing"""
-    from src.services import BFLAPIService
-    
-    service = MagicMock(spec=BFLAPIService)
-    service.create_edit_request = AsyncMock(return_value=("test_id", "test_url"))
-    service.wait_for_completion = AsyncMock(return_value={
-        "status": "Ready",
-        "result": {"sample": "https://example.com/edited_image.jpg"}
-    })
-    service.download_image = AsyncMock(return_value=b"fake_image_data")
-    service.encode_image_to_base64 = MagicMock(return_value="fake_base64")
-    service.validate_image_size = MagicMock(return_value=True)
-    
-    return service
+    return _stub(
+        create_edit_request=(AsyncMock, ("test_id", "test_url")),
+        wait_for_completion=(AsyncMock, {
+            "status": "Ready",
+            "result": {"sample": "https://example.com/edited_image.jpg"}
+        }),
+        download_image=(AsyncMock, b"fake_image_data"),
+        encode_image_to_base64=(MagicMock, "fake_base64"),
+        validate_image_size=(MagicMock, True)
+    )
 
 
 @pytest.fixture
 def mock_telegram_update():
     """Mock Telegram update for testing"""
-    from telegram import Update, Message, User as TelegramUser, Chat, PhotoSize
-    
-    # Create mock objects
-    telegram_user = TelegramUser(
+    update = MagicMock()
+    update.update_id = 1
+    update.effective_user = SimpleNamespace(
         id=123456789,
         is_bot=False,
         first_name="Test",
         last_name="User",
-        username="test_user"
-    )
-    
-    chat = Chat(id=123456789, type="private")
-    
-    message = Message(
-        message_id=12345,
-        date=datetime.utcnow(),
-        chat=chat,
-        from_user=telegram_user,
-        text="Test message"
+        username="test_user",
+        language_code="en"
     )
+    update.effective_chat = SimpleNamespace(id=123456789, type="private")
     
-    update = Update(update_id=1, message=message)
+    update.message.message_id = 12345
+    update.message.chat_id = 123456789
+    update.message.from_user = update.effective_user
+    update.message.text = "Test message"
+    update.message.photo = []
+    update.message.document = None
+    update.message.reply_text = AsyncMock()
     
     return update
 
@@ -121,80 +264,62 @@ def mock_telegram_update():
 @pytest.fixture
 def mock_telegram_context():
     """Mock Telegram context for testing"""
-    from telegram.ext import ContextTypes
-    
-    context = MagicMock(spec=ContextTypes.DEFAULT_TYPE)
-    context.user_data = {}
-    context.chat_data = {}
-    context.bot_data = {}
-    
-    return context
+    return SimpleNamespace(user_data={}, chat_data={}, bot_data={}, args=[])
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_image_bytes():
-    """Sample image bytes for testing"""
-    # Create a minimal valid JPEG header
-    jpeg_header = b'\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x01\x00H\x00H\x00\x00\xff\xdb\x00C\x00'
-    jpeg_footer = b'\xff\xd9'
-    
-    # Create fake image data
-    fake_image_data = jpeg_header + b'\x00' * 100 + jpeg_footer
-    
-    return fake_image_data
+    """Sample image bytes for testing: a real 64x64 JPEG, encoded once"""
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64)).save(buffer, format="JPEG")
+    return buffer.getvalue()
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
+def small_image_bytes():
+    """5MB payload, within the upload size limit"""
+    return bytes(5 * 1024 * 1024)
+
+
+@pytest.fixture(scope="session")
+def oversized_image_bytes():
+    """25MB payload, over the upload size limit"""
+    return bytes(25 * 1024 * 1024)
+
+
+@pytest.fixture(scope="session")
 def mock_image_processor():
     """Mock image processor for testing"""
-    from src.services import ImageProcessor
-    
-    processor = MagicMock(spec=ImageProcessor)
-    processor.validate_image = MagicMock(return_value={
-        "valid": True,
-        "format": "JPEG",
-        "mode": "RGB",
-        "size": (1024, 1024),
-        "pixel_count": 1048576,
-        "file_size_mb": 0.5,
-        "mime_type": "image/jpeg"
-    })
-    processor.optimize_image = MagicMock(return_value=b"optimized_image_data")
-    processor.get_image_info = MagicMock(return_value={
-        "format": "JPEG",
-        "size": (1024, 1024),
-        "file_size_mb": 0.5
-    })
-    
-    return processor
+    return _stub(
+        validate_image=(MagicMock, {
+            "valid": True,
+            "format": "JPEG",
+            "mode": "RGB",
+            "size": (1024, 1024),
+            "pixel_count": 1048576,
+            "file_size_mb": 0.5,
+            "mime_type": "image/jpeg"
+        }),
+        optimize_image=(MagicMock, b"optimized_image_data"),
+        get_image_info=(MagicMock, {
+            "format": "JPEG",
+            "size": (1024, 1024),
+            "file_size_mb": 0.5
+        })
+    )
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def mock_user_service():
     """Mock user service for testing"""
-    from src.services import UserService
-    
-    service = MagicMock(spec=UserService)
-    service.get_or_create_user = AsyncMock()
-    service.update_user_stats = AsyncMock(return_value=True)
-    service.get_user_statistics = AsyncMock(return_value={
-        "total_edits": 10,
-        "successful_edits": 8,
-        "failed_edits": 2,
-        "success_rate": 80.0
-    })
-    service.is_user_admin = AsyncMock(return_value=False)
-    
-    return service
-
-
-@pytest.fixture(autouse=True)
-def setup_test_environment():
-    """Setup test environment before each test"""
-    # Ensure test environment is set
-    os.environ["ENVIRONMENT"] = "test"
-    
-    yield
-    
-    # Cleanup after test
-    pass
+    return _stub(
+        get_or_create_user=(AsyncMock, None),
+        update_user_stats=(AsyncMock, True),
+        get_user_statistics=(AsyncMock, {
+            "total_edits": 10,
+            "successful_edits": 8,
+            "failed_edits": 2,
+            "success_rate": 80.0
+        }),
+        is_user_admin=(MagicMock, False)
+    )
@@ -2,20 +2,45 @@
 Tests for database operations
 """
 
+import asyncio
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
+from datetime import datetime, timedelta
 from bson import ObjectId
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
 
-from src.database import Database
+from src.database import Database, _BulkWriter
 from src.models import User, ImageEdit, BotAnalytics, EditStatus
 
 
+class FakeCursor:
+    """Minimal stand-in for a pymongo async cursor"""
+    
+    def __init__(self, docs):
+        self.docs = docs
+        self.to_list_lengths = []
+    
+    def sort(self, *args, **kwargs):
+        return self
+    
+    def batch_size(self, *args, **kwargs):
+        return self
+    
+    def limit(self, *args, **kwargs):
+        return self
+    
+    async def to_list(self, length=None):
+        self.to_list_lengths.append(length)
+        return self.docs
+
+
 class TestDatabase:
     """Test database operations"""
     
-    @pytest.fixture
-    async def db_instance(self):
-        """Create a test database instance"""
+    @pytest.fixture(scope="class")
+    def db_instance(self):
+        """Create a test database instance shared by the class"""
         db = Database()
         
         # Mock the client and collections
@@ -27,12 +52,19 @@ class TestDatabase:
         
         return db
     
-    @pytest.mark.asyncio
+    @pytest.fixture(autouse=True)
+    def _reset_db_instance(self, db_instance):
+        """Reset the shared database's mocks after each test"""
+        yield
+        
+        for collection in (db_instance.users, db_instance.image_edits, db_instance.analytics):
+            collection.reset_mock(return_value=True, side_effect=True)
+    
     async def test_connect(self):
         """Test database connection"""
         db = Database()
         
-        with patch('motor.motor_asyncio.AsyncIOMotorClient') as mock_client:
+        with patch('src.database.AsyncMongoClient') as mock_client:
             mock_client.return_value.admin.command = AsyncMock()
             
             await db.connect()
@@ -40,10 +72,24 @@ class TestDatabase:
             assert db.client is not None
             mock_client.assert_called_once()
     
-    @pytest.mark.asyncio
-    async def test_get_user_exists(self, db_instance, mock_user):
+    async def test_connect_pool_options(self):
+        """Test that the client is created with explicit pool sizing"""
+        db = Database()
+        
+        with patch('src.database.AsyncMongoClient') as mock_client:
+            mock_client.return_value.admin.command = AsyncMock()
+            
+            await db.connect()
+            
+            options = mock_client.call_args[1]
+            assert options["maxPoolSize"] == 50
+            assert options["minPoolSize"] == 5
+            assert options["serverSelectionTimeoutMS"] == 3000
+            assert "compressors" not in options
+    
+    async def test_get_user_exists(self, db_instance, mock_user_dict):
         """Test getting an existing user"""
-        db_instance.users.find_one.return_value = mock_user.dict(by_alias=True)
+        db_instance.users.find_one.return_value = mock_user_dict
         
         result = await db_instance.get_user(123456789)
         
@@ -51,7 +97,63 @@ class TestDatabase:
         assert result.telegram_user_id == 123456789
         db_instance.users.find_one.assert_called_once_with({"telegram_user_id": 123456789})
     
-    @pytest.mark.asyncio
+    async def test_update_user_fields(self, db_instance):
+        """Test that only the given fields are set"""
+        db_instance.users.update_one.return_value = MagicMock(matched_count=1)
+        
+        result = await db_instance.update_user_fields(123456789, {"is_banned": True, "is_active": False})
+        
+        assert result is True
+        db_instance.users.update_one.assert_called_once_with(
+            {"telegram_user_id": 123456789},
+            {"$set": {"is_banned": True, "is_active": False}, "$currentDate": {"updated_at": True}}
+        )
+    
+    async def test_touch_user_creates(self):
+        """Test that touching an unknown user upserts it with defaults"""
+        db = Database()
+        db.users = AsyncMock()
+        db.users.find_one_and_update.return_value = None
+        
+        user, is_new = await db.touch_user(123456789, username="test_user")
+        
+        assert is_new is True
+        assert user.username == "test_user"
+        assert user.language_code == "en"
+        update = db.users.find_one_and_update.call_args[0][1]
+        assert "username" not in update["$setOnInsert"]
+        assert update["$set"]["username"] == "test_user"
+        assert db.users.find_one_and_update.call_args[1]["upsert"] is True
+    
+    async def test_touch_user_defaults_match_model(self):
+        """Test that the insert defaults are the model's own defaults"""
+        db = Database()
+        db.users = AsyncMock()
+        db.users.find_one_and_update.return_value = None
+        
+        await db.touch_user(123456789)
+        await db.touch_user(987654321)
+        
+        first, second = (call.args[1]["$setOnInsert"] for call in db.users.find_one_and_update.call_args_list)
+        expected = User(id=first["_id"], telegram_user_id=123456789, created_at=first["created_at"]).model_dump(
+            by_alias=True, exclude={"last_seen", "updated_at"}
+        )
+        assert first == expected
+        assert second["_id"] != first["_id"]
+        assert second["stats"] is not first["stats"]
+    
+    async def test_touch_user_existing(self, mock_user_dict):
+        """Test that touching a known user refreshes it without creating"""
+        db = Database()
+        db.users = AsyncMock()
+        db.users.find_one_and_update.return_value = mock_user_dict
+        
+        user, is_new = await db.touch_user(123456789, username="renamed")
+        
+        assert is_new is False
+        assert user.username == "renamed"
+        assert user.first_name == mock_user_dict["first_name"]
+    
     async def test_get_user_not_exists(self, db_instance):
         """Test getting a non-existent user"""
         db_instance.users.find_one.return_value = None
@@ -61,7 +163,6 @@ class TestDatabase:
         assert result is None
         db_instance.users.find_one.assert_called_once_with({"telegram_user_id": 123456789})
     
-    @pytest.mark.asyncio
     async def test_create_user_success(self, db_instance, mock_user):
         """Test creating a user successfully"""
         db_instance.users.insert_one.return_value = None
@@ -71,18 +172,14 @@ class TestDatabase:
         assert result is True
         db_instance.users.insert_one.assert_called_once()
     
-    @pytest.mark.asyncio
     async def test_create_user_duplicate(self, db_instance, mock_user):
         """Test creating a duplicate user"""
-        from pymongo.errors import DuplicateKeyError
-        
         db_instance.users.insert_one.side_effect = DuplicateKeyError("Duplicate key")
         
         result = await db_instance.create_user(mock_user)
         
         assert result is False
     
-    @pytest.mark.asyncio
     async def test_update_user_success(self, db_instance, mock_user):
         """Test updating a user successfully"""
         mock_result = MagicMock()
@@ -94,7 +191,6 @@ class TestDatabase:
         assert result is True
         db_instance.users.update_one.assert_called_once()
     
-    @pytest.mark.asyncio
     async def test_update_user_no_changes(self, db_instance, mock_user):
         """Test updating a user with no changes"""
         mock_result = MagicMock()
@@ -105,7 +201,21 @@ class TestDatabase:
         
         assert result is False
     
-    @pytest.mark.asyncio
+    async def test_update_user_writes_changed_fields(self, mock_user):
+        """Test that a loaded user only sends the fields changed since load"""
+        db = Database()
+        db.users = AsyncMock()
+        db.users.update_one.return_value = MagicMock(modified_count=1)
+        user = User.from_mongo(mock_user.to_dict())
+        user.is_banned = True
+        
+        result = await db.update_user(user)
+        
+        assert result is True
+        _, update = db.users.update_one.call_args[0]
+        assert update == {"$set": {"is_banned": True}}
+        assert user.model_dump_for_mongo() == {}
+    
     async def test_create_image_edit_success(self, db_instance, mock_image_edit):
         """Test creating an image edit successfully"""
         db_instance.image_edits.insert_one.return_value = None
@@ -115,7 +225,6 @@ class TestDatabase:
         assert result is True
         db_instance.image_edits.insert_one.assert_called_once()
     
-    @pytest.mark.asyncio
     async def test_update_image_edit_success(self, db_instance, mock_image_edit):
         """Test updating an image edit successfully"""
         mock_result = MagicMock()
@@ -127,110 +236,111 @@ class TestDatabase:
         assert result is True
         db_instance.image_edits.update_one.assert_called_once()
     
-    @pytest.mark.asyncio
-    async def test_get_pending_edits(self, db_instance):
-        """Test getting pending edits"""
+    @pytest.mark.parametrize("method_name,kwargs,status,expected_filter,expected_length", [
+        ("get_pending_edits", {}, EditStatus.PENDING, {"status": EditStatus.PENDING}, None),
+        ("get_processing_edits", {}, EditStatus.PROCESSING, {"status": EditStatus.PROCESSING}, None),
+        ("get_user_edits", {"telegram_user_id": 123456789, "limit": 5}, EditStatus.COMPLETED,
+         {"telegram_user_id": 123456789}, 5),
+    ], ids=["pending", "processing", "user"])
+    async def test_get_edits(self, db_instance, method_name, kwargs, status,
+                             expected_filter, expected_length):
+        """Test getting pending, processing and user edits"""
         mock_edit_data = {
             "_id": ObjectId(),
             "user_id": ObjectId(),
             "telegram_user_id": 123456789,
             "telegram_message_id": 12345,
             "prompt": "Test prompt",
-            "status": "pending"
+            "status": status.value
         }
+        cursor = FakeCursor([mock_edit_data])
+        db_instance.image_edits.find = MagicMock(return_value=cursor)
         
-        # Mock cursor
-        mock_cursor = AsyncMock()
-        mock_cursor.__aiter__.return_value = [mock_edit_data]
-        db_instance.image_edits.find.return_value = mock_cursor
-        
-        result = await db_instance.get_pending_edits()
-        
-        assert len(result) == 1
-        assert result[0].status == EditStatus.PENDING
-        db_instance.image_edits.find.assert_called_once_with({"status": EditStatus.PENDING})
-    
-    @pytest.mark.asyncio
-    async def test_get_processing_edits(self, db_instance):
-        """Test getting processing edits"""
-        mock_edit_data = {
-            "_id": ObjectId(),
-            "user_id": ObjectId(),
-            "telegram_user_id": 123456789,
-            "telegram_message_id": 12345,
-            "prompt": "Test prompt",
-            "status": "processing"
-        }
-        
-        # Mock cursor
-        mock_cursor = AsyncMock()
-        mock_cursor.__aiter__.return_value = [mock_edit_data]
-        db_instance.image_edits.find.return_value = mock_cursor
-        
-        result = await db_instance.get_processing_edits()
-        
-        assert len(result) == 1
-        assert result[0].status == EditStatus.PROCESSING
-        db_instance.image_edits.find.assert_called_once_with({"status": EditStatus.PROCESSING})
-    
-    @pytest.mark.asyncio
-    async def test_get_user_edits(self, db_instance):
-        """Test getting user edits"""
-        mock_edit_data = {
-            "_id": ObjectId(),
-            "user_id": ObjectId(),
-            "telegram_user_id": 123456789,
-            "telegram_message_id": 12345,
-            "prompt": "Test prompt",
-            "status": "completed"
-        }
-        
-        # Mock cursor with sort and limit
-        mock_cursor = AsyncMock()
-        mock_cursor.sort.return_value = mock_cursor
-        mock_cursor.limit.return_value = mock_cursor
-        mock_cursor.__aiter__.return_value = [mock_edit_data]
-        db_instance.image_edits.find.return_value = mock_cursor
-        
-        result = await db_instance.get_user_edits(123456789, limit=5)
+        result = await getattr(db_instance, method_name)(**kwargs)
         
+        assert cursor.to_list_lengths == [expected_length]
         assert len(result) == 1
+        assert result[0].status == status
         assert result[0].telegram_user_id == 123456789
-        db_instance.image_edits.find.assert_called_once_with({"telegram_user_id": 123456789})
+        db_instance.image_edits.find.assert_called_once_with(expected_filter)
     
-    @pytest.mark.asyncio
     async def test_get_or_create_analytics_existing(self, db_instance):
         """Test getting existing analytics"""
         mock_analytics_data = {
-            "_id": ObjectId(),
+            "_id": "global",
             "total_users": 100,
             "total_edits": 500,
             "successful_edits": 450,
             "failed_edits": 50
         }
         
-        db_instance.analytics.find_one.return_value = mock_analytics_data
+        db_instance.analytics.find_one_and_update.return_value = mock_analytics_data
         
         result = await db_instance.get_or_create_analytics()
         
         assert result.total_users == 100
         assert result.total_edits == 500
-        db_instance.analytics.find_one.assert_called_once()
+        db_instance.analytics.find_one_and_update.assert_called_once()
     
-    @pytest.mark.asyncio
-    async def test_get_or_create_analytics_new(self, db_instance):
-        """Test creating new analytics"""
-        db_instance.analytics.find_one.return_value = None
-        db_instance.analytics.insert_one.return_value = None
+    async def test_get_or_create_analytics_new(self):
+        """Test creating new analytics with one upsert"""
+        db = Database()
+        db.analytics = AsyncMock()
+        db.analytics.find_one_and_update.return_value = {"_id": "global", "total_users": 0, "total_edits": 0}
         
-        result = await db_instance.get_or_create_analytics()
+        result = await db.get_or_create_analytics()
         
+        assert result.id == "global"
         assert result.total_users == 0
-        assert result.total_edits == 0
-        db_instance.analytics.find_one.assert_called_once()
-        db_instance.analytics.insert_one.assert_called_once()
+        filter_, update = db.analytics.find_one_and_update.call_args[0]
+        assert filter_ == {"_id": "global"}
+        assert "_id" not in update["$setOnInsert"]
+        assert db.analytics.find_one_and_update.call_args[1]["upsert"] is True
+        db.analytics.insert_one.assert_not_called()
+    
+    async def test_get_performance_summary(self):
+        """Test the server-side dashboard summary"""
+        db = Database()
+        db.analytics = MagicMock()
+        db.analytics.aggregate = AsyncMock(return_value=FakeCursor([{
+            "total_users": 10,
+            "total_edits": 40,
+            "success_rate": 87.5,
+            "average_processing_time": 12.34,
+            "top_edit_types": [{"k": "color_change", "v": 25}, {"k": "text_edit", "v": 15}],
+            "last_updated": datetime(2024, 1, 31)
+        }]))
+        
+        summary = await db.get_performance_summary()
+        
+        assert summary["total_edits"] == 40
+        assert summary["top_edit_types"] == [("color_change", 25), ("text_edit", 15)]
+        pipeline = db.analytics.aggregate.call_args[0][0]
+        assert pipeline[0] == {"$match": {"_id": "global"}}
+    
+    async def test_get_performance_summary_empty(self):
+        """Test the summary before any analytics were recorded"""
+        db = Database()
+        db.analytics = MagicMock()
+        db.analytics.aggregate = AsyncMock(return_value=FakeCursor([]))
+        
+        summary = await db.get_performance_summary()
+        
+        assert summary["total_users"] == 0
+        assert summary["top_edit_types"] == []
+    
+    async def test_migrate_legacy_analytics(self, stable_object_id):
+        """Test moving a legacy analytics document to the fixed _id"""
+        db = Database()
+        db.analytics = AsyncMock()
+        legacy_id = stable_object_id
+        db.analytics.find_one.return_value = {"_id": legacy_id, "total_users": 7}
+        
+        await db._migrate_legacy_analytics()
+        
+        db.analytics.insert_one.assert_called_once_with({"_id": "global", "total_users": 7})
+        db.analytics.delete_one.assert_called_once_with({"_id": legacy_id})
     
-    @pytest.mark.asyncio
     async def test_update_analytics_success(self, db_instance):
         """Test updating analytics successfully"""
         analytics = BotAnalytics()
@@ -245,15 +355,235 @@ class TestDatabase:
         assert result is True
         db_instance.analytics.update_one.assert_called_once()
     
-    @pytest.mark.asyncio
+    async def test_create_image_edit_writes_full_document(self, mock_image_edit):
+        """Test that inserts include _id and default-valued fields"""
+        db = Database()
+        db.image_edits = AsyncMock()
+        
+        await db.create_image_edit(mock_image_edit)
+        
+        document = db.image_edits.insert_one.call_args[0][0]
+        assert document["_id"] == mock_image_edit.id
+        assert document["status"] == EditStatus.PENDING
+        assert document["retry_count"] == 0
+    
+    async def test_update_image_edit_status(self, mock_image_edit):
+        """Test that status transitions only write the fields they change"""
+        db = Database()
+        db.image_edits = AsyncMock()
+        db.image_edits.update_one.return_value = MagicMock(matched_count=1)
+        mock_image_edit.fail_with_error("Timed out")
+        
+        result = await db.update_image_edit_status(mock_image_edit)
+        
+        assert result is True
+        filter_, update = db.image_edits.update_one.call_args[0]
+        assert filter_ == {"_id": mock_image_edit.id}
+        assert update["$set"]["status"] == EditStatus.FAILED
+        assert update["$set"]["error_message"] == "Timed out"
+        assert "prompt" not in update["$set"]
+    
+    async def test_queue_queries_use_plain_strings(self):
+        """Test that status queries pass plain strings rather than enum members"""
+        db = Database()
+        db.image_edits = MagicMock()
+        db.image_edits.find.return_value = FakeCursor([])
+        
+        await db.get_pending_edits()
+        await db.get_processing_edits()
+        
+        statuses = [call.args[0]["status"] for call in db.image_edits.find.call_args_list]
+        assert statuses == ["pending", "processing"]
+        assert all(type(status) is str for status in statuses)
+    
+    async def test_large_queue_decoded_in_thread(self, mock_image_edit):
+        """Test that large result sets are turned into models off the event loop"""
+        db = Database()
+        db.image_edits = MagicMock()
+        db.image_edits.find.return_value = FakeCursor([mock_image_edit.model_dump(by_alias=True)] * 3)
+        
+        with patch('src.database.THREADED_DECODE_THRESHOLD', 2), \
+             patch('src.database.asyncio.to_thread', wraps=asyncio.to_thread) as mock_to_thread:
+            edits = await db.get_pending_edits()
+        
+        assert len(edits) == 3
+        mock_to_thread.assert_called_once()
+    
+    async def test_create_indexes(self):
+        """Test batched index creation and redundant index cleanup"""
+        db = Database()
+        db.users = AsyncMock()
+        db.image_edits = AsyncMock()
+        db.db = MagicMock()
+        db.db.__getitem__.return_value.drop_index = AsyncMock(side_effect=OperationFailure("index not found"))
+        
+        await db._create_indexes()
+        
+        db.users.create_indexes.assert_awaited_once()
+        indexes = db.image_edits.create_indexes.call_args[0][0]
+        keys = [list(index.document["key"].items()) for index in indexes]
+        assert [("telegram_user_id", 1)] not in keys
+        assert [("status", 1)] not in keys
+        assert "partialFilterExpression" in indexes[-1].document
+        assert db.db.__getitem__.return_value.drop_index.await_count == 4
+    
+    async def test_create_indexes_skipped(self):
+        """Test that index creation can be left to out-of-band tooling"""
+        db = Database()
+        db.users = AsyncMock()
+        
+        with patch('src.database.settings') as mock_settings:
+            mock_settings.skip_index_creation = True
+            await db._create_indexes()
+        
+        db.users.create_indexes.assert_not_called()
+    
+    async def test_increment_analytics(self):
+        """Test recording an edit with a single upserting pipeline update"""
+        db = Database()
+        db.analytics = AsyncMock()
+        db.analytics.update_one.return_value = MagicMock(matched_count=1, upserted_id=None)
+        db.daily_analytics = AsyncMock()
+        
+        result = await db.increment_analytics(edit_success=True, processing_time=12.5, edit_type="color_change")
+        
+        assert result is True
+        filter_, pipeline = db.analytics.update_one.call_args[0]
+        assert filter_ == {"_id": "global"}
+        assert db.analytics.update_one.call_args[1] == {"upsert": True}
+        assert "popular_edit_types.color_change" in pipeline[0]["$set"]
+        assert "success_rate" in pipeline[1]["$set"]
+        assert "daily_stats" not in pipeline[0]["$set"]
+        
+        day_filter, day_pipeline = db.daily_analytics.update_one.call_args[0]
+        assert day_filter == {"_id": datetime.utcnow().date().isoformat()}
+        assert "popular_edit_types.color_change" in day_pipeline[0]["$set"]
+    
+    async def test_increment_analytics_new_user_only(self):
+        """Test that a registration leaves the stored success rate untouched"""
+        db = Database()
+        db.analytics = AsyncMock()
+        db.analytics.update_one.return_value = MagicMock(matched_count=1, upserted_id=None)
+        db.daily_analytics = AsyncMock()
+        
+        await db.increment_analytics(new_user=True)
+        
+        _, pipeline = db.analytics.update_one.call_args[0]
+        assert len(pipeline) == 1
+        assert "total_edits" not in pipeline[0]["$set"]
+        assert "success_rate" not in pipeline[0]["$set"]
+    
+    async def test_get_recent_daily_stats(self):
+        """Test reading recent days from the daily_analytics collection"""
+        db = Database()
+        db.daily_analytics = MagicMock()
+        today = datetime.utcnow().date().isoformat()
+        cursor = MagicMock()
+        cursor.sort.return_value = cursor
+        cursor.limit.return_value = cursor
+        cursor.to_list = AsyncMock(return_value=[{"_id": today, "date": today, "total_edits": 3}])
+        db.daily_analytics.find.return_value = cursor
+        
+        stats = await db.get_recent_daily_stats(days=7)
+        
+        assert len(stats) == 1
+        assert stats[0].date == datetime.utcnow().date()
+        assert stats[0].total_edits == 3
+        cursor.sort.assert_called_once_with("_id", -1)
+        cursor.limit.assert_called_once_with(7)
+        assert db.daily_analytics.find.call_args[0][0] == {
+            "_id": {"$gte": (datetime.utcnow().date() - timedelta(days=6)).isoformat()}
+        }
+    
+    async def test_increment_user_stats(self):
+        """Test counting an edit with server-side increments"""
+        db = Database()
+        db.users = AsyncMock()
+        db.users.update_one.return_value = MagicMock(matched_count=1)
+        
+        result = await db.increment_user_stats(123456789, edit_success=False, edit_type="text_edit")
+        
+        assert result is True
+        filter_, update = db.users.update_one.call_args[0]
+        assert filter_ == {"telegram_user_id": 123456789}
+        assert update["$inc"] == {
+            "stats.total_edits": 1,
+            "stats.failed_edits": 1,
+            "stats.favorite_edit_types.text_edit": 1
+        }
+    
     async def test_get_user_stats(self, db_instance, mock_user):
         """Test getting user statistics"""
-        db_instance.get_user.return_value = mock_user
-        db_instance.image_edits.count_documents.return_value = 5
+        mock_user.stats.total_edits = 4
+        mock_user.stats.successful_edits = 3
+        mock_user.stats.failed_edits = 1
+        user_data = mock_user.model_dump(include={"telegram_user_id", "stats", "created_at", "last_seen"})
+        user_data["recent"] = [{"n": 5}]
+        
+        db_instance.users.aggregate = AsyncMock(return_value=FakeCursor([user_data]))
         
         result = await db_instance.get_user_stats(123456789)
         
-        assert "total_edits" in result
-        assert "success_rate" in result
-        assert "recent_edits" in result
-        db_instance.get_user.assert_called_once_with(123456789)
+        assert result["total_edits"] == 4
+        assert result["success_rate"] == 75.0
+        assert result["recent_edits"] == 5
+        db_instance.users.aggregate.assert_called_once()
+    
+    async def test_get_user_stats_latest_edits(self):
+        """Test that edit previews come from the same aggregation"""
+        db = Database()
+        db.users = MagicMock()
+        preview = {"prompt": "x" * 50 + "...", "status": "completed", "processing_time": 3.5}
+        db.users.aggregate = AsyncMock(return_value=FakeCursor([{
+            "telegram_user_id": 123456789, "stats": {}, "recent": [], "latest_edits": [preview]
+        }]))
+        
+        result = await db.get_user_stats(123456789, latest_edits=5)
+        
+        assert result["latest_edits"] == [preview]
+        pipeline = db.users.aggregate.call_args[0][0]
+        lookup = pipeline[-1]["$lookup"]
+        assert lookup["as"] == "latest_edits"
+        assert {"$limit": 5} in lookup["pipeline"]
+
+
+class TestBulkWriter:
+    """Test cases for coalesced bulk writes"""
+    
+    async def test_concurrent_submits_share_one_bulk_write(self):
+        """Test that concurrent writes are flushed together"""
+        collection = AsyncMock()
+        writer = _BulkWriter(collection)
+        
+        results = await asyncio.gather(*(writer.submit(InsertOne({"n": n})) for n in range(5)))
+        await writer.stop()
+        
+        assert results == [True] * 5
+        collection.bulk_write.assert_called_once()
+        operations = collection.bulk_write.call_args[0][0]
+        assert len(operations) == 5
+        assert collection.bulk_write.call_args[1] == {"ordered": False}
+    
+    async def test_partial_failure_only_fails_listed_operations(self):
+        """Test that a write error only fails the operation it refers to"""
+        collection = AsyncMock()
+        collection.bulk_write.side_effect = BulkWriteError({"writeErrors": [{"index": 1}]})
+        writer = _BulkWriter(collection)
+        
+        results = await asyncio.gather(*(writer.submit(InsertOne({"n": n})) for n in range(3)))
+        await writer.stop()
+        
+        assert results == [True, False, True]
+    
+    async def test_create_image_edit_uses_writer(self, mock_image_edit):
+        """Test that edit inserts go through the bulk writer once connected"""
+        db = Database()
+        db.image_edits = AsyncMock()
+        db._edit_writer = _BulkWriter(db.image_edits)
+        
+        result = await db.create_image_edit(mock_image_edit)
+        await db._edit_writer.stop()
+        
+        assert result is True
+        db.image_edits.bulk_write.assert_called_once()
+        db.image_edits.insert_one.assert_not_called()
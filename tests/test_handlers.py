@@ -3,53 +3,94 @@ Tests for bot handlers
 """
 
 import pytest
+import struct
+from datetime import datetime
+from types import SimpleNamespace
 from unittest.mock import AsyncMock, MagicMock, patch
+from telegram.error import BadRequest
 
+from src.bot.handlers import admin, commands, messages
 from src.bot.handlers.commands import start_command, help_command, stats_command
-from src.bot.handlers.messages import handle_photo, handle_text
-from src.models import User, UserStats
+from src.bot.handlers.messages import handle_photo, handle_text, PendingImageCache, PENDING_IMAGES
+from src.bot import middleware
+from src.bot.middleware import UserMiddleware, RateLimitMiddleware
+from src.models import User, UserStats, ImageEdit, EditStatus
+from src.services.bfl_api import BFLAPIError
+
+# PNG signature and IHDR chunk header, followed in a real file by the dimensions
+_PNG_HEADER = b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR"
+
+
+@pytest.fixture(scope="class")
+def _patched_handler_deps():
+    """Stub the handlers' collaborators once per handler test class"""
+    deps = SimpleNamespace(
+        process_user=AsyncMock(),
+        log_interaction=AsyncMock(),
+        get_user_statistics=AsyncMock(),
+        download_file_bytes=AsyncMock(),
+        validate_image_fast=MagicMock(),
+        create_image_edit=AsyncMock(),
+        process_image_edit=AsyncMock()
+    )
+    
+    monkeypatch = pytest.MonkeyPatch()
+    monkeypatch.setattr(UserMiddleware, "process_user", deps.process_user)
+    monkeypatch.setattr(commands.LoggingMiddleware, "log_interaction", deps.log_interaction)
+    monkeypatch.setattr(commands.UserService, "get_user_statistics", deps.get_user_statistics)
+    monkeypatch.setattr(messages, "download_file_bytes", deps.download_file_bytes)
+    monkeypatch.setattr(messages.ImageProcessor, "validate_image_fast", deps.validate_image_fast)
+    monkeypatch.setattr(messages.db, "create_image_edit", deps.create_image_edit)
+    monkeypatch.setattr(messages, "process_image_edit", deps.process_image_edit)
+    
+    yield deps
+    
+    monkeypatch.undo()
+
+
+@pytest.fixture
+def handler_deps(_patched_handler_deps, mock_user):
+    """Handler collaborator stubs, reset for each test"""
+    for mock in vars(_patched_handler_deps).values():
+        mock.reset_mock(return_value=True, side_effect=True)
+    
+    _patched_handler_deps.process_user.return_value = mock_user
+    _patched_handler_deps.create_image_edit.return_value = True
+    
+    return _patched_handler_deps
 
 
 class TestCommandHandlers:
     """Test command handlers"""
     
-    @pytest.mark.asyncio
-    async def test_start_command(self, mock_telegram_update, mock_telegram_context, mock_user):
+    async def test_start_command(self, mock_telegram_update, mock_telegram_context, mock_user, handler_deps):
         """Test /start command"""
         mock_telegram_context.user_data = {
             "db_user": mock_user,
             "is_new_user": True
         }
         
-        with patch('src.bot.handlers.commands.UserMiddleware.process_user', return_value=True), \
-             patch('src.bot.handlers.commands.LoggingMiddleware.log_interaction'):
-            
-            await start_command(mock_telegram_update, mock_telegram_context)
-            
-            # Check that reply_text was called
-            mock_telegram_update.message.reply_text.assert_called_once()
-            
-            # Check that the message contains welcome text
-            call_args = mock_telegram_update.message.reply_text.call_args
-            assert "Welcome" in call_args[0][0]
+        await start_command(mock_telegram_update, mock_telegram_context)
+        
+        # Check that reply_text was called
+        mock_telegram_update.message.reply_text.assert_called_once()
+        
+        # Check that the message contains welcome text
+        call_args = mock_telegram_update.message.reply_text.call_args
+        assert "Welcome" in call_args[0][0]
     
-    @pytest.mark.asyncio
-    async def test_help_command(self, mock_telegram_update, mock_telegram_context):
+    async def test_help_command(self, mock_telegram_update, mock_telegram_context, handler_deps):
         """Test /help command"""
-        with patch('src.bot.handlers.commands.UserMiddleware.process_user', return_value=True), \
-             patch('src.bot.handlers.commands.LoggingMiddleware.log_interaction'):
-            
-            await help_command(mock_telegram_update, mock_telegram_context)
-            
-            # Check that reply_text was called
-            mock_telegram_update.message.reply_text.assert_called_once()
-            
-            # Check that the message contains help text
-            call_args = mock_telegram_update.message.reply_text.call_args
-            assert "Help" in call_args[0][0] or "help" in call_args[0][0].lower()
+        await help_command(mock_telegram_update, mock_telegram_context)
+        
+        # Check that reply_text was called
+        mock_telegram_update.message.reply_text.assert_called_once()
+        
+        # Check that the message contains help text
+        call_args = mock_telegram_update.message.reply_text.call_args
+        assert "Help" in call_args[0][0] or "help" in call_args[0][0].lower()
     
-    @pytest.mark.asyncio
-    async def test_stats_command(self, mock_telegram_update, mock_telegram_context, mock_user):
+    async def test_stats_command(self, mock_telegram_update, mock_telegram_context, mock_user, handler_deps):
         """Test /stats command"""
         mock_telegram_context.user_data = {"db_user": mock_user}
         
@@ -60,38 +101,34 @@ class TestCommandHandlers:
             "success_rate": 80.0,
             "recent_edits_this_month": 5,
             "favorite_edit_types": {"color_change": 3},
-            "member_since": "2024-01-01",
-            "last_seen": "2024-01-15",
+            "member_since": datetime(2024, 1, 1),
+            "last_seen": datetime(2024, 1, 15),
             "recent_edits": []
         }
+        handler_deps.get_user_statistics.return_value = mock_stats
         
-        with patch('src.bot.handlers.commands.UserMiddleware.process_user', return_value=True), \
-             patch('src.bot.handlers.commands.LoggingMiddleware.log_interaction'), \
-             patch('src.bot.handlers.commands.UserService.get_user_statistics', return_value=mock_stats):
-            
-            await stats_command(mock_telegram_update, mock_telegram_context)
-            
-            # Check that reply_text was called
-            mock_telegram_update.message.reply_text.assert_called_once()
-            
-            # Check that the message contains statistics
-            call_args = mock_telegram_update.message.reply_text.call_args
-            message_text = call_args[0][0]
-            assert "Statistics" in message_text or "stats" in message_text.lower()
-            assert "10" in message_text  # total_edits
-            assert "80.0" in message_text  # success_rate
+        await stats_command(mock_telegram_update, mock_telegram_context)
+        
+        # Check that reply_text was called
+        mock_telegram_update.message.reply_text.assert_called_once()
+        
+        # Check that the message contains statistics
+        call_args = mock_telegram_update.message.reply_text.call_args
+        message_text = call_args[0][0]
+        assert "Statistics" in message_text or "stats" in message_text.lower()
+        assert "10" in message_text  # total_edits
+        assert "80.0" in message_text  # success_rate
 
 
 class TestMessageHandlers:
     """Test message handlers"""
     
-    @pytest.mark.asyncio
-    async def test_handle_photo_valid(self, mock_telegram_update, mock_telegram_context, mock_user, sample_image_bytes):
+    async def test_handle_photo_valid(self, mock_telegram_update, mock_telegram_context, mock_user, sample_image_bytes, handler_deps):
         """Test handling a valid photo"""
         # Mock photo message
         mock_photo = MagicMock()
+        mock_photo.file_size = 1024
         mock_photo.get_file = AsyncMock()
-        mock_photo.get_file.return_value.download_as_bytes = AsyncMock(return_value=sample_image_bytes)
         
         mock_telegram_update.message.photo = [mock_photo]
         mock_telegram_context.user_data = {"db_user": mock_user}
@@ -102,52 +139,69 @@ class TestMessageHandlers:
             "size": (1024, 1024),
             "file_size_mb": 0.5
         }
+        handler_deps.download_file_bytes.return_value = sample_image_bytes
+        handler_deps.validate_image_fast.return_value = mock_image_info
         
-        with patch('src.bot.handlers.messages.UserMiddleware.process_user', return_value=True), \
-             patch('src.bot.handlers.messages.LoggingMiddleware.log_interaction'), \
-             patch('src.bot.handlers.messages.ImageProcessor.validate_image', return_value=mock_image_info):
-            
-            await handle_photo(mock_telegram_update, mock_telegram_context)
-            
-            # Check that image was stored in context
-            assert "pending_image" in mock_telegram_context.user_data
-            assert mock_telegram_context.user_data["pending_image"]["bytes"] == sample_image_bytes
-            
-            # Check that reply was sent
-            mock_telegram_update.message.reply_text.assert_called_once()
-            call_args = mock_telegram_update.message.reply_text.call_args
-            assert "Image Received" in call_args[0][0]
+        await handle_photo(mock_telegram_update, mock_telegram_context)
+        
+        # Check that image was stored in the pending cache, metadata in context
+        assert "pending_image" in mock_telegram_context.user_data
+        assert "bytes" not in mock_telegram_context.user_data["pending_image"]
+        assert PENDING_IMAGES.get(mock_user.telegram_user_id) == sample_image_bytes
+        
+        # Check that reply was sent
+        mock_telegram_update.message.reply_text.assert_called_once()
+        call_args = mock_telegram_update.message.reply_text.call_args
+        assert "Image Received" in call_args[0][0]
     
-    @pytest.mark.asyncio
-    async def test_handle_photo_invalid(self, mock_telegram_update, mock_telegram_context, mock_user):
+    async def test_handle_photo_invalid(self, mock_telegram_update, mock_telegram_context, mock_user, handler_deps):
         """Test handling an invalid photo"""
         # Mock photo message
         mock_photo = MagicMock()
+        mock_photo.file_size = 1024
         mock_photo.get_file = AsyncMock()
-        mock_photo.get_file.return_value.download_as_bytes = AsyncMock(return_value=b"invalid_data")
         
         mock_telegram_update.message.photo = [mock_photo]
         mock_telegram_context.user_data = {"db_user": mock_user}
+        handler_deps.download_file_bytes.return_value = b"invalid_data"
+        handler_deps.validate_image_fast.side_effect = Exception("Invalid image")
         
-        with patch('src.bot.handlers.messages.UserMiddleware.process_user', return_value=True), \
-             patch('src.bot.handlers.messages.LoggingMiddleware.log_interaction'), \
-             patch('src.bot.handlers.messages.ImageProcessor.validate_image', side_effect=Exception("Invalid image")):
-            
-            await handle_photo(mock_telegram_update, mock_telegram_context)
-            
-            # Check that error message was sent
-            mock_telegram_update.message.reply_text.assert_called_once()
-            call_args = mock_telegram_update.message.reply_text.call_args
-            assert "Invalid Image" in call_args[0][0]
+        await handle_photo(mock_telegram_update, mock_telegram_context)
+        
+        # Check that error message was sent
+        mock_telegram_update.message.reply_text.assert_called_once()
+        call_args = mock_telegram_update.message.reply_text.call_args
+        assert "Invalid Image" in call_args[0][0]
+    
+    @pytest.mark.parametrize("photo_bytes,expected_reply,validated", [
+        (_PNG_HEADER + struct.pack(">II", 20000, 20000), "Image Too Large", False),
+        (_PNG_HEADER[:20], "Invalid Image", True),
+    ], ids=["oversized", "truncated_header"])
+    async def test_handle_photo_header_checks(self, mock_telegram_update, mock_telegram_context, mock_user,
+                                              handler_deps, photo_bytes, expected_reply, validated):
+        """Test that oversized images are refused from the header and truncated ones get validated"""
+        mock_photo = MagicMock()
+        mock_photo.file_size = 1024
+        mock_photo.get_file = AsyncMock()
+        
+        mock_telegram_update.message.photo = [mock_photo]
+        mock_telegram_context.user_data = {"db_user": mock_user}
+        handler_deps.download_file_bytes.return_value = photo_bytes
+        handler_deps.validate_image_fast.side_effect = Exception("cannot identify image file")
+        
+        await handle_photo(mock_telegram_update, mock_telegram_context)
+        
+        mock_telegram_update.message.reply_text.assert_called_once()
+        assert expected_reply in mock_telegram_update.message.reply_text.call_args[0][0]
+        assert handler_deps.validate_image_fast.called is validated
     
-    @pytest.mark.asyncio
-    async def test_handle_text_with_pending_image(self, mock_telegram_update, mock_telegram_context, mock_user, sample_image_bytes):
+    async def test_handle_text_with_pending_image(self, mock_telegram_update, mock_telegram_context, mock_user, sample_image_bytes, handler_deps):
         """Test handling text with pending image"""
         mock_telegram_update.message.text = "Change the car color to red"
+        PENDING_IMAGES.put(mock_user.telegram_user_id, sample_image_bytes)
         mock_telegram_context.user_data = {
             "db_user": mock_user,
             "pending_image": {
-                "bytes": sample_image_bytes,
                 "info": {"format": "JPEG", "size": (1024, 1024)},
                 "message_id": 12345
             }
@@ -157,77 +211,314 @@ class TestMessageHandlers:
         mock_processing_message = MagicMock()
         mock_telegram_update.message.reply_text.return_value = mock_processing_message
         
-        with patch('src.bot.handlers.messages.UserMiddleware.process_user', return_value=True), \
-             patch('src.bot.handlers.messages.LoggingMiddleware.log_interaction'), \
-             patch('src.bot.handlers.messages.db.create_image_edit', return_value=True), \
-             patch('src.bot.handlers.messages.process_image_edit') as mock_process:
-            
-            await handle_text(mock_telegram_update, mock_telegram_context)
-            
-            # Check that processing started
-            mock_process.assert_called_once()
-            
-            # Check that processing message was sent
-            mock_telegram_update.message.reply_text.assert_called()
+        await handle_text(mock_telegram_update, mock_telegram_context)
+        
+        # Check that processing started
+        handler_deps.process_image_edit.assert_called_once()
+        
+        # Check that processing message was sent
+        mock_telegram_update.message.reply_text.assert_called()
     
-    @pytest.mark.asyncio
-    async def test_handle_text_no_pending_image(self, mock_telegram_update, mock_telegram_context, mock_user):
-        """Test handling text without pending image"""
-        mock_telegram_update.message.text = "Change the car color to red"
+    @pytest.mark.parametrize("text,has_pending_image,expected_error", [
+        ("Change the car color to red", False, "send an image first"),
+        ("hi", True, "too short"),
+        ("x" * 600, True, "too long"),  # Over 500 character limit
+    ], ids=["no_pending_image", "prompt_too_short", "prompt_too_long"])
+    async def test_handle_text_rejected(self, mock_telegram_update, mock_telegram_context, mock_user,
+                                        sample_image_bytes, handler_deps, text, has_pending_image,
+                                        expected_error):
+        """Test handling text without a pending image or with a prompt that's too short/long"""
+        mock_telegram_update.message.text = text
         mock_telegram_context.user_data = {"db_user": mock_user}
-        
-        with patch('src.bot.handlers.messages.UserMiddleware.process_user', return_value=True), \
-             patch('src.bot.handlers.messages.LoggingMiddleware.log_interaction'):
-            
-            await handle_text(mock_telegram_update, mock_telegram_context)
-            
-            # Check that error message was sent
-            mock_telegram_update.message.reply_text.assert_called_once()
-            call_args = mock_telegram_update.message.reply_text.call_args
-            assert "send an image first" in call_args[0][0].lower()
-    
-    @pytest.mark.asyncio
-    async def test_handle_text_prompt_too_short(self, mock_telegram_update, mock_telegram_context, mock_user, sample_image_bytes):
-        """Test handling text with prompt too short"""
-        mock_telegram_update.message.text = "hi"
-        mock_telegram_context.user_data = {
-            "db_user": mock_user,
-            "pending_image": {
-                "bytes": sample_image_bytes,
+        if has_pending_image:
+            PENDING_IMAGES.put(mock_user.telegram_user_id, sample_image_bytes)
+            mock_telegram_context.user_data["pending_image"] = {
                 "info": {"format": "JPEG"},
                 "message_id": 12345
             }
-        }
         
-        with patch('src.bot.handlers.messages.UserMiddleware.process_user', return_value=True), \
-             patch('src.bot.handlers.messages.LoggingMiddleware.log_interaction'):
-            
-            await handle_text(mock_telegram_update, mock_telegram_context)
-            
-            # Check that error message was sent
-            mock_telegram_update.message.reply_text.assert_called_once()
-            call_args = mock_telegram_update.message.reply_text.call_args
-            assert "too short" in call_args[0][0].lower()
-    
-    @pytest.mark.asyncio
-    async def test_handle_text_prompt_too_long(self, mock_telegram_update, mock_telegram_context, mock_user, sample_image_bytes):
-        """Test handling text with prompt too long"""
-        mock_telegram_update.message.text = "x" * 600  # Over 500 character limit
+        await handle_text(mock_telegram_update, mock_telegram_context)
+        
+        # Check that error message was sent
+        mock_telegram_update.message.reply_text.assert_called_once()
+        call_args = mock_telegram_update.message.reply_text.call_args
+        assert expected_error in call_args[0][0].lower()
+
+
+class TestProcessImageEdit:
+    """Test running an edit and delivering its result"""
+    
+    EDITED_URL = "https://example.com/edited.jpg"
+    
+    @pytest.fixture
+    def edit_deps(self, monkeypatch, mock_user):
+        """Stub BFL.ai, the database and stats around process_image_edit"""
+        service = SimpleNamespace(
+            create_edit_request=AsyncMock(return_value=("test_id", "https://api.bfl.ai/v1/results/test_id")),
+            wait_for_completion=AsyncMock(return_value={"status": "Ready", "result": {"sample": self.EDITED_URL}}),
+            download_image=AsyncMock(return_value=b"edited_image_data")
+        )
+        deps = SimpleNamespace(
+            service=service,
+            update_image_edit_status=AsyncMock(return_value=True),
+            update_user_stats=AsyncMock(return_value=True)
+        )
+        
+        monkeypatch.setattr(messages, "get_shared_service", AsyncMock(return_value=service))
+        monkeypatch.setattr(messages.db, "update_image_edit_status", deps.update_image_edit_status)
+        monkeypatch.setattr(messages.db, "create_image_edit", AsyncMock(return_value=True))
+        monkeypatch.setattr(messages.UserService, "update_user_stats", deps.update_user_stats)
+        monkeypatch.setattr(UserMiddleware, "process_user", AsyncMock(return_value=mock_user))
+        monkeypatch.setattr(messages.LoggingMiddleware, "log_interaction", AsyncMock())
+        return deps
+    
+    @pytest.fixture
+    def image_edit(self, mock_user):
+        """Pending edit for mock_user"""
+        return ImageEdit(
+            user_id=mock_user.id,
+            telegram_user_id=mock_user.telegram_user_id,
+            telegram_message_id=12345,
+            prompt="Change the car color to red",
+            edit_type="color_change"
+        )
+    
+    async def test_success_recorded_after_delivery(self, edit_deps, image_edit, mock_telegram_update,
+                                                   mock_telegram_context, sample_image_bytes):
+        """Test that a delivered result is saved and counted as one success"""
+        delivered = []
+        mock_telegram_update.message.reply_photo = AsyncMock(
+            side_effect=lambda **kwargs: delivered.append(kwargs["photo"])
+        )
+        
+        async def update_user_stats(*args, **kwargs):
+            # Stats must only be written once the photo has gone out
+            assert delivered == [self.EDITED_URL]
+            return True
+        
+        edit_deps.update_user_stats.side_effect = update_user_stats
+        
+        await messages.process_image_edit(
+            image_edit, sample_image_bytes, mock_telegram_update, mock_telegram_context, MagicMock()
+        )
+        
+        assert image_edit.status == EditStatus.COMPLETED
+        edit_deps.update_image_edit_status.assert_awaited_once_with(image_edit)
+        edit_deps.update_user_stats.assert_awaited_once()
+        assert edit_deps.update_user_stats.call_args.kwargs["edit_success"] is True
+    
+    async def test_result_sent_by_url(self, edit_deps, image_edit, mock_telegram_update,
+                                      mock_telegram_context, sample_image_bytes):
+        """Test that Telegram is given the result URL to fetch itself"""
+        mock_telegram_update.message.reply_photo = AsyncMock()
+        
+        await messages.process_image_edit(
+            image_edit, sample_image_bytes, mock_telegram_update, mock_telegram_context, MagicMock()
+        )
+        
+        mock_telegram_update.message.reply_photo.assert_awaited_once()
+        assert mock_telegram_update.message.reply_photo.call_args.kwargs["photo"] == self.EDITED_URL
+        edit_deps.service.download_image.assert_not_called()
+    
+    async def test_result_uploaded_when_url_rejected(self, edit_deps, image_edit, mock_telegram_update,
+                                                     mock_telegram_context, sample_image_bytes):
+        """Test that a URL Telegram can't fetch is downloaded and uploaded instead"""
+        mock_telegram_update.message.reply_photo = AsyncMock(
+            side_effect=[BadRequest("Wrong file identifier/http url specified"), None]
+        )
+        
+        await messages.process_image_edit(
+            image_edit, sample_image_bytes, mock_telegram_update, mock_telegram_context, MagicMock()
+        )
+        
+        edit_deps.service.download_image.assert_awaited_once_with(self.EDITED_URL)
+        photos = [call.kwargs["photo"] for call in mock_telegram_update.message.reply_photo.call_args_list]
+        assert photos == [self.EDITED_URL, b"edited_image_data"]
+        assert edit_deps.update_user_stats.call_args.kwargs["edit_success"] is True
+    
+    async def test_delivery_failure_counted_once_as_failure(self, edit_deps, mock_telegram_update,
+                                                            mock_telegram_context, mock_user,
+                                                            sample_image_bytes):
+        """Test that an edit whose result can't be delivered is only counted as failed"""
+        mock_telegram_update.message.text = "Change the car color to red"
+        mock_telegram_update.message.reply_text = AsyncMock(return_value=MagicMock(edit_text=AsyncMock()))
+        mock_telegram_update.message.reply_photo = AsyncMock(side_effect=BadRequest("Wrong file identifier"))
+        edit_deps.service.download_image.side_effect = BFLAPIError("Failed to download image: 404")
+        PENDING_IMAGES.put(mock_user.telegram_user_id, sample_image_bytes)
         mock_telegram_context.user_data = {
             "db_user": mock_user,
-            "pending_image": {
-                "bytes": sample_image_bytes,
-                "info": {"format": "JPEG"},
-                "message_id": 12345
-            }
+            "pending_image": {"info": {"format": "JPEG"}, "message_id": 12345}
         }
         
-        with patch('src.bot.handlers.messages.UserMiddleware.process_user', return_value=True), \
-             patch('src.bot.handlers.messages.LoggingMiddleware.log_interaction'):
+        await handle_text(mock_telegram_update, mock_telegram_context)
+        
+        edit_deps.update_user_stats.assert_awaited_once()
+        assert edit_deps.update_user_stats.call_args.kwargs["edit_success"] is False
+        image_edit = edit_deps.update_image_edit_status.call_args_list[-1].args[0]
+        assert image_edit.status == EditStatus.FAILED
+
+
+class TestAdminHandlers:
+    """Test admin handlers"""
+    
+    @pytest.fixture
+    def admin_handler(self):
+        """admin_only-wrapped handler that records its calls"""
+        calls = []
+        
+        @admin.admin_only
+        async def handler(update, context, user):
+            calls.append(user)
+        
+        handler.calls = calls
+        return handler
+    
+    async def test_admin_only_denies_non_admin(self, handler_deps, admin_handler, monkeypatch,
+                                               mock_telegram_update, mock_telegram_context):
+        """Test that a non-admin is refused and the handler never runs"""
+        monkeypatch.setattr(admin.UserService, "is_user_admin", MagicMock(return_value=False))
+        
+        await admin_handler(mock_telegram_update, mock_telegram_context)
+        
+        assert admin_handler.calls == []
+        mock_telegram_update.message.reply_text.assert_called_once_with("❌ Access denied. Admin only command.")
+        handler_deps.log_interaction.assert_not_called()
+    
+    async def test_admin_only_passes_user(self, handler_deps, admin_handler, monkeypatch, mock_user,
+                                          mock_telegram_update, mock_telegram_context):
+        """Test that an admin's handler gets the database user"""
+        monkeypatch.setattr(admin.UserService, "is_user_admin", MagicMock(return_value=True))
+        
+        await admin_handler(mock_telegram_update, mock_telegram_context)
+        
+        assert admin_handler.calls == [mock_user]
+        handler_deps.log_interaction.assert_called_once()
+    
+    async def test_admin_only_middleware_error(self, handler_deps, admin_handler,
+                                               mock_telegram_update, mock_telegram_context):
+        """Test that a database error during the checks gets an error reply"""
+        handler_deps.process_user.side_effect = RuntimeError("database unavailable")
+        
+        await admin_handler(mock_telegram_update, mock_telegram_context)
+        
+        assert admin_handler.calls == []
+        mock_telegram_update.message.reply_text.assert_called_once_with("⚠️ Error processing admin command.")
+    
+    async def test_bot_analytics_cached_for_ttl(self, monkeypatch):
+        """Test that analytics are fetched once per TTL window"""
+        now = [1000.0]
+        get_bot_analytics = AsyncMock(return_value={"total_users": 10})
+        monkeypatch.setattr(admin.time, "monotonic", lambda: now[0])
+        monkeypatch.setattr(admin.UserService, "get_bot_analytics", get_bot_analytics)
+        monkeypatch.setattr(admin, "_analytics_cache", None)
+        
+        await admin._get_cached_bot_analytics()
+        now[0] += admin._ANALYTICS_TTL - 1
+        await admin._get_cached_bot_analytics()
+        
+        assert get_bot_analytics.await_count == 1
+        
+        now[0] += 1
+        get_bot_analytics.return_value = {"total_users": 11}
+        
+        assert await admin._get_cached_bot_analytics() == {"total_users": 11}
+        assert get_bot_analytics.await_count == 2
+
+
+class TestPendingImageCache:
+    """Test the pending image store"""
+    
+    def test_put_get_discard(self):
+        """Test storing and discarding a pending image"""
+        cache = PendingImageCache(max_bytes=1024)
+        cache.put(1, b"image")
+        
+        assert cache.get(1) == b"image"
+        assert cache.get(2) is None
+        
+        cache.discard(1)
+        cache.discard(1)
+        assert cache.get(1) is None
+    
+    def test_evicts_beyond_byte_budget(self):
+        """Test that a new upload evicts the oldest ones once the byte budget is exceeded"""
+        cache = PendingImageCache(max_bytes=10)
+        cache.put(1, b"1234")
+        cache.put(2, b"1234")
+        cache.put(3, b"12")
+        
+        cache.put(4, b"123456")
+        
+        assert cache.get(1) is None
+        assert cache.get(2) is None
+        assert cache.get(3) == b"12"
+        assert cache.get(4) == b"123456"
+
+class TestUserMiddleware:
+    """Test user middleware"""
+    
+    async def test_process_user_caches_lookup(self):
+        """Test that a recently seen user is served from the cache until invalidated"""
+        db_user = User(telegram_user_id=555, first_name="Cached")
+        update = MagicMock()
+        update.effective_user.id = 555
+        context = MagicMock()
+        context.user_data = {}
+        
+        with patch('src.bot.middleware.UserService.get_or_create_user',
+                   AsyncMock(return_value=(db_user, True))) as mock_get:
             
-            await handle_text(mock_telegram_update, mock_telegram_context)
+            assert await UserMiddleware.process_user(update, context) is db_user
+            assert await UserMiddleware.process_user(update, context) is db_user
+            assert mock_get.await_count == 1
             
-            # Check that error message was sent
-            mock_telegram_update.message.reply_text.assert_called_once()
-            call_args = mock_telegram_update.message.reply_text.call_args
-            assert "too long" in call_args[0][0].lower()
+            UserMiddleware.invalidate_user(555)
+            await UserMiddleware.process_user(update, context)
+            assert mock_get.await_count == 2
+        
+        UserMiddleware.invalidate_user(555)
+
+
+class TestRateLimitMiddleware:
+    """Test rate limit middleware"""
+    
+    @pytest.fixture
+    def clock(self, monkeypatch):
+        """Controllable time.monotonic for the token buckets"""
+        now = [1000.0]
+        monkeypatch.setattr(middleware.time, "monotonic", lambda: now[0])
+        return now
+    
+    @staticmethod
+    def _update(user_id: int):
+        """Update from the given user"""
+        update = MagicMock()
+        update.effective_user.id = user_id
+        update.message.reply_text = AsyncMock()
+        return update
+    
+    async def test_limit_and_refill(self, clock):
+        """Test that a full bucket allows a burst, then refills over time"""
+        limiter = RateLimitMiddleware()
+        update = self._update(555)
+        
+        for _ in range(limiter.max_requests_per_minute):
+            assert await limiter.check_rate_limit(update, MagicMock()) is True
+        
+        assert await limiter.check_rate_limit(update, MagicMock()) is False
+        update.message.reply_text.assert_awaited_once()
+        
+        # One token comes back every 60 / max_requests_per_minute seconds
+        clock[0] += 60 / limiter.max_requests_per_minute
+        assert await limiter.check_rate_limit(update, MagicMock()) is True
+        assert await limiter.check_rate_limit(update, MagicMock()) is False
+    
+    async def test_evicts_least_recently_seen(self, clock):
+        """Test that the oldest user's bucket is dropped once the cap is reached"""
+        limiter = RateLimitMiddleware()
+        limiter.max_tracked_users = 2
+        
+        for user_id in (1, 2, 1, 3):
+            await limiter.check_rate_limit(self._update(user_id), MagicMock())
+        
+        assert list(limiter.buckets) == [1, 3]
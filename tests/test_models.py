@@ -1,12 +1,14 @@
 """
 Tests for database models
+
+PYTEST_DONT_REWRITE: plain equality asserts only, so skip assertion rewriting
 """
 
 import pytest
-from datetime import datetime
+from datetime import datetime, date, timedelta
 from bson import ObjectId
 
-from src.models import User, UserStats, ImageEdit, EditStatus, BotAnalytics
+from src.models import User, UserStats, ImageEdit, EditStatus, BotAnalytics, DailyStats
 
 
 class TestUser:
@@ -29,33 +31,28 @@ class TestUser:
         assert user.is_banned is False
         assert isinstance(user.stats, UserStats)
     
-    def test_user_full_name(self):
+    @pytest.mark.parametrize("name_fields,expected", [
+        ({"first_name": "Test", "last_name": "User"}, "Test User"),
+        ({"first_name": "Test"}, "Test"),
+        ({"username": "test_user"}, "@test_user"),
+        ({}, "User 123456789"),
+    ], ids=["first_and_last_name", "first_name_only", "username_only", "no_name"])
+    def test_user_full_name(self, name_fields, expected):
         """Test user full name property"""
-        # Test with first and last name
-        user = User(
-            telegram_user_id=123456789,
-            first_name="Test",
-            last_name="User"
-        )
-        assert user.full_name == "Test User"
-        
-        # Test with only first name
-        user = User(
-            telegram_user_id=123456789,
-            first_name="Test"
-        )
+        user = User(telegram_user_id=123456789, **name_fields)
+        assert user.full_name == expected
+    
+    def test_full_name_cache_invalidation(self):
+        """Test cached full name is recomputed after a name change"""
+        user = User(telegram_user_id=123456789, first_name="Test")
         assert user.full_name == "Test"
         
-        # Test with only username
-        user = User(
-            telegram_user_id=123456789,
-            username="test_user"
-        )
-        assert user.full_name == "@test_user"
+        user.last_name = "User"
+        assert user.full_name == "Test User"
         
-        # Test with no name info
-        user = User(telegram_user_id=123456789)
-        assert user.full_name == "User 123456789"
+        user.first_name = None
+        user.username = "test_user"
+        assert user.full_name == "@test_user"
     
     def test_user_success_rate(self):
         """Test user success rate calculation"""
@@ -69,21 +66,48 @@ class TestUser:
         user.stats.successful_edits = 8
         assert user.success_rate == 80.0
     
-    def test_increment_edit_count(self):
+    @pytest.mark.parametrize("outcomes,expected", [
+        ([True], (1, 1, 0)),
+        ([False], (1, 0, 1)),
+        ([True, False], (2, 1, 1)),
+    ], ids=["success", "failure", "success_then_failure"])
+    def test_increment_edit_count(self, outcomes, expected):
         """Test incrementing edit count"""
         user = User(telegram_user_id=123456789)
         
-        # Successful edit
-        user.increment_edit_count(success=True)
-        assert user.stats.total_edits == 1
-        assert user.stats.successful_edits == 1
-        assert user.stats.failed_edits == 0
+        for success in outcomes:
+            user.increment_edit_count(success=success)
+        
+        stats = user.stats
+        assert (stats.total_edits, stats.successful_edits, stats.failed_edits) == expected
+    
+    def test_model_dump_for_mongo_stats_paths(self):
+        """Test stats mutations are dumped as dotted paths"""
+        user = User.from_mongo({"telegram_user_id": 123456789})
         
-        # Failed edit
         user.increment_edit_count(success=False)
-        assert user.stats.total_edits == 2
-        assert user.stats.successful_edits == 1
-        assert user.stats.failed_edits == 1
+        user.add_favorite_edit_type("text_edit")
+        fields = user.model_dump_for_mongo()
+        
+        assert fields["stats.total_edits"] == 1
+        assert fields["stats.failed_edits"] == 1
+        assert fields["stats.favorite_edit_types.text_edit"] == 1
+        assert "stats.last_edit_date" in fields
+        assert "updated_at" in fields
+        assert "stats" not in fields
+        
+        user.stats = UserStats()
+        assert fields.keys() - user.model_dump_for_mongo().keys() >= {"stats.total_edits"}
+        assert user.model_dump_for_mongo()["stats"]["total_edits"] == 0
+    
+    def test_update_last_seen(self):
+        """Test that last_seen and updated_at share one timestamp"""
+        user = User(telegram_user_id=123456789)
+        
+        user.update_last_seen()
+        
+        assert user.last_seen == user.updated_at
+        assert user.last_seen >= user.created_at
     
     def test_add_favorite_edit_type(self):
         """Test adding favorite edit types"""
@@ -97,15 +121,97 @@ class TestUser:
         
         user.add_favorite_edit_type("text_edit")
         assert user.stats.favorite_edit_types["text_edit"] == 1
+    
+    def test_preferences_validation(self):
+        """Test aspect ratio and output format validation"""
+        user = User(telegram_user_id=123456789, preferred_aspect_ratio="16:9", preferred_output_format="PNG")
+        assert user.preferred_aspect_ratio == "16:9"
+        assert user.preferred_output_format == "png"
+        
+        with pytest.raises(ValueError):
+            User(telegram_user_id=123456789, preferred_aspect_ratio="5:4")
+        
+        with pytest.raises(ValueError):
+            User(telegram_user_id=123456789, preferred_output_format="gif")
+    
+    def test_from_dict_validated(self):
+        """Test that untrusted input is still validated"""
+        with pytest.raises(ValueError):
+            User.from_dict_validated({"telegram_user_id": -1})
+        
+        user = User.from_dict({"telegram_user_id": 123456789, "stats": {"total_edits": 2}})
+        assert user.stats.total_edits == 2
+    
+    def test_to_dict_matches_model_dump(self, stable_object_id):
+        """Test that the hand-written MongoDB dict covers every field"""
+        user = User(id=stable_object_id, telegram_user_id=123456789, username="john_doe")
+        user.add_favorite_edit_type("color_change")
+        
+        assert user.to_dict() == user.model_dump(by_alias=True)
+    
+    def test_object_id_validation(self, stable_object_id):
+        """Test accepting ObjectIds and their hex strings only"""
+        object_id = stable_object_id
+        
+        assert User(id=object_id, telegram_user_id=123456789).id is object_id
+        assert User(id=str(object_id), telegram_user_id=123456789).id == object_id
+        
+        with pytest.raises(ValueError):
+            User(id="not-an-object-id", telegram_user_id=123456789)
+    
+    def test_object_id_hex_is_cached(self):
+        """Test repeat hex ids reuse the parsed ObjectId"""
+        hex_id = str(ObjectId())
+        
+        first = User(id=hex_id, telegram_user_id=123456789).id
+        second = User(id=hex_id, telegram_user_id=123456789).id
+        
+        assert first == ObjectId(hex_id)
+        assert second is first
+    
+    def test_id_serialization(self, stable_object_id):
+        """Test that the ObjectId stays native for MongoDB and becomes a string in JSON"""
+        user = User(id=stable_object_id, telegram_user_id=123456789)
+        
+        assert isinstance(user.model_dump(by_alias=True)["_id"], ObjectId)
+        assert user.model_dump(mode="json", by_alias=True)["_id"] == str(user.id)
+    
+    def test_from_mongo(self):
+        """Test building a user from a stored document"""
+        stored = User(telegram_user_id=123456789, first_name="John")
+        stored.increment_edit_count(success=True)
+        
+        user = User.from_mongo(stored.model_dump(by_alias=True))
+        
+        assert user.id == stored.id
+        assert user.full_name == "John"
+        assert user.stats.successful_edits == 1
 
 
 class TestImageEdit:
     """Test ImageEdit model"""
     
-    def test_image_edit_creation(self):
+    @pytest.fixture(scope="class")
+    def edit_prototype(self, stable_object_id):
+        """Image edit that the tests below work on copies of"""
+        return ImageEdit(
+            user_id=stable_object_id,
+            telegram_user_id=123456789,
+            telegram_message_id=12345,
+            prompt="Test prompt"
+        )
+    
+    @pytest.fixture(scope="class")
+    def processing_prototype(self, edit_prototype):
+        """Copy of edit_prototype that has already started processing"""
+        edit = edit_prototype.model_copy(deep=True)
+        edit.start_processing("test_id", "test_url")
+        return edit
+    
+    def test_image_edit_creation(self, stable_object_id):
         """Test creating an image edit"""
         edit = ImageEdit(
-            user_id=ObjectId(),
+            user_id=stable_object_id,
             telegram_user_id=123456789,
             telegram_message_id=12345,
             prompt="Change the car color to red"
@@ -116,14 +222,9 @@ class TestImageEdit:
         assert edit.status == EditStatus.PENDING
         assert edit.retry_count == 0
     
-    def test_start_processing(self):
+    def test_start_processing(self, edit_prototype):
         """Test starting processing"""
-        edit = ImageEdit(
-            user_id=ObjectId(),
-            telegram_user_id=123456789,
-            telegram_message_id=12345,
-            prompt="Test prompt"
-        )
+        edit = edit_prototype.model_copy(deep=True)
         
         edit.start_processing("test_id", "test_url")
         
@@ -132,16 +233,10 @@ class TestImageEdit:
         assert edit.bfl_polling_url == "test_url"
         assert edit.started_at is not None
     
-    def test_complete_successfully(self):
+    def test_complete_successfully(self, processing_prototype):
         """Test successful completion"""
-        edit = ImageEdit(
-            user_id=ObjectId(),
-            telegram_user_id=123456789,
-            telegram_message_id=12345,
-            prompt="Test prompt"
-        )
+        edit = processing_prototype.model_copy(deep=True)
         
-        edit.start_processing("test_id", "test_url")
         edit.complete_successfully("https://example.com/image.jpg")
         
         assert edit.status == EditStatus.COMPLETED
@@ -150,16 +245,10 @@ class TestImageEdit:
         assert edit.processing_time_seconds is not None
         assert edit.is_successful is True
     
-    def test_fail_with_error(self):
+    def test_fail_with_error(self, processing_prototype):
         """Test failing with error"""
-        edit = ImageEdit(
-            user_id=ObjectId(),
-            telegram_user_id=123456789,
-            telegram_message_id=12345,
-            prompt="Test prompt"
-        )
+        edit = processing_prototype.model_copy(deep=True)
         
-        edit.start_processing("test_id", "test_url")
         edit.fail_with_error("Test error")
         
         assert edit.status == EditStatus.FAILED
@@ -167,41 +256,25 @@ class TestImageEdit:
         assert edit.completed_at is not None
         assert edit.is_successful is False
     
-    def test_classify_edit_type(self):
+    @pytest.mark.parametrize("prompt,expected", [
+        ("Replace 'Hello' with 'Welcome'", "text_edit"),
+        ("Change the car color to red", "color_change"),
+        ("Remove the person from the image", "object_modification"),
+        ("Make the background a sunset beach", "background_change"),
+        ("Make it look better", "general_edit"),
+        # Keywords match anywhere in the prompt, not just whole words
+        ("Recolor the walls", "color_change"),
+        # Earlier types win when a prompt matches several
+        ("Add a sunset background", "object_modification"),
+    ])
+    def test_classify_edit_type(self, edit_prototype, prompt, expected):
         """Test edit type classification"""
-        # Text edit
-        edit = ImageEdit(
-            user_id=ObjectId(),
-            telegram_user_id=123456789,
-            telegram_message_id=12345,
-            prompt="Replace 'Hello' with 'Welcome'"
-        )
-        assert edit.classify_edit_type() == "text_edit"
-        
-        # Color change
-        edit.prompt = "Change the car color to red"
-        assert edit.classify_edit_type() == "color_change"
-        
-        # Object modification
-        edit.prompt = "Remove the person from the image"
-        assert edit.classify_edit_type() == "object_modification"
-        
-        # Background change
-        edit.prompt = "Add a sunset background"
-        assert edit.classify_edit_type() == "background_change"
-        
-        # General edit
-        edit.prompt = "Make it look better"
-        assert edit.classify_edit_type() == "general_edit"
+        edit = edit_prototype.model_copy(update={"prompt": prompt})
+        assert edit.classify_edit_type() == expected
     
-    def test_can_retry(self):
+    def test_can_retry(self, processing_prototype):
         """Test retry logic"""
-        edit = ImageEdit(
-            user_id=ObjectId(),
-            telegram_user_id=123456789,
-            telegram_message_id=12345,
-            prompt="Test prompt"
-        )
+        edit = processing_prototype.model_copy(deep=True)
         
         # Failed edit with retries available
         edit.fail_with_error("Test error")
@@ -214,11 +287,56 @@ class TestImageEdit:
         # Successful edit
         edit.complete_successfully("test_url")
         assert edit.can_retry() is False
+    
+    def test_object_id_serialization(self, edit_prototype):
+        """Test that ObjectIds stay native for MongoDB and become strings in JSON"""
+        edit = edit_prototype.model_copy(deep=True)
+        
+        assert isinstance(edit.model_dump()["user_id"], ObjectId)
+        data = edit.model_dump(mode="json")
+        assert data["id"] == str(edit.id)
+        assert data["user_id"] == str(edit.user_id)
+    
+    def test_from_mongo(self, stable_object_id):
+        """Test building an edit from a stored document"""
+        stored = ImageEdit(
+            user_id=stable_object_id,
+            telegram_user_id=123456789,
+            telegram_message_id=12345,
+            prompt="Test prompt",
+            status=EditStatus.COMPLETED
+        )
+        
+        data = stored.model_dump(by_alias=True)
+        data["status"] = "completed"  # Enums come back from MongoDB as plain strings
+        
+        edit = ImageEdit.from_mongo(data)
+        
+        assert edit.id == stored.id
+        assert edit.status is EditStatus.COMPLETED
+        assert edit.is_successful is True
 
 
 class TestBotAnalytics:
     """Test BotAnalytics model"""
     
+    @pytest.fixture(scope="class")
+    def seeded_analytics(self):
+        """Analytics with totals and edit types filled in, for read-only tests"""
+        return BotAnalytics(
+            total_users=100,
+            total_edits=500,
+            successful_edits=450,
+            success_rate=90.0,
+            average_processing_time=25.5,
+            popular_edit_types={
+                "color_change": 10,
+                "text_edit": 5,
+                "background_change": 8,
+                "object_modification": 3
+            }
+        )
+    
     def test_analytics_creation(self):
         """Test creating analytics"""
         analytics = BotAnalytics()
@@ -248,39 +366,33 @@ class TestBotAnalytics:
         assert analytics.popular_edit_types["color_change"] == 1
         assert len(analytics.daily_stats) == 1
     
-    def test_get_top_edit_types(self):
-        """Test getting top edit types"""
-        analytics = BotAnalytics()
+    def test_get_daily_stats(self):
+        """Test filtering daily stats by age"""
+        analytics = BotAnalytics(daily_stats=[
+            DailyStats(date=date.today()),
+            DailyStats(date=date.today() - timedelta(days=30))
+        ])
         
-        # Add some edit types
-        analytics.popular_edit_types = {
-            "color_change": 10,
-            "text_edit": 5,
-            "background_change": 8,
-            "object_modification": 3
-        }
+        recent = analytics.get_daily_stats(days=7)
         
-        top_types = analytics.get_top_edit_types(limit=3)
+        assert [stat.date for stat in recent] == [date.today()]
+    
+    def test_get_top_edit_types(self, seeded_analytics):
+        """Test getting top edit types"""
+        top_types = seeded_analytics.get_top_edit_types(limit=3)
         
         assert len(top_types) == 3
         assert top_types[0] == ("color_change", 10)
         assert top_types[1] == ("background_change", 8)
         assert top_types[2] == ("text_edit", 5)
     
-    def test_get_performance_summary(self):
+    def test_get_performance_summary(self, seeded_analytics):
         """Test getting performance summary"""
-        analytics = BotAnalytics()
-        analytics.total_users = 100
-        analytics.total_edits = 500
-        analytics.successful_edits = 450
-        analytics.success_rate = 90.0
-        analytics.average_processing_time = 25.5
-        
-        summary = analytics.get_performance_summary()
+        summary = seeded_analytics.get_performance_summary()
         
         assert summary["total_users"] == 100
         assert summary["total_edits"] == 500
         assert summary["success_rate"] == 90.0
         assert summary["average_processing_time"] == 25.5
-        assert "top_edit_types" in summary
+        assert summary["top_edit_types"][0] == ("color_change", 10)
         assert "last_updated" in summary
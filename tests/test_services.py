@@ -1,20 +1,29 @@
 """
 Tests for service classes
+
+PYTEST_DONT_REWRITE: plain equality asserts only, so skip assertion rewriting
 """
 
+import base64
+import io
+import os
+import subprocess
+import sys
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 import aiohttp
+import orjson
+from PIL import Image, JpegImagePlugin
 
-from src.services import BFLAPIService, ImageProcessor, UserService
+from src.services import BFLAPIService, ImageProcessor, UserService, user_service
+from src.services.bfl_api import BFLAPIError, BFLRateLimitError, get_shared_service, get_shared_session, close_shared_session
 from src.models import User, ImageEdit, EditStatus
 
 
 class TestBFLAPIService:
     """Test BFL.ai API service"""
     
-    @pytest.mark.asyncio
-    async def test_encode_image_to_base64(self):
+    def test_encode_image_to_base64(self):
         """Test image encoding to base64"""
         image_bytes = b"test_image_data"
         encoded = BFLAPIService.encode_image_to_base64(image_bytes)
@@ -22,80 +31,179 @@ class TestBFLAPIService:
         assert isinstance(encoded, str)
         assert len(encoded) > 0
     
-    def test_validate_image_size(self):
+    def test_encode_image_to_base64_buffers(self):
+        """Test that every buffer type encodes to the same standard base64"""
+        image_bytes = bytes(range(256)) * 4
+        expected = base64.b64encode(image_bytes).decode("ascii")
+        
+        for buffer in (image_bytes, bytearray(image_bytes), memoryview(image_bytes)):
+            assert BFLAPIService.encode_image_to_base64(buffer) == expected
+    
+    def test_validate_image_size(self, small_image_bytes, oversized_image_bytes):
         """Test image size validation"""
-        # Valid size
-        small_image = b"x" * (5 * 1024 * 1024)  # 5MB
-        assert BFLAPIService.validate_image_size(small_image) is True
+        assert BFLAPIService.validate_image_size(small_image_bytes) is True
+        assert BFLAPIService.validate_image_size(oversized_image_bytes) is False
+    
+    def test_get_poll_delay(self):
+        """Test polling backoff grows and is capped"""
+        first = BFLAPIService.get_poll_delay(0, 2.0)
+        assert 0.5 <= first <= 0.7
         
-        # Invalid size
-        large_image = b"x" * (25 * 1024 * 1024)  # 25MB
-        assert BFLAPIService.validate_image_size(large_image) is False
+        third = BFLAPIService.get_poll_delay(2, 2.0)
+        assert 1.125 <= third <= 1.325
+        
+        capped = BFLAPIService.get_poll_delay(20, 2.0)
+        assert 2.0 <= capped <= 2.2
     
-    @pytest.mark.asyncio
-    async def test_create_edit_request(self):
-        """Test creating edit request"""
-        service = BFLAPIService()
+    @pytest.mark.parametrize("response_kwargs,call,verb,expected", [
+        (
+            {"body": orjson.dumps({
+                "id": "test_request_id",
+                "polling_url": "https://api.bfl.ai/v1/results/test_request_id"
+            })},
+            lambda service: service.create_edit_request(prompt="Test prompt", input_image_base64="fake_base64"),
+            "POST",
+            ("test_request_id", "https://api.bfl.ai/v1/results/test_request_id")
+        ),
+        (
+            {"body": orjson.dumps({
+                "status": "Ready",
+                "result": {"sample": "https://example.com/image.jpg"}
+            })},
+            lambda service: service.poll_result("https://api.bfl.ai/v1/results/test"),
+            "GET",
+            {"status": "Ready", "result": {"sample": "https://example.com/image.jpg"}}
+        ),
+        (
+            {"chunks": [b"fake_", b"image_data"]},
+            lambda service: service.download_image("https://example.com/image.jpg"),
+            "GET",
+            b"fake_image_data"
+        ),
+    ], ids=["create_edit_request", "poll_result", "download_image"])
+    async def test_request(self, bfl_session, response_kwargs, call, verb, expected):
+        """Test creating an edit request, polling for results and downloading the image"""
+        service = BFLAPIService(bfl_session)
+        bfl_session.respond_with(**response_kwargs)
         
-        # Mock the session
-        mock_response = AsyncMock()
-        mock_response.status = 200
-        mock_response.json = AsyncMock(return_value={
-            "id": "test_request_id",
-            "polling_url": "https://api.bfl.ai/v1/results/test_request_id"
-        })
+        result = await call(service)
         
-        mock_session = AsyncMock()
-        mock_session.post.return_value.__aenter__.return_value = mock_response
-        service.session = mock_session
+        assert result == expected
+        assert [request[0] for request in bfl_session.requests] == [verb]
+    
+    async def test_download_image_rejects_large_content_length(self, bfl_session):
+        """Test that an oversized download is refused before reading the body"""
+        service = BFLAPIService(bfl_session)
+        response = bfl_session.respond_with(chunks=[b"x"], content_length=100 * 1024 * 1024)
         
-        request_id, polling_url = await service.create_edit_request(
-            prompt="Test prompt",
-            input_image_base64="fake_base64"
-        )
+        with pytest.raises(BFLAPIError):
+            await service.download_image("https://example.com/image.jpg")
+        
+        assert response.chunked_reads == 0
+    
+    async def test_download_image_stops_at_size_limit(self, bfl_session):
+        """Test that a download without Content-Length stops once it exceeds the limit"""
+        service = BFLAPIService(bfl_session)
+        chunk = b"x" * (8 * 1024 * 1024)
+        bfl_session.respond_with(chunks=[chunk, chunk, chunk], content_length=None)
         
-        assert request_id == "test_request_id"
-        assert polling_url == "https://api.bfl.ai/v1/results/test_request_id"
+        with pytest.raises(BFLAPIError):
+            await service.download_image("https://example.com/image.jpg")
     
-    @pytest.mark.asyncio
-    async def test_poll_result(self):
-        """Test polling for results"""
+    async def test_wait_for_completion_honors_retry_after(self):
+        """Test that a rate-limited poll waits for Retry-After instead of failing"""
         service = BFLAPIService()
+        service.poll_result = AsyncMock(side_effect=[
+            BFLRateLimitError("Polling rate limited", retry_after=3.0),
+            {"status": "Ready", "result": {"sample": "https://example.com/image.jpg"}}
+        ])
         
-        # Mock the session
-        mock_response = AsyncMock()
-        mock_response.status = 200
-        mock_response.json = AsyncMock(return_value={
-            "status": "Ready",
-            "result": {"sample": "https://example.com/image.jpg"}
-        })
+        with patch('src.services.bfl_api.asyncio.sleep', new_callable=AsyncMock) as mock_sleep:
+            result = await service.wait_for_completion("https://api.bfl.ai/v1/results/test")
         
-        mock_session = AsyncMock()
-        mock_session.get.return_value.__aenter__.return_value = mock_response
-        service.session = mock_session
+        assert result["status"] == "Ready"
+        mock_sleep.assert_awaited_once_with(3.0)
+    
+    async def test_wait_for_completion_polls_before_sleeping(self):
+        """Test that a job already Ready on the first poll returns without waiting"""
+        service = BFLAPIService()
+        service.poll_result = AsyncMock(return_value={
+            "status": "Ready", "result": {"sample": "https://example.com/image.jpg"}
+        })
         
-        result = await service.poll_result("https://api.bfl.ai/v1/results/test")
+        with patch('src.services.bfl_api.asyncio.sleep', new_callable=AsyncMock) as mock_sleep:
+            result = await service.wait_for_completion("https://api.bfl.ai/v1/results/test")
         
         assert result["status"] == "Ready"
-        assert result["result"]["sample"] == "https://example.com/image.jpg"
+        service.poll_result.assert_awaited_once()
+        mock_sleep.assert_not_awaited()
     
-    @pytest.mark.asyncio
-    async def test_download_image(self):
-        """Test downloading image"""
+    async def test_wait_for_completion_resets_backoff_on_status_change(self):
+        """Test that polling speeds up again once the job changes status"""
         service = BFLAPIService()
+        service.poll_result = AsyncMock(side_effect=[
+            {"status": "Pending"},
+            {"status": "Pending"},
+            {"status": "Processing"},
+            {"status": "Ready"}
+        ])
         
-        # Mock the session
-        mock_response = AsyncMock()
-        mock_response.status = 200
-        mock_response.read = AsyncMock(return_value=b"fake_image_data")
+        with patch('src.services.bfl_api.asyncio.sleep', new_callable=AsyncMock), \
+             patch.object(BFLAPIService, 'get_poll_delay', return_value=0) as mock_delay:
+            await service.wait_for_completion("https://api.bfl.ai/v1/results/test", polling_interval=2)
         
-        mock_session = AsyncMock()
-        mock_session.get.return_value.__aenter__.return_value = mock_response
-        service.session = mock_session
+        assert [call.args[0] for call in mock_delay.call_args_list] == [0, 1, 0]
+
+    
+    async def test_shared_session_reused(self):
+        """Test that the shared session is reused and left open by services"""
+        session = await get_shared_session()
+        try:
+            assert await get_shared_session() is session
+            
+            service = BFLAPIService(session)
+            await service.close_session()
+            assert not session.closed
+        finally:
+            await close_shared_session()
         
-        image_data = await service.download_image("https://example.com/image.jpg")
+        assert session.closed
+    
+    async def test_shared_service_reused(self):
+        """Test that handlers share one service bound to the shared session"""
+        try:
+            service = await get_shared_service()
+            assert await get_shared_service() is service
+            assert service.session is await get_shared_session()
+        finally:
+            await close_shared_session()
         
-        assert image_data == b"fake_image_data"
+        service_after_close = await get_shared_service()
+        try:
+            assert service_after_close is not service
+            assert not service_after_close.session.closed
+        finally:
+            await close_shared_session()
+    
+    async def test_shared_session_connection_pool(self):
+        """Test the shared session's connection pool limits"""
+        session = await get_shared_session()
+        try:
+            assert session.connector.limit == 100
+            assert session.connector.limit_per_host == 32
+            assert session.json_serialize({"status": "Ready"}) == '{"status":"Ready"}'
+        finally:
+            await close_shared_session()
+
+
+def test_services_import_lazily():
+    """Test that importing UserService does not load Pillow or aiohttp"""
+    code = (
+        "import sys\n"
+        "from src.services import UserService\n"
+        "assert 'PIL' not in sys.modules and 'aiohttp' not in sys.modules\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True, env=os.environ.copy())
 
 
 class TestImageProcessor:
@@ -103,8 +211,7 @@ class TestImageProcessor:
     
     def test_validate_image_valid(self, sample_image_bytes):
         """Test validating a valid image"""
-        with patch('magic.from_buffer', return_value='image/jpeg'), \
-             patch('PIL.Image.open') as mock_open:
+        with patch('PIL.Image.open') as mock_open:
             
             # Mock PIL Image
             mock_image = MagicMock()
@@ -119,15 +226,56 @@ class TestImageProcessor:
             assert result["format"] == "JPEG"
             assert result["size"] == (1024, 1024)
     
-    def test_validate_image_too_large(self):
+    def test_validate_image_too_large(self, oversized_image_bytes):
         """Test validating an image that's too large"""
-        large_image = b"x" * (25 * 1024 * 1024)  # 25MB
-        
         with pytest.raises(Exception) as exc_info:
-            ImageProcessor.validate_image(large_image)
+            ImageProcessor.validate_image(oversized_image_bytes)
         
         assert "too large" in str(exc_info.value).lower()
     
+    @pytest.mark.parametrize("image_format, save_kwargs", [
+        ("JPEG", {}),
+        ("JPEG", {"progressive": True}),
+        ("PNG", {}),
+        ("WEBP", {}),
+        ("WEBP", {"lossless": True}),
+    ])
+    def test_validate_image_fast(self, image_format, save_kwargs):
+        """Test reading format and size from the image header"""
+        output = io.BytesIO()
+        Image.new("RGB", (640, 480)).save(output, format=image_format, **save_kwargs)
+        
+        with patch.object(ImageProcessor, 'validate_image') as mock_validate:
+            result = ImageProcessor.validate_image_fast(output.getvalue())
+        
+        mock_validate.assert_not_called()
+        assert result["valid"] is True
+        assert result["format"] == image_format
+        assert result["size"] == (640, 480)
+        assert result["pixel_count"] == 640 * 480
+    
+    def test_quick_dims(self):
+        """Test reading dimensions from header bytes"""
+        output = io.BytesIO()
+        Image.new("RGB", (300, 200)).save(output, format="PNG")
+        
+        assert ImageProcessor.quick_dims(output.getvalue()) == ("PNG", 300, 200)
+        assert ImageProcessor.quick_dims(b"not an image") is None
+        
+        # Signature and IHDR tag present, but cut off before the dimensions
+        assert ImageProcessor.quick_dims(output.getvalue()[:20]) is None
+    
+    def test_validate_image_fast_falls_back_on_mime_mismatch(self):
+        """Test that a header not matching the declared MIME type gets a full validation"""
+        output = io.BytesIO()
+        Image.new("RGB", (64, 64)).save(output, format="PNG")
+        
+        with patch.object(ImageProcessor, 'validate_image', return_value={"valid": True}) as mock_validate:
+            result = ImageProcessor.validate_image_fast(output.getvalue(), "image/jpeg")
+        
+        mock_validate.assert_called_once()
+        assert result == {"valid": True}
+    
     def test_get_image_info(self, sample_image_bytes):
         """Test getting image information"""
         with patch('PIL.Image.open') as mock_open:
@@ -145,6 +293,19 @@ class TestImageProcessor:
             assert info["height"] == 1024
             assert info["pixel_count"] == 1048576
     
+    def test_get_image_info_from_opened_image(self):
+        """Test reading info from an already-opened image"""
+        image = Image.new("LA", (300, 200))
+        
+        with patch('src.services.image_processor.Image.open') as mock_open:
+            info = ImageProcessor.get_image_info(image, file_size=2048)
+        
+        mock_open.assert_not_called()
+        assert info["size"] == (300, 200)
+        assert info["has_transparency"] is True
+        assert info["aspect_ratio"] == 1.5
+        assert info["file_size_bytes"] == 2048
+    
     def test_optimize_image(self, sample_image_bytes):
         """Test optimizing an image"""
         with patch('PIL.Image.open') as mock_open, \
@@ -166,60 +327,185 @@ class TestImageProcessor:
             
             assert result == b"optimized_image_data"
 
+    
+    def test_optimize_image_keeps_fitting_jpeg_size(self):
+        """Test that a JPEG that fits at full resolution is not drafted or resized"""
+        buffer = io.BytesIO()
+        Image.new("RGB", (2000, 2000), (120, 60, 30)).save(buffer, format="JPEG")
+        
+        result = ImageProcessor.optimize_image(buffer.getvalue(), max_size_mb=0.1)
+        
+        assert Image.open(io.BytesIO(result)).size == (2000, 2000)
+    
+    def test_optimize_image_drafts_large_jpeg(self):
+        """Test that a JPEG that can't fit at full resolution is decoded at reduced scale"""
+        buffer = io.BytesIO()
+        Image.effect_noise((2000, 2000), 100).convert("RGB").save(buffer, format="JPEG")
+        max_size_mb = 0.05
+        
+        with patch.object(JpegImagePlugin.JpegImageFile, "draft", autospec=True,
+                          side_effect=JpegImagePlugin.JpegImageFile.draft) as mock_draft:
+            result = ImageProcessor.optimize_image(buffer.getvalue(), max_size_mb=max_size_mb)
+        
+        mock_draft.assert_called_once()
+        assert len(result) <= max_size_mb * 1024 * 1024
+        assert max(Image.open(io.BytesIO(result)).size) < 2000
+    
+    @pytest.mark.parametrize("wrap", [bytearray, memoryview])
+    def test_image_buffers_read_in_place(self, wrap):
+        """Test that bytearray and memoryview inputs are decoded without a bytes copy"""
+        buffer = io.BytesIO()
+        Image.new("RGB", (64, 48), (10, 20, 30)).save(buffer, format="PNG")
+        image_data = wrap(buffer.getvalue())
+        
+        with patch('src.services.image_processor.io.BytesIO', side_effect=AssertionError):
+            info = ImageProcessor.validate_image(image_data)
+        converted = ImageProcessor.convert_format(image_data, "PNG")
+        
+        assert info["size"] == (64, 48)
+        assert Image.open(io.BytesIO(converted)).size == (64, 48)
+    
+    def test_save_temp_image_falls_back_to_disk(self, tmp_path):
+        """Test that a full memory temp dir falls back to the regular temp dir"""
+        with patch('src.services.image_processor.MEMORY_TEMP_DIR', str(tmp_path / "missing")):
+            path = ImageProcessor.save_temp_image(b"image-bytes", suffix=".png")
+        
+        try:
+            assert path.endswith(".png")
+            with open(path, "rb") as temp_file:
+                assert temp_file.read() == b"image-bytes"
+        finally:
+            ImageProcessor.cleanup_temp_file(path)
+        assert not os.path.exists(path)
+    
+    def test_convert_format_same_format_is_noop(self):
+        """Test that converting to the image's own format returns it untouched"""
+        buffer = io.BytesIO()
+        Image.new("RGB", (32, 32), (200, 100, 50)).save(buffer, format="PNG")
+        image_data = buffer.getvalue()
+        
+        with patch.object(Image.Image, 'save') as mock_save:
+            result = ImageProcessor.convert_format(image_data, "png")
+        
+        assert result is image_data
+        mock_save.assert_not_called()
+    
+    def test_optimize_image_accepts_opened_image(self):
+        """Test optimizing an already-opened image without reopening it"""
+        buffer = io.BytesIO()
+        Image.new("RGB", (64, 48), (10, 20, 30)).save(buffer, format="JPEG")
+        image = Image.open(buffer)
+        
+        with patch('src.services.image_processor.Image.open') as mock_open:
+            result = ImageProcessor.optimize_image(image)
+        
+        mock_open.assert_not_called()
+        assert Image.open(io.BytesIO(result)).size == image.size
+    
+    def test_optimize_image_quality_search(self):
+        """Test that quality is binary-searched with a bounded number of encodes"""
+        buffer = io.BytesIO()
+        Image.effect_noise((300, 300), 64).convert("RGB").save(buffer, format="PNG")
+        max_size_mb = 40_000 / (1024 * 1024)
+        
+        save = Image.Image.save
+        with patch.object(Image.Image, 'save', autospec=True, side_effect=save) as mock_save:
+            result = ImageProcessor.optimize_image(buffer.getvalue(), max_size_mb=max_size_mb)
+        
+        assert len(result) <= 40_000
+        assert mock_save.call_count <= 6
+        
+        # Only the first and the accepted encode pay for optimized Huffman tables
+        optimized = [call for call in mock_save.call_args_list if call.kwargs["optimize"]]
+        assert len(optimized) == 2
+        assert optimized[-1].kwargs["progressive"] is True
+    
+    def test_resize_and_optimize_fits_budget(self):
+        """Test that resizing finds a size under the byte budget"""
+        image = Image.effect_noise((400, 400), 64).convert("RGB")
+        
+        resize = Image.Image.resize
+        with patch.object(Image.Image, 'resize', autospec=True, side_effect=resize) as mock_resize:
+            result = ImageProcessor._resize_and_optimize(image, 20_000, "JPEG")
+        
+        assert len(result) <= 20_000
+        assert Image.open(io.BytesIO(result)).size[0] < 400
+        # The scale is estimated from each attempt's size, not stepped down by 0.1
+        assert mock_resize.call_count <= 4
 
 class TestUserService:
     """Test user service"""
     
-    @pytest.mark.asyncio
+    @pytest.fixture(autouse=True)
+    def _patched_db(self, mock_db, monkeypatch):
+        """Point the user service at the mocked database"""
+        monkeypatch.setattr(user_service, "db", mock_db)
+    
     async def test_get_or_create_user_new(self, mock_db):
         """Test getting or creating a new user"""
-        mock_db.get_user.return_value = None
-        mock_db.create_user.return_value = True
+        new_user = User(telegram_user_id=123456789, username="test_user", first_name="Test", last_name="User")
+        mock_db.touch_user.return_value = (new_user, True)
         
-        with patch('src.services.user_service.db', mock_db):
-            user, is_new = await UserService.get_or_create_user(
-                telegram_user_id=123456789,
-                username="test_user",
-                first_name="Test",
-                last_name="User"
-            )
-            
-            assert is_new is True
-            assert user.telegram_user_id == 123456789
-            assert user.username == "test_user"
+        user, is_new = await UserService.get_or_create_user(
+            telegram_user_id=123456789,
+            username="test_user",
+            first_name="Test",
+            last_name="User"
+        )
+        
+        assert is_new is True
+        assert user.telegram_user_id == 123456789
+        assert user.username == "test_user"
+        mock_db.increment_analytics.assert_called_once()
     
-    @pytest.mark.asyncio
     async def test_get_or_create_user_existing(self, mock_db, mock_user):
         """Test getting an existing user"""
-        mock_db.get_user.return_value = mock_user
+        mock_db.touch_user.return_value = (mock_user, False)
         
-        with patch('src.services.user_service.db', mock_db):
-            user, is_new = await UserService.get_or_create_user(
-                telegram_user_id=123456789
-            )
-            
-            assert is_new is False
-            assert user.telegram_user_id == 123456789
+        user, is_new = await UserService.get_or_create_user(
+            telegram_user_id=123456789
+        )
+        
+        assert is_new is False
+        assert user.telegram_user_id == 123456789
     
-    @pytest.mark.asyncio
-    async def test_update_user_stats(self, mock_db, mock_user):
+    async def test_update_user_stats(self, mock_db):
         """Test updating user statistics"""
-        mock_db.get_user.return_value = mock_user
-        mock_db.update_user.return_value = True
+        mock_db.increment_user_stats.return_value = True
         
-        with patch('src.services.user_service.db', mock_db):
-            result = await UserService.update_user_stats(
-                telegram_user_id=123456789,
-                edit_success=True,
-                edit_type="color_change",
-                processing_time=30.5
-            )
-            
-            assert result is True
-            assert mock_user.stats.total_edits == 1
-            assert mock_user.stats.successful_edits == 1
+        result = await UserService.update_user_stats(
+            telegram_user_id=123456789,
+            edit_success=True,
+            edit_type="color_change",
+            processing_time=30.5
+        )
+        
+        assert result is True
+        mock_db.increment_user_stats.assert_called_once_with(
+            123456789, edit_success=True, edit_type="color_change"
+        )
+        mock_db.increment_analytics.assert_called_once_with(
+            new_user=False,
+            edit_success=True,
+            processing_time=30.5,
+            edit_type="color_change",
+            aspect_ratio=None,
+            output_format=None
+        )
+    
+    async def test_update_user_stats_missing_user(self, mock_db):
+        """Test that stats for an unknown user don't touch global analytics"""
+        mock_db.increment_user_stats.return_value = False
+        
+        result = await UserService.update_user_stats(
+            telegram_user_id=999999999,
+            edit_success=True,
+            edit_type="color_change"
+        )
+        
+        assert result is False
+        mock_db.increment_analytics.assert_not_called()
     
-    @pytest.mark.asyncio
     async def test_get_user_statistics(self, mock_db):
         """Test getting user statistics"""
         mock_stats = {
@@ -233,48 +519,53 @@ class TestUserService:
             "last_seen": "2024-01-15"
         }
         mock_db.get_user_stats.return_value = mock_stats
-        mock_db.get_user_edits.return_value = []
         
-        with patch('src.services.user_service.db', mock_db):
-            stats = await UserService.get_user_statistics(123456789)
-            
-            assert stats["total_edits"] == 10
-            assert stats["success_rate"] == 80.0
-            assert "recent_edits" in stats
+        stats = await UserService.get_user_statistics(123456789)
+        
+        assert stats["total_edits"] == 10
+        assert stats["success_rate"] == 80.0
+        assert "recent_edits" in stats
     
-    @pytest.mark.asyncio
-    async def test_is_user_admin(self):
+    def test_is_user_admin(self):
         """Test checking if user is admin"""
-        with patch('src.config.settings') as mock_settings:
-            mock_settings.admin_user_ids = [123456789, 987654321]
+        with patch('src.services.user_service.settings') as mock_settings:
+            mock_settings.admin_user_ids = frozenset((123456789, 987654321))
             
-            assert await UserService.is_user_admin(123456789) is True
-            assert await UserService.is_user_admin(111111111) is False
+            assert UserService.is_user_admin(123456789) is True
+            assert UserService.is_user_admin(111111111) is False
     
-    @pytest.mark.asyncio
-    async def test_ban_user(self, mock_db, mock_user):
+    async def test_ban_user(self, mock_db):
         """Test banning a user"""
-        mock_db.get_user.return_value = mock_user
-        mock_db.update_user.return_value = True
-        
-        with patch('src.services.user_service.UserService.is_user_admin', return_value=True), \
-             patch('src.services.user_service.db', mock_db):
-            
+        with patch('src.services.user_service.UserService.is_user_admin', return_value=True):
             result = await UserService.ban_user(
                 telegram_user_id=123456789,
                 admin_id=987654321
             )
             
             assert result is True
-            assert mock_user.is_banned is True
-            assert mock_user.is_active is False
+            mock_db.update_user_fields.assert_called_once_with(
+                123456789, {"is_banned": True, "is_active": False}
+            )
+            mock_db.update_user.assert_not_called()
+    
+    async def test_unban_user_missing(self, mock_db):
+        """Test unbanning a user that doesn't exist"""
+        mock_db.update_user_fields.return_value = False
+        
+        with patch('src.services.user_service.UserService.is_user_admin', return_value=True):
+            result = await UserService.unban_user(
+                telegram_user_id=123456789,
+                admin_id=987654321
+            )
+            
+            assert result is False
+            mock_db.update_user_fields.assert_called_once_with(
+                123456789, {"is_banned": False, "is_active": True}
+            )
     
-    @pytest.mark.asyncio
     async def test_ban_user_non_admin(self, mock_db):
         """Test banning a user by non-admin"""
-        with patch('src.services.user_service.UserService.is_user_admin', return_value=False), \
-             patch('src.services.user_service.db', mock_db):
-            
+        with patch('src.services.user_service.UserService.is_user_admin', return_value=False):
             result = await UserService.ban_user(
                 telegram_user_id=123456789,
                 admin_id=111111111
@@ -0,0 +1,61 @@
+"""
+Tests for the web interface
+"""
+
+import pytest
+from unittest.mock import AsyncMock
+from fastapi.testclient import TestClient
+
+from src.web import app as web_app
+
+
+class TestStatsEndpoint:
+    """Test the /stats endpoint"""
+    
+    @pytest.fixture
+    def get_bot_analytics(self, monkeypatch):
+        """Stub analytics with an empty response cache"""
+        get_bot_analytics = AsyncMock(return_value={"total_users": 10, "total_edits": 25})
+        monkeypatch.setattr(web_app.UserService, "get_bot_analytics", get_bot_analytics)
+        web_app._analytics_cache.clear()
+        yield get_bot_analytics
+        web_app._analytics_cache.clear()
+    
+    @pytest.fixture
+    def client(self):
+        """Client for the app, without running its startup hooks"""
+        return TestClient(web_app.app)
+    
+    def test_stats_cached(self, get_bot_analytics, client):
+        """Test that requests within the TTL share one analytics read"""
+        first = client.get("/stats")
+        second = client.get("/stats")
+        
+        assert first.status_code == 200
+        assert second.status_code == 200
+        assert first.json()["statistics"] == {"total_users": 10, "total_edits": 25}
+        assert first.headers["etag"] == second.headers["etag"]
+        assert first.headers["etag"].startswith('W/"')
+        get_bot_analytics.assert_awaited_once()
+    
+    def test_stats_not_modified(self, get_bot_analytics, client):
+        """Test that a matching If-None-Match gets a 304 with no body"""
+        etag = client.get("/stats").headers["etag"]
+        
+        response = client.get("/stats", headers={"If-None-Match": etag})
+        
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+    
+    def test_stats_modified(self, get_bot_analytics, client):
+        """Test that changed analytics are served in full under a new ETag"""
+        etag = client.get("/stats").headers["etag"]
+        web_app._analytics_cache.clear()
+        get_bot_analytics.return_value = {"total_users": 11, "total_edits": 25}
+        
+        response = client.get("/stats", headers={"If-None-Match": etag})
+        
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+        assert response.json()["statistics"]["total_users"] == 11